@@ -0,0 +1,210 @@
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# 1回の read/write の単位。8KB だとモデル (数百MB) で書き込み回数が多すぎる
+CHUNK_SIZE = 1 << 20
+RETRIES = 3
+TIMEOUT_SEC = 30
+# Hugging Face の LFS ファイルは X-Linked-Etag に中身の sha256 が入っている
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def _record_path(dest_path):
+    """ダウンロードが完了・検証済みであることの記録 (URL, サイズ, sha256)"""
+    return dest_path + ".download.json"
+
+
+def _part_path(dest_path):
+    return dest_path + ".part"
+
+
+def _etag_sha256(response):
+    """サーバーが示す中身の sha256。
+
+    Hugging Face は X-Linked-Etag をリダイレクト (302) の応答にだけ付け、転送先の CDN は付けないので、
+    リダイレクトの途中の応答も含めて探す。
+    """
+    for hop in (*response.history, response):
+        for name in ("X-Linked-Etag", "ETag"):
+            value = hop.headers.get(name, "").removeprefix("W/").strip('"')
+            if _SHA256_RE.match(value):
+                return value
+    return None
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _is_complete(url, dest_path, sha256, session):
+    """既存ファイルが完全なものかどうか。
+
+    このモジュールで落としたファイルは完了記録とサイズを比べるだけで、通信しない。
+    記録の無い古いファイル (以前の実装で途中まで書かれたものかもしれない) は
+    HEAD のサイズと sha256 で確かめる。サーバーに届かなければ (オフラインなど) そのまま使い、
+    記録は書かずに次回つながったときに確かめる。
+    """
+    size = os.path.getsize(dest_path)
+    record = _load_json(_record_path(dest_path))
+    if record and record.get("size") == size and (sha256 is None or record.get("sha256") == sha256):
+        return True
+
+    try:
+        response = session.head(url, allow_redirects=True, timeout=TIMEOUT_SEC)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.warning(f"Could not verify {dest_path} ({e}); using it unverified")
+        return True
+    # Content-Length が無ければ -1 (サイズでは判断できない)
+    total = int(response.headers.get("Content-Length", -1))
+    expected = sha256 or _etag_sha256(response)
+    if size == total or (total < 0 and expected):
+        if expected is None or file_sha256(dest_path) == expected:
+            _write_json(_record_path(dest_path), {"url": url, "size": size, "sha256": expected})
+            return True
+    if size < total or total < 0:
+        # 途中で切れたものとみなして続きから落とす (最後に全体の sha256 で確かめる)
+        logger.warning(f"{dest_path} is {size} of {total if total >= 0 else 'unknown'} bytes; resuming the download")
+        os.replace(dest_path, _part_path(dest_path))
+    else:
+        logger.warning(f"{dest_path} does not match the remote file; downloading again")
+        os.remove(dest_path)
+    return False
+
+
+def _fetch(url, part_path, session):
+    """part_path の続きから url を落とす。(全体のサイズ, サーバーが示した sha256) を返す"""
+    meta_path = part_path + ".json"
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    meta = _load_json(meta_path) or {}
+    headers = {}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+        # 途中でサーバー側のファイルが変わっていたら、206 ではなく全体 (200) が返ってくる
+        if meta.get("etag"):
+            headers["If-Range"] = meta["etag"]
+
+    with session.get(url, headers=headers, stream=True, allow_redirects=True, timeout=TIMEOUT_SEC) as response:
+        if response.status_code == 416:
+            # 前回すでに最後まで落としていた。サーバー側のほうが短ければサイズの確認で止める
+            total = response.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+            return int(total) if total.isdigit() else offset, meta.get("sha256") or _etag_sha256(response)
+        response.raise_for_status()
+        if response.status_code == 206:
+            total = int(response.headers["Content-Range"].rsplit("/", 1)[1])
+            mode = "ab"
+            # 以前の実装が残した書きかけから再開する場合は、前回の記録が無い
+            meta["sha256"] = meta.get("sha256") or _etag_sha256(response)
+            logger.info(f"Resuming {url} from {offset} / {total} bytes")
+        else:
+            total = int(response.headers.get("Content-Length", -1))
+            mode = "wb"
+            offset = 0
+            meta = {"etag": response.headers.get("ETag"), "sha256": _etag_sha256(response)}
+            _write_json(meta_path, meta)
+
+        with open(part_path, mode, buffering=CHUNK_SIZE) as f:
+            for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+    return total, meta.get("sha256")
+
+
+def _fetch_with_retries(url, part_path, sha256, session, retries):
+    """接続が切れたら続きから取り直す。(サイズ, 実際の sha256, 期待する sha256) を返す"""
+    for attempt in range(1, retries + 1):
+        try:
+            total, remote_sha256 = _fetch(url, part_path, session)
+            break
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == retries:
+                raise
+            logger.warning(f"Download of {url} interrupted ({e}); retrying ({attempt}/{retries - 1})")
+            time.sleep(attempt)
+
+    size = os.path.getsize(part_path)
+    if total >= 0 and size != total:
+        if size > total:
+            # サーバー側のファイルより長い書きかけは続きから再開できないので消しておく
+            os.remove(part_path)
+        raise IOError(f"Incomplete download of {url}: {size} of {total} bytes")
+    return size, file_sha256(part_path), sha256 or remote_sha256
+
+
+def download(url, dest_path, sha256=None, session=None, retries=RETRIES):
+    """url を dest_path に落とす。
+
+    .part に書いて検証してから rename するので、dest_path にあるファイルは常に完全なもの。
+    接続が切れたら Range で続きから再開する。sha256 を省略した場合は、
+    サーバーが返す sha256 (Hugging Face の X-Linked-Etag) があればそれで検証する。
+    """
+    session = session or requests.Session()
+    if os.path.exists(dest_path) and _is_complete(url, dest_path, sha256, session):
+        logger.info(f"File already exists: {dest_path}")
+        return dest_path
+
+    part_path = _part_path(dest_path)
+    logger.info(f"Downloading {url} to {dest_path}...")
+    start = time.time()
+    resumed = os.path.exists(part_path)
+    while True:
+        size, actual, expected = _fetch_with_retries(url, part_path, sha256, session, retries)
+        if expected is None or actual == expected:
+            break
+        # 壊れた .part から再開し続けないよう消しておく
+        os.remove(part_path)
+        if not resumed:
+            raise IOError(f"Checksum mismatch for {url}: expected {expected}, got {actual}")
+        # 前回の残り (以前の実装の書きかけなど) が原因かもしれないので、一度だけ最初から落とし直す
+        logger.warning(f"Checksum mismatch for resumed download of {url}; starting over")
+        resumed = False
+
+    os.replace(part_path, dest_path)
+    _write_json(_record_path(dest_path), {"url": url, "size": size, "sha256": actual})
+    if os.path.exists(part_path + ".json"):
+        os.remove(part_path + ".json")
+    elapsed = time.time() - start
+    logger.info(f"Downloaded {dest_path}: {size / 1e6:.1f} MB in {elapsed:.1f}s")
+    return dest_path
+
+
+def download_all(items, max_workers=4):
+    """[(url, dest_path, sha256), ...] を並行に落とす。Session はスレッドをまたいで使えないのでスレッドごとに持つ"""
+    local = threading.local()
+
+    def fetch(url, dest_path, sha256):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        return download(url, dest_path, sha256, local.session)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(fetch, url, dest_path, sha256) for url, dest_path, sha256 in items]
+        return [future.result() for future in futures]
@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import platform
+import numpy as np
+
+try:
+    import rvc_python
+    from rvc_python.configs.config import Config
+    from rvc_python.modules.vc import pipeline as rvc_pipeline
+    from rvc_python.modules.vc.pipeline import Pipeline
+except ImportError:
+    Pipeline = None
+
+logger = logging.getLogger(__name__)
+
+# Pipeline.get_f0 と同じ F0 の範囲 (粗い F0 への量子化に使う)
+F0_MIN = 50
+F0_MAX = 1100
+# 自動選択の合格ライン: 基準 (crepe) との有声/無声の一致率と、50 セント以上ずれたフレームの割合
+MIN_VOICING_AGREEMENT = 0.9
+MAX_GROSS_ERROR_RATE = 0.1
+GROSS_ERROR_CENTS = 50
+# F0 推定が失敗したときに推定し直す窓の長さと、窓の前後に付ける余白 (窓の端で F0 が崩れないように)
+FALLBACK_WINDOW_SEC = 5.0
+FALLBACK_MARGIN_SEC = 0.5
+
+# name -> extract(pipeline, x, p_len, filter_radius)。ピッチシフト前の F0 (Hz, 無声は 0) を返す
+ENGINES = {}
+
+
+def register(name):
+    """F0 エンジンを追加するデコレータ"""
+    def decorator(func):
+        ENGINES[name] = func
+        return func
+    return decorator
+
+
+def _pipeline_engine(method):
+    def extract(pipeline, x, p_len, filter_radius):
+        # harvest は input_audio_path を lru_cache のキーにするので、同じパスで中身が違う音声
+        # (常駐ワーカーで毎回上書きされる vocals.wav など) に古い F0 を返さないよう内容のハッシュを渡す
+        key = hashlib.sha1(np.ascontiguousarray(x)).hexdigest()
+        try:
+            # インスタンスの get_f0 は RVCEngine が差し替えているので、クラス側の元の実装を呼ぶ
+            _, f0 = Pipeline.get_f0(pipeline, key, x, p_len, 0, method, filter_radius)
+        finally:
+            rvc_pipeline.input_audio_path2wav.pop(key, None)
+        return f0
+    return extract
+
+
+for _method in ("crepe", "rmvpe", "harvest", "pm"):
+    ENGINES[_method] = _pipeline_engine(_method)
+
+
+@register("crepe-tiny")
+def crepe_tiny(pipeline, x, p_len, filter_radius):
+    """crepe の tiny モデル。full より桁違いに軽く、CPU でも実時間より十分速い"""
+    import torch
+    import torchcrepe
+    audio = torch.tensor(np.copy(x))[None].float()
+    f0, pd = torchcrepe.predict(
+        audio,
+        pipeline.sr,
+        pipeline.window,
+        F0_MIN,
+        F0_MAX,
+        "tiny",
+        batch_size=512,
+        device=pipeline.device,
+        return_periodicity=True,
+    )
+    pd = torchcrepe.filter.median(pd, 3)
+    f0 = torchcrepe.filter.mean(f0, 3)
+    f0[pd < 0.1] = 0
+    return f0[0].cpu().numpy()
+
+
+def f0_to_coarse(f0):
+    """Pipeline.get_f0 の後半と同じ手順で、F0 (Hz) を 1〜255 のメル尺度の整数に量子化する"""
+    f0_mel_min = 1127 * np.log(1 + F0_MIN / 700)
+    f0_mel_max = 1127 * np.log(1 + F0_MAX / 700)
+    f0_mel = 1127 * np.log(1 + f0 / 700)
+    f0_mel[f0_mel > 0] = (f0_mel[f0_mel > 0] - f0_mel_min) * 254 / (f0_mel_max - f0_mel_min) + 1
+    f0_mel[f0_mel <= 1] = 1
+    f0_mel[f0_mel > 255] = 255
+    return np.rint(f0_mel).astype(np.int32), f0
+
+
+class F0Cache:
+    """ピッチシフト前の F0 をディスクに保存する。
+
+    F0 は入力音声と推定方式だけで決まり、pitch_shift / protect / index_rate には依存しない。
+    キーは Pipeline に渡される (フィルタ・パディング済みの) 音声のハッシュなので、
+    チャンク単位の変換でもチャンクごとに再利用できる。
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def path(self, audio, p_len, f0_method, filter_radius):
+        h = hashlib.sha256(np.ascontiguousarray(audio))
+        # harvest だけは filter_radius でメディアンフィルタの有無が変わる
+        radius = filter_radius if f0_method == "harvest" else 0
+        h.update(f"{audio.dtype}:{len(audio)}:{p_len}:{f0_method}:{radius}".encode())
+        return os.path.join(self.cache_dir, f"{f0_method}-{h.hexdigest()[:24]}.npy")
+
+    def load(self, path):
+        try:
+            f0 = np.load(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return f0
+
+    def save(self, path, f0):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npy"
+        np.save(tmp_path, f0)
+        os.replace(tmp_path, path)
+
+
+class F0Extractor:
+    """engines の先頭で F0 を推定し、例外や NaN が出たら固定長の窓ごとに engines の順で推定し直す。
+
+    Pipeline は無音で区切る前の音声全体で get_f0 を 1 回だけ呼ぶので、窓に分けないと
+    一部の区間の失敗で全体がフォールバックのエンジンになる。窓に分けることで、
+    チャンク変換 (RVC_CHUNK_SEC) の有無によらず、作り直すのは失敗した窓の F0 だけで済む。
+    """
+
+    def __init__(self, pipeline, engines, cache=None, window_sec=FALLBACK_WINDOW_SEC, margin_sec=FALLBACK_MARGIN_SEC):
+        unknown = [name for name in engines if name not in ENGINES]
+        if unknown:
+            raise ValueError(f"Unknown F0 engine(s): {unknown} (available: {sorted(ENGINES)})")
+        self.pipeline = pipeline
+        # 重複を除いて順序を保つ
+        self.engines = list(dict.fromkeys(engines))
+        self.cache = cache
+        # 窓と、その前後に付けて推定する余白 (F0 のフレーム数)
+        self.window = max(1, int(window_sec * pipeline.sr) // pipeline.window)
+        self.margin = int(margin_sec * pipeline.sr) // pipeline.window
+        self.fallbacks = 0
+
+    def _extract(self, name, x, p_len, filter_radius):
+        path = self.cache.path(x, p_len, name, filter_radius) if self.cache else None
+        f0 = self.cache.load(path) if path else None
+        if f0 is not None:
+            return f0
+        f0 = ENGINES[name](self.pipeline, x, p_len, filter_radius)
+        if not np.isfinite(f0).all():
+            raise ValueError("non-finite F0")
+        if path:
+            self.cache.save(path, f0)
+        return f0
+
+    def __call__(self, x, p_len, filter_radius):
+        try:
+            return self._extract(self.engines[0], x, p_len, filter_radius)
+        except Exception as e:
+            if len(self.engines) == 1:
+                raise
+            logger.warning(
+                f"F0 engine '{self.engines[0]}' failed on {len(x) / self.pipeline.sr:.1f}s of audio ({e}); "
+                f"retrying in {self.window * self.pipeline.window / self.pipeline.sr:.0f}s windows"
+            )
+
+        hop = self.pipeline.window
+        # 窓が 1 つしかなければ先頭のエンジンは同じ入力で失敗したばかり
+        first = 1 if p_len <= self.window else 0
+        f0 = np.zeros(p_len, dtype=np.float64)
+        for start in range(0, p_len, self.window):
+            end = min(start + self.window, p_len)
+            lo, hi = max(0, start - self.margin), min(len(x) // hop, end + self.margin)
+            part = self._extract_window(x[lo * hop:hi * hop], hi - lo, filter_radius, first)
+            part = part[start - lo:end - lo]
+            if len(part) < end - start:
+                part = np.pad(part, (0, end - start - len(part)), mode="edge" if len(part) else "constant")
+            f0[start:end] = part
+        return f0
+
+    def _extract_window(self, x, p_len, filter_radius, first):
+        for i, name in enumerate(self.engines[first:], first):
+            try:
+                f0 = self._extract(name, x, p_len, filter_radius)
+            except Exception as e:
+                remaining = self.engines[i + 1:]
+                if not remaining:
+                    raise
+                logger.warning(f"F0 engine '{name}' failed on a {len(x) / self.pipeline.sr:.1f}s window ({e}); falling back to '{remaining[0]}'")
+                continue
+            if i > 0:
+                self.fallbacks += 1
+            return f0
+
+
+def make_pipeline():
+    """声モデルを読み込まずに、F0 推定だけに使う Pipeline を作る"""
+    if Pipeline is None:
+        raise ImportError("rvc-python is not installed.")
+    lib_dir = os.path.dirname(os.path.abspath(rvc_python.__file__))
+    return Pipeline(16000, Config(lib_dir, "cpu"), lib_dir=lib_dir)
+
+
+def _loudest_window(audio, length):
+    if len(audio) <= length:
+        return audio
+    energy = np.concatenate([[0.0], np.cumsum(np.square(audio, dtype=np.float64))])
+    start = int(np.argmax(energy[length:] - energy[:-length]))
+    return audio[start:start + length]
+
+
+def compare_f0(f0, reference):
+    """基準に対する有声/無声の一致率と、両方有声のフレームで GROSS_ERROR_CENTS 以上ずれた割合"""
+    n = min(len(f0), len(reference))
+    f0, reference = f0[:n], reference[:n]
+    voiced, ref_voiced = f0 > 0, reference > 0
+    both = voiced & ref_voiced
+    if both.any():
+        cents = 1200 * np.abs(np.log2(f0[both] / reference[both]))
+        gross = float(np.mean(cents > GROSS_ERROR_CENTS))
+    else:
+        gross = 1.0
+    return {"voicing_agreement": float(np.mean(voiced == ref_voiced)), "gross_error_rate": gross}
+
+
+def benchmark_engines(pipeline, audio, candidates, reference="crepe", sample_sec=10.0, filter_radius=3):
+    """16kHz の音声の一番大きい sample_sec 秒で各エンジンを計測し、結果を返す"""
+    from scipy import signal
+    sample = _loudest_window(audio, int(sample_sec * pipeline.sr))
+    # Pipeline.pipeline と同じ前処理 (ハイパス + 反射パディング)
+    x = signal.filtfilt(rvc_pipeline.bh, rvc_pipeline.ah, sample)
+    x = np.pad(x, (pipeline.t_pad, pipeline.t_pad), mode="reflect")
+    p_len = len(x) // pipeline.window
+
+    results = {}
+    f0s = {}
+    for name in dict.fromkeys([reference, *candidates]):
+        start = time.time()
+        try:
+            f0s[name] = ENGINES[name](pipeline, x, p_len, filter_radius)
+        except Exception as e:
+            results[name] = {"ok": False, "error": str(e)}
+            continue
+        results[name] = {"ok": True, "sec": time.time() - start, "rtf": (time.time() - start) / (len(sample) / pipeline.sr)}
+    if reference not in f0s:
+        raise RuntimeError(f"Reference F0 engine '{reference}' failed: {results[reference]['error']}")
+
+    for name, f0 in f0s.items():
+        quality = compare_f0(f0, f0s[reference])
+        results[name].update(quality)
+        results[name]["passed"] = (
+            quality["voicing_agreement"] >= MIN_VOICING_AGREEMENT
+            and quality["gross_error_rate"] <= MAX_GROSS_ERROR_RATE
+        )
+    return results
+
+
+def select_engine(audio, candidates=("crepe", "rmvpe", "crepe-tiny", "harvest", "pm"), reference="crepe", cache_path=None):
+    """基準と同等の品質を満たすエンジンのうち、このマシンで最速のものを返す。
+
+    結果は cache_path に保存し、同じマシン・同じ候補なら次回からは計測しない。
+    """
+    signature = {"host": platform.node(), "cpus": os.cpu_count(), "candidates": list(candidates), "reference": reference}
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            saved = json.load(f)
+        if saved.get("signature") == signature:
+            return saved["selected"]
+
+    results = benchmark_engines(make_pipeline(), audio, candidates, reference)
+    passed = [name for name, r in results.items() if r["ok"] and r["passed"] and name in candidates]
+    selected = min(passed, key=lambda name: results[name]["sec"]) if passed else reference
+    for name, r in results.items():
+        if r["ok"]:
+            logger.info(
+                f"F0 engine {name:>10}: {r['sec']:.2f}s (RTF {r['rtf']:.2f}), voicing {r['voicing_agreement']:.2f}, "
+                f"gross error {r['gross_error_rate']:.2f}{'' if r['passed'] else ' (below threshold)'}"
+            )
+        else:
+            logger.info(f"F0 engine {name:>10}: failed ({r['error']})")
+    logger.info(f"Selected F0 engine: {selected}")
+
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"signature": signature, "selected": selected, "results": results}, f, indent=2)
+        os.replace(tmp_path, cache_path)
+    return selected
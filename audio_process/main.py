@@ -1,22 +1,25 @@
 import os
 import sys
-import subprocess
-import requests
 import shutil
 import logging
+import threading
 import time
-import numpy as np
 from pydub import AudioSegment
 from scipy.io import wavfile
 
-# PyTorch 2.6+ のセーフガード（weights_only=True）による互換性問題を解決
-import torch
-try:
-    from fairseq.data.dictionary import Dictionary
-    if hasattr(torch.serialization, 'add_safe_globals'):
-        torch.serialization.add_safe_globals([Dictionary])
-except ImportError:
-    pass
+# build_cache / stage_graph は video_process と共通 (リポジトリ直下の pipeline_common)。
+# Docker イメージでは main.py と同じ /app にコピーされるので、この追加は使われない
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "pipeline_common"))
+
+# torch を読み込む推論エンジン (onnx_separation / f0_engines / rvc_engine / rvc_chunks / rvc_stream) は
+# 使うときに import する。worker や model_store から main を読むだけで torch を読み込まないように。
+# torch / fairseq の互換性設定は rvc_engine の import 時に行う
+import build_cache
+import downloads
+import model_store
+import rvc_index
+import stage_graph
+import wav_blocks
 
 # audio-separator と rvc-python は実行時に動的にチェック
 try:
@@ -33,6 +36,19 @@ except ImportError:
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+SEPARATION_MODEL = 'UVR-MDX-NET-Voc_FT.onnx'
+
+# デフォルトのRVCモデル ("pth_sha256" / "index_sha256" を足すとダウンロード後にその値で検証する。
+# 無ければ Hugging Face が返す sha256 で検証する)
+DEFAULT_RVC_MODEL = {
+    "name": "zundamon",
+    "pth_url": "https://huggingface.co/kuwacom/RVC-Models/resolve/main/zundamon-1/zundamon-1.pth",
+    "index_url": "https://huggingface.co/kuwacom/RVC-Models/resolve/main/zundamon-1/zundamon-1.index"
+}
+
+# 完成品のコピー先 (Docker でホストにマウントされる)
+FINAL_DEST = "/app/root_out/radio-calisthenics_converted.wav"
+
 class AudioProcessor:
     def __init__(self, base_dir):
         self.base_dir = os.path.abspath(base_dir)
@@ -44,20 +60,129 @@ class AudioProcessor:
         os.makedirs(self.output_dir, exist_ok=True)
         os.makedirs(self.models_dir, exist_ok=True)
 
-    def download_file(self, url, dest_path):
-        if os.path.exists(dest_path):
-            logger.info(f"File already exists: {dest_path}")
-            return
-        logger.info(f"Downloading {url} to {dest_path}...")
-        response = requests.get(url, stream=True)
-        response.raise_for_status()
-        with open(dest_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+        # RVC をチャンクに分けて変換する長さ (秒)。None ならファイル全体を1回で変換する
+        self.rvc_chunk_sec = None
+        self.rvc_overlap_sec = 1.0
+        self.rvc_workers = 1
+        # 正規化とミックスの実装。"numpy" はブロック単位で処理する wav_blocks、"pydub" は従来の実装
+        self.audio_engine = "numpy"
+        # ピッチシフト前の F0 を保存する場所。None ならキャッシュしない
+        self.f0_cache_dir = os.path.join(self.base_dir, "cache", "f0")
+        # F0 エンジン ("auto" ならこのマシンで最速かつ品質基準を満たすものを計測して選ぶ) と、
+        # 失敗した区間だけに使う代わりのエンジン
+        self.f0_method = "crepe"
+        self.f0_fallback = ("harvest",)
+        # RVC の推論モード。"int8" は量子化したモデルを声モデルの隣にキャッシュして使う (rvc_accel compare で差を確認できる)
+        self.rvc_accel = "eager"
+        # 読み取り専用でマウントする共有モデルストア (model_store.py populate で作る)。None なら models/ だけを使う
+        self.model_store_dir = None
+        # ボーカル分離の推論。"onnx" はスレッド数を調整したセッションで区間をまとめて推論する onnx_separation、
+        # "audio-separator" は audio-separator の実装のまま
+        self.separation_engine = "onnx"
+        # onnx_separation のスレッド数とバッチサイズ。None なら初回に計測して決め、cache/ に保存する
+        self.separation_threads = None
+        self.separation_batch_size = None
+        # フェーズの成果物のキャッシュ (build_cache.BuildCache)。None なら毎回すべて実行する
+        self.build_cache = None
+
+        # 読み込んだモデルはインスタンスが生きている間使い回す (常駐ワーカーで効く)
+        self._separator = None
+        self._rvc_pool = None
+        # 直近のジョブのモデル読み込み時間と各フェーズの処理時間
+        self.metrics = {"load_sec": {}, "phase_sec": {}}
+        # run_full_process はフェーズを別スレッドで並行に実行するので、metrics の更新はロックを取る
+        self._metrics_lock = threading.Lock()
+
+    def _record_load(self, name, seconds, report=None):
+        if seconds:
+            with self._metrics_lock:
+                self.metrics["load_sec"][name] = self.metrics["load_sec"].get(name, 0.0) + seconds
+                if report:
+                    self.metrics.setdefault("load_memory", {})[name] = report
+
+    def load_separator(self):
+        if self._separator is None:
+            if not Separator:
+                raise ImportError("audio-separator is not installed.")
+            # 共有ストアにあればそこから読む (ダウンロードも書き込みもしない)
+            model_dir = self.model_store_dir if model_store.store_path(self.model_store_dir, SEPARATION_MODEL) else self.models_dir
+            with model_store.measure(f"separation model {SEPARATION_MODEL}") as report:
+                separator = Separator(model_file_dir=model_dir, output_dir=self.output_dir)
+                separator.load_model(SEPARATION_MODEL)
+            if self.separation_engine == "onnx":
+                import onnx_separation
+                onnx_separation.install(
+                    separator,
+                    cache_path=os.path.join(self.base_dir, "cache", "separation_tuning.json"),
+                    intra_op_threads=self.separation_threads,
+                    batch_size=self.separation_batch_size,
+                )
+            self._separator = separator
+            self._record_load("separator", report["sec"], report)
+        return self._separator
+
+    def load_rvc(self, model_pth, index_file=None, **params):
+        """このプロセスで読み込んだ RVC モデルを (モデル, index) ごとに使い回す"""
+        import rvc_engine
+        engine, load_sec = rvc_engine.get_engine(model_pth, index_file, **params)
+        self._record_load("rvc", load_sec, engine.load_report if load_sec else None)
+        return engine
+
+    def rvc_pool(self, preload=()):
+        """チャンク変換用のプロセスプール。ワーカーがモデルを保持したままジョブをまたいで使い回す"""
+        if self._rvc_pool is None:
+            import rvc_chunks
+            start = time.time()
+            self._rvc_pool = rvc_chunks.open_pool(self.rvc_workers, preload)
+            self._record_load("rvc", time.time() - start if preload else 0.0)
+        return self._rvc_pool
+
+    def model_file(self, filename):
+        """共有ストアにあればそのパス、無ければこのコンテナの models/ のパス"""
+        return model_store.store_path(self.model_store_dir, filename) or os.path.join(self.models_dir, filename)
+
+    def model_paths(self, rvc_model_info):
+        model_pth = self.model_file(f"{rvc_model_info['name']}.pth")
+        model_index = self.model_file(f"{rvc_model_info['name']}.index")
+        return model_pth, model_index
+
+    def preload(self, rvc_model_infos=(DEFAULT_RVC_MODEL,)):
+        """分離モデルと RVC モデルを先に読み込んでおく (常駐ワーカーの起動時に呼ぶ)"""
+        self.load_separator()
+        engine_options = []
+        items = []
+        for info in rvc_model_infos:
+            model_pth, model_index = self.model_paths(info)
+            items.append((info['pth_url'], model_pth, info.get('pth_sha256')))
+            items.append((info['index_url'], model_index, info.get('index_sha256')))
+            engine_options.append(dict(model_pth=model_pth, index_file=model_index, accel=self.rvc_accel))
+        downloads.download_all(items)
+        if self.rvc_chunk_sec and self.rvc_workers > 1:
+            self.rvc_pool(engine_options)
+        else:
+            for options in engine_options:
+                self.load_rvc(**options)
+
+    def close(self):
+        if self._rvc_pool is not None:
+            self._rvc_pool.shutdown()
+            self._rvc_pool = None
+
+    def download_file(self, url, dest_path, sha256=None):
+        """途中で切れたら続きから落とし、サイズと sha256 を確かめてから dest_path に置く"""
+        if self.model_store_dir and os.path.dirname(os.path.abspath(dest_path)) == os.path.abspath(self.model_store_dir):
+            # 共有ストアは populate 済み・読み取り専用でマウントされる
+            return dest_path
+        return downloads.download(url, dest_path, sha256)
 
     def phase1_normalize(self, input_wav):
         logger.info("--- Phase 1: Normalization ---")
         output_wav = os.path.join(self.output_dir, "radio-calisthenics_norm.wav")
+        if self.audio_engine == "numpy":
+            wav_blocks.normalize_wav(input_wav, output_wav, rate=44100)
+            logger.info(f"Normalized audio saved to {output_wav}")
+            return output_wav
+
         audio = AudioSegment.from_wav(input_wav)
         # 44.1kHz / 16bit / ステレオ維持
         audio = audio.set_frame_rate(44100).set_sample_width(2)
@@ -67,12 +192,7 @@ class AudioProcessor:
 
     def phase2_separate(self, input_wav):
         logger.info("--- Phase 2: Vocal Separation ---")
-        if not Separator:
-            raise ImportError("audio-separator is not installed.")
-
-        separator = Separator(model_file_dir=self.models_dir, output_dir=self.output_dir)
-        separator.load_model('UVR-MDX-NET-Voc_FT.onnx')
-
+        separator = self.load_separator()
         output_files = separator.separate(input_wav)
 
         vocals_path = os.path.join(self.output_dir, "vocals.wav")
@@ -89,25 +209,61 @@ class AudioProcessor:
         logger.info(f"Instrumental saved to {inst_path}")
         return vocals_path, inst_path
 
-    def phase3_rvc_inference(self, vocals_wav, model_pth, index_file=None, f0_method="crepe", protect=0.33, pitch_shift=0):
+    def resolve_f0_method(self, vocals_wav):
+        if self.f0_method != "auto":
+            return self.f0_method
+        import f0_engines
+        import rvc_engine
+        selection_path = os.path.join(self.base_dir, "cache", "f0_engine.json")
+        return f0_engines.select_engine(rvc_engine.load_vocals(vocals_wav), cache_path=selection_path)
+
+    def phase3_rvc_inference(self, vocals_wav, model_pth, index_file=None, f0_method=None, protect=0.33, pitch_shift=0):
+        f0_method = f0_method or self.resolve_f0_method(vocals_wav)
         logger.info(f"--- Phase 3: RVC Inference (Method: {f0_method}, Protect: {protect}, Shift: {pitch_shift}) ---")
         if not RVCInference:
             raise ImportError("rvc-python is not installed.")
 
         output_wav = os.path.join(self.output_dir, "converted_vocals.wav")
 
-        # モデル読み込み時の weights_only 問題を解決するための環境変数設定 (念のため)
-        os.environ["TORCH_LOAD_WEIGHTS_ONLY"] = "0"
-
-        rvc = RVCInference(device="cpu")
-        rvc.load_model(model_pth, version="v2", index_path=index_file or "")
-
-        rvc.set_params(
-            f0method=f0_method,
-            f0up_key=pitch_shift,
+        if self.rvc_chunk_sec:
+            import rvc_chunks
+            engine_options = dict(
+                model_pth=model_pth,
+                index_file=index_file,
+                accel=self.rvc_accel,
+                f0_method=f0_method,
+                protect=protect,
+                pitch_shift=pitch_shift,
+                index_rate=0.6,
+                f0_fallback=tuple(self.f0_fallback),
+                f0_cache_dir=self.f0_cache_dir
+            )
+            stats = {}
+            rvc_chunks.convert_file(
+                vocals_wav,
+                output_wav,
+                engine_options,
+                workers=self.rvc_workers,
+                chunk_sec=self.rvc_chunk_sec,
+                overlap_sec=self.rvc_overlap_sec,
+                pool=self.rvc_pool() if self.rvc_workers > 1 else None,
+                stats=stats
+            )
+            self._record_load("rvc", stats.get("load_sec", 0.0))
+            logger.info(f"Converted vocals saved to {output_wav}")
+            return output_wav
+
+        rvc = self.load_rvc(
+            model_pth,
+            index_file,
+            accel=self.rvc_accel,
+            f0_method=f0_method,
+            protect=protect,
+            pitch_shift=pitch_shift,
             index_rate=0.6,
-            protect=protect
-        )
+            f0_fallback=tuple(self.f0_fallback),
+            f0_cache_dir=self.f0_cache_dir
+        ).rvc
 
         logger.info("Starting inference via direct vc_single call...")
         file_index = rvc.models[rvc.current_model].get("index", "")
@@ -136,9 +292,37 @@ class AudioProcessor:
         logger.info(f"Converted vocals saved to {output_wav}")
         return output_wav
 
+    def phase3_rvc_stream(self, source, sink, model_pth, index_file=None, f0_method="pm", protect=0.33, pitch_shift=0, **options):
+        """ライブ入力を phase3 と同じ RVC モデルでブロックごとに変換して sink に書き出す。
+
+        source / sink と options は rvc_stream を参照。F0 は毎回違う音声なのでキャッシュしない。
+        RTF と遅延のパーセンタイルを返す。
+        """
+        logger.info(f"--- Phase 3 (streaming): RVC (Method: {f0_method}, Protect: {protect}, Shift: {pitch_shift}) ---")
+        engine = self.load_rvc(
+            model_pth,
+            index_file,
+            accel=self.rvc_accel,
+            f0_method=f0_method,
+            protect=protect,
+            pitch_shift=pitch_shift,
+            index_rate=0.6,
+            f0_fallback=tuple(self.f0_fallback),
+            f0_cache_dir=None
+        )
+        import rvc_stream
+        stats = rvc_stream.StreamConverter(engine, **options).run(source, sink)
+        with self._metrics_lock:
+            self.metrics["stream"] = stats
+        return stats
+
     def phase4_mix(self, vocals_wav, inst_wav):
         logger.info("--- Phase 4: Remixing ---")
         output_wav = os.path.join(self.output_dir, "radio-calisthenics_converted.wav")
+        if self.audio_engine == "numpy":
+            wav_blocks.mix_wavs(vocals_wav, inst_wav, output_wav, vocal_gain_db=-6.0)
+            logger.info(f"Final mixed audio saved to {output_wav}")
+            return output_wav
 
         vocal = AudioSegment.from_wav(vocals_wav)
         inst = AudioSegment.from_wav(inst_wav)
@@ -152,38 +336,152 @@ class AudioProcessor:
         logger.info(f"Final mixed audio saved to {output_wav}")
         return output_wav
 
-    def run_full_process(self, input_file, rvc_model_info):
-        # Phase 1
-        norm_wav = self.phase1_normalize(input_file)
-
-        # Phase 2
-        vocals_wav, inst_wav = self.phase2_separate(norm_wav)
-
-        # Phase 3 Prepare Models
-        model_pth = os.path.join(self.models_dir, f"{rvc_model_info['name']}.pth")
-        model_index = os.path.join(self.models_dir, f"{rvc_model_info['name']}.index")
-
-        self.download_file(rvc_model_info['pth_url'], model_pth)
-        self.download_file(rvc_model_info['index_url'], model_index)
-
-        # Phase 3 Inference
+    def _run_phase(self, name, func, *args, **kwargs):
+        start = time.time()
         try:
-            converted_vocals = self.phase3_rvc_inference(vocals_wav, model_pth, model_index)
-        except Exception as e:
-            logger.error(f"Inference failed: {e}")
-            logger.info("Retrying with f0_method='harvest' and protect=0.4...")
-            converted_vocals = self.phase3_rvc_inference(vocals_wav, model_pth, model_index, f0_method="harvest", protect=0.4)
-
-        # Phase 4
-        final_output = self.phase4_mix(converted_vocals, inst_wav)
-
-        # Move to root_out (Docker map)
-        final_dest = "/app/root_out/radio-calisthenics_converted.wav"
-        shutil.copy(final_output, final_dest)
-        logger.info(f"Success! Process completed. File: {final_dest}")
+            return func(*args, **kwargs)
+        finally:
+            with self._metrics_lock:
+                self.metrics["phase_sec"][name] = self.metrics["phase_sec"].get(name, 0.0) + time.time() - start
+
+    def _stage(self, name, inputs, params, build):
+        """build_cache があれば入力・パラメータが前回と同じステージは実行せずに成果物を使い回す"""
+        if self.build_cache is None:
+            return build_cache.StageResult(name, None, "built", build())
+        return self.build_cache.run(name, inputs, params, build)
+
+    def _rvc_stage(self, vocals, model_pth, model_index, f0_method=None, protect=0.33):
+        inputs = [vocals, model_pth, model_index]
+        if (f0_method or self.f0_method) == "auto":
+            # 自動選択の結果が変われば変換結果も変わる
+            inputs.append(os.path.join(self.base_dir, "cache", "f0_engine.json"))
+        tuned_index = rvc_index.tuned_index(model_index)
+        if tuned_index:
+            # rvc_index.py で変換した index は検索結果が少し変わる
+            inputs += [tuned_index, rvc_index.tuned_paths(model_index)[1]]
+        params = {
+            "f0_method": f0_method or self.f0_method,
+            "f0_fallback": list(self.f0_fallback),
+            "protect": protect,
+            "pitch_shift": 0,
+            "index_rate": 0.6,
+            "accel": self.rvc_accel,
+            "chunk_sec": self.rvc_chunk_sec,
+            "overlap_sec": self.rvc_overlap_sec,
+        }
+        return self._stage("rvc", inputs, params, lambda: {"wav": self._run_phase(
+            "rvc", self.phase3_rvc_inference, vocals.paths["vocals"], model_pth, model_index, f0_method=f0_method, protect=protect
+        )})
+
+    def run_full_process(self, input_file, rvc_model_info, final_dest=FINAL_DEST):
+        """正規化 → 分離 → RVC → ミックスを依存関係のグラフとして実行する。
+
+        RVC モデルのダウンロードは RVC の直前ではなく、正規化・分離と並行に進める。
+        """
+        self.metrics = {"load_sec": {}, "phase_sec": {}}
+        dry_run = self.build_cache is not None and self.build_cache.dry_run
+        if self.build_cache is not None:
+            self.build_cache.plan = []
+        model_pth, model_index = self.model_paths(rvc_model_info)
+
+        def normalize():
+            return self._stage("normalize", [input_file], {"engine": self.audio_engine, "rate": 44100}, lambda: {
+                "wav": self._run_phase("normalize", self.phase1_normalize, input_file)
+            })
+
+        def separate(norm):
+            # 分離モデルのファイルはモデル名ごとに固定なので、名前とライブラリのバージョンで区別する
+            separator_version = getattr(sys.modules.get("audio_separator"), "__version__", None)
+            return self._stage("separate", [norm], {"model": SEPARATION_MODEL, "audio_separator": separator_version, "engine": self.separation_engine}, lambda: dict(zip(
+                ("vocals", "instrumental"), self._run_phase("separate", self.phase2_separate, norm.paths["wav"])
+            )))
+
+        def download(url, dest_path, sha256):
+            # dry run ではダウンロードしない (未取得のモデルは入力が変わったものとして扱われる)
+            if not dry_run:
+                self._run_phase("download", self.download_file, url, dest_path, sha256)
+
+        def rvc(separated, *_downloads):
+            try:
+                return self._rvc_stage(separated, model_pth, model_index)
+            except Exception as e:
+                # F0 の失敗は区間ごとに f0_fallback で吸収されるので、ここに来るのはそれ以外の失敗
+                # (やり直しの結果は別のキーで保存されるので、通常設定の成果物としては使われない)
+                logger.error(f"Inference failed: {e}")
+                logger.info("Retrying with f0_method='harvest' and protect=0.4...")
+                return self._rvc_stage(separated, model_pth, model_index, f0_method="harvest", protect=0.4)
+
+        def mix(converted, separated):
+            return self._stage("mix", [converted, separated], {"engine": self.audio_engine, "vocal_gain_db": -6.0}, lambda: {
+                "wav": self._run_phase("mix", self.phase4_mix, converted.paths["wav"], separated.paths["instrumental"])
+            })
+
+        def publish(mixed):
+            if dry_run:
+                return
+            # 動画側が完成を待ってファイルを読むので、書きかけが見えないよう rename で置く
+            tmp_dest = final_dest + ".tmp"
+            shutil.copyfile(mixed.paths["wav"], tmp_dest)
+            os.replace(tmp_dest, final_dest)
+            logger.info(f"Success! Process completed. File: {final_dest}")
+
+        graph = stage_graph.StageGraph()
+        graph.add("normalize", normalize)
+        graph.add("download_pth", lambda: download(rvc_model_info['pth_url'], model_pth, rvc_model_info.get('pth_sha256')))
+        graph.add("download_index", lambda: download(rvc_model_info['index_url'], model_index, rvc_model_info.get('index_sha256')))
+        graph.add("separate", separate, deps=["normalize"])
+        graph.add("rvc", rvc, deps=["separate", "download_pth", "download_index"])
+        graph.add("mix", mix, deps=["rvc", "separate"])
+        graph.add("publish", publish, deps=["mix"])
+        try:
+            graph.run()
+        finally:
+            graph.report()
+            self.metrics["wall_sec"] = graph.wall_sec
+            self.metrics["critical_path"] = graph.critical_path()
+
+        if self.build_cache is not None:
+            self.build_cache.report()
+            self.build_cache.prune()
+        if dry_run:
+            return None
+        load = sum(self.metrics["load_sec"].values())
+        logger.info(f"Timing: model load {load:.1f}s, wall {graph.wall_sec:.1f}s")
+        return final_dest
+
+def configure(processor):
+    """環境変数から処理の設定を読み込む"""
+    # RVC_CHUNK_SEC を指定するとその長さのチャンクに分けて並列に変換する。既定の 0 はファイル全体の一括変換
+    processor.rvc_chunk_sec = float(os.environ.get("RVC_CHUNK_SEC", "0")) or None
+    processor.rvc_overlap_sec = float(os.environ.get("RVC_OVERLAP_SEC", "1.0"))
+    # ワーカーごとに HuBERT と声モデルを読み込むので、既定はコア数と 4 の小さい方
+    processor.rvc_workers = int(os.environ.get("RVC_WORKERS", min(4, os.cpu_count() or 1)))
+    processor.audio_engine = os.environ.get("AUDIO_ENGINE", processor.audio_engine)
+    if os.environ.get("RVC_F0_CACHE", "1") == "0":
+        processor.f0_cache_dir = None
+    processor.f0_method = os.environ.get("RVC_F0_METHOD", processor.f0_method)
+    if "RVC_F0_FALLBACK" in os.environ:
+        processor.f0_fallback = tuple(name for name in os.environ["RVC_F0_FALLBACK"].split(",") if name)
+    processor.model_store_dir = os.environ.get("MODEL_STORE_DIR") or processor.model_store_dir
+    # RVC_ACCEL=int8 は Linear だけを量子化する (声モデルの Conv は fp32 のまま。rvc_accel.py compare で効果を測る)
+    processor.rvc_accel = os.environ.get("RVC_ACCEL", processor.rvc_accel)
+    # SEPARATION_THREADS / SEPARATION_BATCH を指定するとその値を使い、残りだけを計測で決める
+    processor.separation_engine = os.environ.get("SEPARATION_ENGINE", processor.separation_engine)
+    if "SEPARATION_THREADS" in os.environ:
+        processor.separation_threads = int(os.environ["SEPARATION_THREADS"])
+    if "SEPARATION_BATCH" in os.environ:
+        processor.separation_batch_size = int(os.environ["SEPARATION_BATCH"])
+    # BUILD_CACHE=0 で成果物のキャッシュを使わない。BUILD_DRY_RUN=1 なら何も実行せず、作り直しになるフェーズだけを表示する
+    if os.environ.get("BUILD_CACHE", "1") != "0":
+        cache_dir = os.environ.get("BUILD_CACHE_DIR", os.path.join(processor.base_dir, "cache", "build"))
+        # BUILD_CACHE_MAX_GB / BUILD_CACHE_MAX_AGE_DAYS を超えた古い成果物は実行のたびに消す
+        processor.build_cache = build_cache.BuildCache(
+            cache_dir, dry_run=os.environ.get("BUILD_DRY_RUN", "0") == "1", **build_cache.limits_from_env()
+        )
 
 def main():
     processor = AudioProcessor(os.path.dirname(__file__))
+    configure(processor)
 
     input_file = os.path.join(processor.input_dir, "radio-calisthenics.wav")
     if not os.path.exists(input_file):
@@ -194,14 +492,10 @@ def main():
             logger.error(f"Input file not found: {root_input}")
             return
 
-    # デフォルトのRVCモデル
-    rvc_model_info = {
-        "name": "zundamon",
-        "pth_url": "https://huggingface.co/kuwacom/RVC-Models/resolve/main/zundamon-1/zundamon-1.pth",
-        "index_url": "https://huggingface.co/kuwacom/RVC-Models/resolve/main/zundamon-1/zundamon-1.index"
-    }
-
-    processor.run_full_process(input_file, rvc_model_info)
+    try:
+        processor.run_full_process(input_file, DEFAULT_RVC_MODEL)
+    finally:
+        processor.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,166 @@
+import os
+import time
+import logging
+import argparse
+import multiprocessing
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+MB = 1024 * 1024
+# /proc/self/smaps_rollup の項目のうち報告に使うもの
+_SMAPS_FIELDS = {"Rss": "rss", "Pss": "pss", "Anonymous": "anonymous"}
+# report でワーカーの読み込みを待つ上限 (誰かが落ちても固まらないように)
+LOAD_TIMEOUT_SEC = 600
+
+
+def memory_usage():
+    """このプロセスの Rss / Pss / 匿名ページ (bytes)。
+
+    Rss - 匿名ページがファイル由来のページで、メモリマップした重みはこちらに入る
+    (同じファイルを開いた他のプロセスとページキャッシュを共有できる)。
+    smaps_rollup の無い環境では Rss だけを返す。
+    """
+    usage = {}
+    try:
+        with open("/proc/self/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in _SMAPS_FIELDS:
+                    usage[_SMAPS_FIELDS[name]] = int(value.split()[0]) * 1024
+    except OSError:
+        import resource
+        usage["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return usage
+
+
+@contextmanager
+def measure(name):
+    """with の中のモデル読み込みにかかった時間とメモリの増分を dict に入れる"""
+    report = {}
+    before = memory_usage()
+    start = time.time()
+    yield report
+    after = memory_usage()
+    report["sec"] = time.time() - start
+    for key in after:
+        report[f"{key}_mb"] = (after[key] - before.get(key, 0)) / MB
+    if "anonymous_mb" in report:
+        report["file_backed_mb"] = report["rss_mb"] - report["anonymous_mb"]
+        logger.info(
+            f"Loaded {name} in {report['sec']:.1f}s: RSS {report['rss_mb']:+.0f} MB "
+            f"(private {report['anonymous_mb']:+.0f} MB, file-backed {report['file_backed_mb']:+.0f} MB)"
+        )
+    else:
+        logger.info(f"Loaded {name} in {report['sec']:.1f}s: RSS {report['rss_mb']:+.0f} MB")
+
+
+def map_weights(module, checkpoint_path, key=None):
+    """チェックポイントをメモリマップで開き、形と dtype が一致するパラメータを差し替える。
+
+    load_state_dict はパラメータにコピーするのでプロセスごとに重みの複製ができるが、
+    assign=True で差し替えるとファイルのページを直接参照するので、同じファイルを開いた
+    ワーカー同士でページキャッシュを共有できる。dtype が違うもの (fp16 で保存された重みなど) は
+    変換にコピーが要るのでそのまま残す。差し替えたバイト数を返す。
+    """
+    import torch
+    try:
+        checkpoint = torch.load(checkpoint_path, map_location="cpu", mmap=True, weights_only=False)
+    except (TypeError, RuntimeError) as e:
+        # torch 2.1 未満、または zip 形式でない古いチェックポイント
+        logger.warning(f"Could not memory-map {checkpoint_path} ({e}); keeping the copied weights")
+        return 0
+    state = checkpoint[key] if key else checkpoint
+    current = module.state_dict()
+    mapped = {
+        name: tensor for name, tensor in state.items()
+        if name in current and tensor.shape == current[name].shape and tensor.dtype == current[name].dtype
+    }
+    if mapped:
+        # fairseq のモデルは load_state_dict を上書きしていて assign を受け取らないので、nn.Module のものを呼ぶ
+        torch.nn.Module.load_state_dict(module, mapped, strict=False, assign=True)
+    return sum(tensor.numel() * tensor.element_size() for tensor in mapped.values())
+
+
+def store_path(store_dir, filename):
+    """共有ストアにあればそのパス、無ければ None"""
+    if not store_dir:
+        return None
+    path = os.path.join(store_dir, filename)
+    return path if os.path.exists(path) else None
+
+
+def populate(store_dir, rvc_model_infos):
+    """共有ストアに分離モデルと RVC モデルを置く。ワーカーからは読み取り専用でマウントして使う"""
+    import downloads
+    from main import SEPARATION_MODEL, Separator
+    os.makedirs(store_dir, exist_ok=True)
+    items = []
+    for info in rvc_model_infos:
+        items.append((info["pth_url"], os.path.join(store_dir, f"{info['name']}.pth"), info.get("pth_sha256")))
+        items.append((info["index_url"], os.path.join(store_dir, f"{info['name']}.index"), info.get("index_sha256")))
+    downloads.download_all(items)
+    # 分離モデル (と audio-separator が使うモデル情報) は audio-separator 自身に落とさせる
+    Separator(model_file_dir=store_dir, output_dir=store_dir).load_model(SEPARATION_MODEL)
+    logger.info(f"Model store ready: {store_dir}")
+
+
+def _load_worker(base_dir, barrier, results):
+    from main import AudioProcessor, DEFAULT_RVC_MODEL, configure
+    processor = AudioProcessor(base_dir)
+    configure(processor)
+    processor.load_separator()
+    processor.load_rvc(*processor.model_paths(DEFAULT_RVC_MODEL))
+    # 全員が読み込み終わってから測るので、Pss に共有の効果が出る
+    barrier.wait()
+    results.put((os.getpid(), processor.metrics["load_memory"], memory_usage()))
+    barrier.wait()
+
+
+def report(base_dir, workers=2):
+    """workers 個のプロセスで同時にモデルを読み込み、モデルごとの読み込み時間・メモリと
+    全員が読み込んだ状態での Rss / Pss を表示する。Rss の合計より Pss の合計が小さい分が共有されている"""
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(workers, timeout=LOAD_TIMEOUT_SEC)
+    results = ctx.Queue()
+    procs = [ctx.Process(target=_load_worker, args=(base_dir, barrier, results)) for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    rows = [results.get(timeout=LOAD_TIMEOUT_SEC) for _ in procs]
+    for proc in procs:
+        proc.join()
+
+    print(f"{'pid':>7} {'model':<10} {'sec':>6} {'rss MB':>8} {'private':>8} {'file':>8}")
+    for pid, loads, _ in rows:
+        for name, r in loads.items():
+            print(
+                f"{pid:>7} {name:<10} {r['sec']:>6.1f} {r['rss_mb']:>+8.0f} "
+                f"{r.get('anonymous_mb', float('nan')):>+8.0f} {r.get('file_backed_mb', float('nan')):>+8.0f}"
+            )
+    rss = sum(usage.get("rss", 0) for _, _, usage in rows) / MB
+    pss = sum(usage.get("pss", 0) for _, _, usage in rows) / MB
+    print(f"{workers} workers: RSS total {rss:.0f} MB, PSS total {pss:.0f} MB (shared {rss - pss:.0f} MB)")
+
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Shared read-only model store and model load report")
+    sub = parser.add_subparsers(dest="command", required=True)
+    fill = sub.add_parser("populate", help="Download the separation and RVC models into a store directory")
+    fill.add_argument("store", nargs="?", default=os.environ.get("MODEL_STORE_DIR"))
+    measure_cmd = sub.add_parser("report", help="Load the models in several processes and report latency, RSS and PSS")
+    measure_cmd.add_argument("--workers", type=int, default=2)
+    args = parser.parse_args()
+
+    if args.command == "populate":
+        if not args.store:
+            parser.error("store directory is required (or set MODEL_STORE_DIR)")
+        from main import DEFAULT_RVC_MODEL
+        populate(args.store, [DEFAULT_RVC_MODEL])
+    else:
+        report(base_dir, args.workers)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
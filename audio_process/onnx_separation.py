@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import platform
+import logging
+import itertools
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+logger = logging.getLogger(__name__)
+
+# 自動調整で試すバッチサイズ (1回の session.run に入れるスペクトログラムの区間数)
+BATCH_SIZES = (1, 2, 4)
+TUNE_REPEATS = 3
+
+
+def session_options(intra_op_threads, inter_op_threads):
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = intra_op_threads
+    options.inter_op_num_threads = inter_op_threads
+    # inter_op はグラフの独立な枝を並行に走らせるときだけ効く
+    options.execution_mode = ort.ExecutionMode.ORT_PARALLEL if inter_op_threads > 1 else ort.ExecutionMode.ORT_SEQUENTIAL
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.log_severity_level = 3
+    return options
+
+
+def open_session(model_path, intra_op_threads, inter_op_threads):
+    return ort.InferenceSession(
+        model_path,
+        sess_options=session_options(intra_op_threads, inter_op_threads),
+        providers=["CPUExecutionProvider"],
+    )
+
+
+def fixed_batch(session):
+    """入力のバッチ次元が固定ならその値、可変なら None"""
+    dim = session.get_inputs()[0].shape[0]
+    return dim if isinstance(dim, int) else None
+
+
+def thread_candidates(cpus=None):
+    """(intra_op, inter_op) の候補。全コア・半分・1/4 と、inter_op 1 / 2 の組み合わせ"""
+    cpus = cpus or os.cpu_count() or 1
+    intra = sorted({cpus, max(1, cpus // 2), max(1, cpus // 4)}, reverse=True)
+    return [(i, j) for i, j in itertools.product(intra, (1, 2)) if i * j <= cpus]
+
+
+def benchmark(model_path, dim_f, dim_t, candidates=None, batch_sizes=BATCH_SIZES, repeats=TUNE_REPEATS):
+    """スレッド数とバッチサイズの組み合わせごとに、1区間あたりの推論時間を測る"""
+    results = []
+    for intra, inter in candidates or thread_candidates():
+        session = open_session(model_path, intra, inter)
+        limit = fixed_batch(session)
+        for batch in batch_sizes:
+            if limit and batch != limit:
+                continue
+            x = np.random.default_rng(0).standard_normal((batch, 4, dim_f, dim_t), dtype=np.float32)
+            session.run(None, {"input": x})
+            start = time.perf_counter()
+            for _ in range(repeats):
+                session.run(None, {"input": x})
+            per_chunk = (time.perf_counter() - start) / (repeats * batch)
+            results.append({"intra_op": intra, "inter_op": inter, "batch_size": batch, "sec_per_chunk": per_chunk})
+            logger.info(f"Separation tuning: intra_op={intra} inter_op={inter} batch={batch}: {per_chunk:.3f}s/chunk")
+    return results
+
+
+def tune(model_path, dim_f, dim_t, cache_path=None):
+    """このマシンで一番速い {intra_op, inter_op, batch_size} を返す。
+
+    結果は cache_path に保存し、同じマシン・同じモデルなら次回からは計測しない。
+    """
+    signature = {
+        "host": platform.node(),
+        "cpus": os.cpu_count(),
+        "model": os.path.basename(model_path),
+        "model_size": os.path.getsize(model_path),
+        "onnxruntime": ort.__version__,
+    }
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            saved = json.load(f)
+        if saved.get("signature") == signature:
+            return saved["selected"]
+
+    results = benchmark(model_path, dim_f, dim_t)
+    best = min(results, key=lambda r: r["sec_per_chunk"])
+    selected = {key: best[key] for key in ("intra_op", "inter_op", "batch_size")}
+    logger.info(f"Selected separation settings: {selected} ({best['sec_per_chunk']:.3f}s/chunk)")
+
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"signature": signature, "selected": selected, "results": results}, f, indent=2)
+        os.replace(tmp_path, cache_path)
+    return selected
+
+
+class BatchedMDX:
+    """audio-separator の MDXSeparator に、スレッド数を指定したセッションとバッチ推論の demix を差し込む。
+
+    元の demix は区間を1つずつ STFT → session.run → ISTFT するので、ここでは batch_size 区間ずつ
+    まとめて流す。窓掛けと重なりの足し合わせは元の実装と同じ。セッションは Separator と一緒に
+    使い回されるので、2曲目以降はモデルの読み込みも起きない。
+    """
+
+    def __init__(self, model, intra_op_threads, inter_op_threads, batch_size):
+        self.model = model
+        release_session(model)
+        self.session = open_session(model.model_path, intra_op_threads, inter_op_threads)
+        self.batch_size = fixed_batch(self.session) or batch_size
+        self._original_demix = model.demix
+
+    def install(self):
+        self.model.model_run = self.run
+        self.model.demix = self.demix
+        return self
+
+    def run(self, spek):
+        return self.session.run(None, {"input": spek.cpu().numpy()})[0]
+
+    def _predict(self, parts):
+        m = self.model
+        with torch.no_grad():
+            spek = m.stft(torch.from_numpy(parts).to(m.torch_device))
+            spek[:, :, :3, :] *= 0
+            if m.enable_denoise:
+                spec_pred = self.run(-spek) * -0.5 + self.run(spek) * 0.5
+            else:
+                spec_pred = self.run(spek)
+            return m.stft.inverse(torch.from_numpy(spec_pred).to(m.torch_device)).cpu().numpy()
+
+    def demix(self, mix, is_match_mix=False):
+        m = self.model
+        if is_match_mix:
+            # match_mix の結果は invert_using_spec のときしか使われないので、それ以外は STFT の往復ごと省く
+            return self._original_demix(mix, is_match_mix=True) if m.invert_using_spec else None
+
+        m.initialize_model_settings()
+        chunk_size, trim, overlap = m.chunk_size, m.trim, m.overlap
+        gen_size = chunk_size - 2 * trim
+        pad = gen_size + trim - (mix.shape[-1] % gen_size)
+        mixture = np.concatenate((np.zeros((2, trim), dtype=np.float32), mix, np.zeros((2, pad), dtype=np.float32)), 1)
+        length = mixture.shape[-1]
+        step = int((1 - overlap) * chunk_size)
+
+        result = np.zeros((2, length), dtype=np.float32)
+        divider = np.zeros((2, length), dtype=np.float32)
+        starts = list(range(0, length, step))
+        for i in range(0, len(starts), self.batch_size):
+            group = starts[i:i + self.batch_size]
+            parts = np.zeros((len(group), 2, chunk_size), dtype=np.float32)
+            for k, start in enumerate(group):
+                end = min(start + chunk_size, length)
+                parts[k, :, :end - start] = mixture[:, start:end]
+            waves = self._predict(parts)
+            for k, start in enumerate(group):
+                end = min(start + chunk_size, length)
+                window = np.hanning(end - start) if overlap != 0 else 1.0
+                result[:, start:end] += waves[k, :, :end - start] * window
+                divider[:, start:end] += window
+
+        # 元の demix と同じく、match_mix でない結果にはモデルごとの補正倍率を掛ける
+        return (result / divider)[:, trim:-trim][:, :mix.shape[-1]] * m.compensate
+
+
+def release_session(model):
+    """audio-separator が load_model で開いたセッションを手放す。
+
+    セッションは model_run の lambda だけが持っているので、これを外せば重みのメモリが解放される。
+    スレッド数はセッションを作るときにしか決められないので、使い回さずに開き直す。
+    """
+    model.model_run = None
+
+
+def install(separator, cache_path=None, intra_op_threads=None, inter_op_threads=None, batch_size=None):
+    """読み込み済みの Separator (MDX モデル) の推論を BatchedMDX に切り替える。
+
+    スレッド数・バッチサイズのうち指定の無いものは tune で決める。MDX 以外のモデルや、
+    segment_size が dim_t と違って PyTorch で推論する設定ではそのまま audio-separator に任せる
+    (MDXSeparator.load_model が onnxruntime を使うのと同じ条件)。
+    """
+    model = separator.model_instance
+    if ort is None or torch is None or not hasattr(model, "dim_t") or getattr(model, "segment_size", None) != model.dim_t:
+        logger.warning("ONNX separation engine needs an MDX model run through onnxruntime; using audio-separator defaults")
+        return None
+    # 計測でも同じモデルのセッションを開くので、重みを二重に持たないよう先に手放す
+    release_session(model)
+    settings = {"intra_op": intra_op_threads, "inter_op": inter_op_threads, "batch_size": batch_size}
+    if None in settings.values():
+        tuned = tune(model.model_path, model.dim_f, model.dim_t, cache_path)
+        settings = {key: value if value is not None else tuned[key] for key, value in settings.items()}
+    logger.info(f"ONNX separation engine: {settings}")
+    return BatchedMDX(model, settings["intra_op"], settings["inter_op"], settings["batch_size"]).install()
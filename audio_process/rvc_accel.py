@@ -0,0 +1,242 @@
+import os
+import json
+import time
+import logging
+import argparse
+
+import numpy as np
+from scipy import signal
+from scipy.io import wavfile
+
+logger = logging.getLogger(__name__)
+
+# "eager" は読み込んだ fp32 モデルのまま、"int8" は Linear を int8 で動的量子化したもの。
+# 動的量子化は Conv を扱えないので、ほぼ Conv1d / ConvTranspose1d でできている声モデル (net_g) は
+# ほとんど fp32 のまま残る。効くのは主に HuBERT の FFN
+MODES = ("eager", "int8")
+INT8_LIMITATION = (
+    "int8 only quantizes nn.Linear layers (dynamic quantization does not cover convolutions), "
+    "so the voice model's Conv1d/ConvTranspose1d decoder stays fp32 and the speedup comes mostly from HuBERT; "
+    "run 'compare' to measure it on this machine"
+)
+# A/B で比べるスペクトルの窓 (16kHz で約 64ms)
+LSD_NPERSEG = 1024
+
+
+def _quantizable_linears(module):
+    """動的量子化する Linear の名前。
+
+    fairseq の MultiheadAttention は q/k/v_proj の weight を直接 F.multi_head_attention_forward に
+    渡すので、量子化すると動かない。注意機構の中の Linear は除き、FFN (fc1 / fc2) などだけを対象にする。
+    """
+    import torch
+    attention = [name for name, m in module.named_modules() if hasattr(m, "q_proj")]
+    return {
+        name for name, m in module.named_modules()
+        if isinstance(m, torch.nn.Linear) and not any(name.startswith(f"{a}.") for a in attention)
+    }
+
+
+def quantized_share(module, names):
+    """量子化する Linear の重みが、モデル全体の重みに占める割合"""
+    modules = dict(module.named_modules())
+    total = sum(p.numel() for p in module.parameters())
+    quantized = sum(p.numel() for name in names for p in modules[name].parameters(recurse=False))
+    return quantized / total if total else 0.0
+
+
+def quantize(module):
+    """Linear の重みを int8 にし、活性は推論時に量子化する (CPU の fbgemm / qnnpack)"""
+    import torch
+    names = _quantizable_linears(module)
+    logger.info(
+        f"Quantizing {len(names)} Linear layers of {type(module).__name__} "
+        f"({quantized_share(module, names):.0%} of the weights); convolutions stay fp32"
+    )
+    return torch.ao.quantization.quantize_dynamic(module, names, dtype=torch.qint8, inplace=True)
+
+
+def artifact_path(source_path, mode, artifact_dir=None):
+    """変換済みモデルの置き場所。既定は元のモデルの隣 (zundamon.pth -> zundamon.int8.pt)"""
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    return os.path.join(artifact_dir or os.path.dirname(source_path), f"{stem}.{mode}.pt")
+
+
+def _source_stamp(source_path):
+    """元のモデルか torch が変わったら作り直す"""
+    import torch
+    stat = os.stat(source_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "torch": torch.__version__}
+
+
+def _load_artifact(path, stamp):
+    import torch
+    if not os.path.exists(path):
+        return None
+    try:
+        saved = torch.load(path, map_location="cpu", weights_only=False)
+    except Exception as e:
+        logger.warning(f"Could not load {path} ({e}); converting again")
+        return None
+    if saved.get("source") != stamp:
+        logger.info(f"{path} is stale; converting again")
+        return None
+    return saved["module"]
+
+
+def _save_artifact(path, stamp, module):
+    import torch
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        torch.save({"source": stamp, "module": module}, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        # 読み取り専用の共有ストアなど。変換したものはこのプロセスでそのまま使う
+        logger.warning(f"Could not cache {path} ({e})")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def accelerate(module, source_path, mode, artifact_dir=None):
+    """読み込み済みの fp32 モデルを mode のものに差し替えて返す。
+
+    変換したものは artifact_path に保存し、次からはそれを読み込む。
+    """
+    if mode in (None, "eager"):
+        return module
+    if mode not in MODES:
+        raise ValueError(f"Unknown RVC acceleration mode: {mode} (expected one of {MODES})")
+    path = artifact_path(source_path, mode, artifact_dir)
+    stamp = _source_stamp(source_path)
+    cached = _load_artifact(path, stamp)
+    if cached is not None:
+        cached.eval()
+        return cached
+    start = time.time()
+    converted = quantize(module).eval()
+    logger.info(f"Converted {os.path.basename(source_path)} to {mode} in {time.time() - start:.1f}s")
+    _save_artifact(path, stamp, converted)
+    return converted
+
+
+def snr_db(reference, test):
+    """reference に対する test の差の SNR (dB)。大きいほど近い"""
+    n = min(len(reference), len(test))
+    noise = np.sum(np.square(reference[:n] - test[:n]))
+    return float("inf") if noise == 0 else float(10 * np.log10(np.sum(np.square(reference[:n])) / noise))
+
+
+def log_spectral_distance(reference, test, sr):
+    """フレームごとの対数パワースペクトルの差の RMS の平均 (dB)。小さいほど近い"""
+    n = min(len(reference), len(test))
+    _, _, ref = signal.stft(reference[:n], sr, nperseg=LSD_NPERSEG)
+    _, _, out = signal.stft(test[:n], sr, nperseg=LSD_NPERSEG)
+    eps = 1e-10
+    diff = 10 * np.log10(np.abs(ref) ** 2 + eps) - 10 * np.log10(np.abs(out) ** 2 + eps)
+    return float(np.mean(np.sqrt(np.mean(np.square(diff), axis=0))))
+
+
+def compare(vocals_path, model_pth, index_file=None, mode="int8", output_dir=None, seconds=None,
+            f0_method="crepe", f0_cache_dir=None):
+    """eager と mode で同じボーカルを変換し、処理時間と出力の差を比べる。
+
+    F0 はモデルによらないので、比べるのは特徴抽出+検索と合成の時間 (RVCEngine.times の [0] と [2])。合成は乱数を使うので、どちらも同じシードで変換する。
+    """
+    import torch
+    import rvc_engine
+
+    audio = rvc_engine.load_vocals(vocals_path)
+    if seconds:
+        audio = audio[:int(seconds * rvc_engine.SAMPLE_RATE)]
+    key = os.path.abspath(vocals_path)
+    params = dict(f0_method=f0_method, f0_cache_dir=f0_cache_dir)
+
+    runs = {}
+    for run_mode in ("eager", mode):
+        engine = rvc_engine.RVCEngine(model_pth, index_file, accel=run_mode, **params)
+        # 初回だけの遅延初期化 (index の読み込みなど) を時間に含めない
+        engine.convert(audio[:rvc_engine.SAMPLE_RATE], key)
+        engine.times[:] = [0.0, 0.0, 0.0]
+        torch.manual_seed(0)
+        start = time.time()
+        converted = engine.convert(audio, key)
+        runs[run_mode] = {
+            "load_sec": engine.load_sec,
+            "convert_sec": time.time() - start,
+            "model_sec": engine.times[0] + engine.times[2],
+            "times": list(engine.times),
+            "audio": converted,
+            "sr": engine.tgt_sr,
+        }
+        del engine
+
+    reference, test = runs["eager"]["audio"], runs[mode]["audio"]
+    summary = {
+        "vocals": key,
+        "model": os.path.abspath(model_pth),
+        "mode": mode,
+        "seconds": len(audio) / rvc_engine.SAMPLE_RATE,
+        "snr_db": snr_db(reference, test),
+        "lsd_db": log_spectral_distance(reference, test, runs["eager"]["sr"]),
+        "speedup": runs["eager"]["model_sec"] / max(runs[mode]["model_sec"], 1e-9),
+        "runs": {name: {k: v for k, v in run.items() if k != "audio"} for name, run in runs.items()},
+    }
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+        for name, run in runs.items():
+            pcm = np.clip(np.round(run["audio"] * 32768), -32768, 32767).astype(np.int16)
+            wavfile.write(os.path.join(output_dir, f"{name}.wav"), run["sr"], pcm)
+        with open(os.path.join(output_dir, "ab.json"), "w") as f:
+            json.dump(summary, f, indent=2)
+    return summary
+
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(
+        description="Accelerated (int8) RVC models and an A/B report against eager fp32",
+        epilog=f"Note: {INT8_LIMITATION}.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Convert the voice model and HuBERT once and cache them next to the .pth")
+    export.add_argument("--model", default=os.path.join(base_dir, "models", "zundamon.pth"))
+    export.add_argument("--mode", choices=MODES[1:], default="int8", help=INT8_LIMITATION)
+    ab = sub.add_parser("compare", help="Convert the same vocals with eager and accelerated models and compare them")
+    ab.add_argument("vocals", help="Separated vocals wav (e.g. output/vocals.wav)")
+    ab.add_argument("--model", default=os.path.join(base_dir, "models", "zundamon.pth"))
+    ab.add_argument("--index", default=os.path.join(base_dir, "models", "zundamon.index"))
+    ab.add_argument("--mode", choices=MODES[1:], default="int8", help=INT8_LIMITATION)
+    ab.add_argument("--seconds", type=float, default=30.0, help="Only compare the first N seconds (0 for all)")
+    ab.add_argument("--f0-method", default="crepe")
+    ab.add_argument("--f0-cache-dir", default=os.path.join(base_dir, "cache", "f0"))
+    ab.add_argument("--output-dir", default=os.path.join(base_dir, "output", "rvc_ab"))
+    args = parser.parse_args()
+
+    if args.command == "export":
+        import rvc_engine
+        engine = rvc_engine.RVCEngine(args.model, accel=args.mode)
+        print(f"{args.mode} models ready in {engine.load_sec:.1f}s next to {args.model}")
+        return
+
+    summary = compare(
+        args.vocals,
+        args.model,
+        args.index if os.path.exists(args.index) else None,
+        mode=args.mode,
+        output_dir=args.output_dir,
+        seconds=args.seconds or None,
+        f0_method=args.f0_method,
+        f0_cache_dir=args.f0_cache_dir,
+    )
+    print(f"{'mode':<6} {'load':>6} {'model':>7} {'total':>7}")
+    for name, run in summary["runs"].items():
+        print(f"{name:<6} {run['load_sec']:>6.1f} {run['model_sec']:>7.2f} {run['convert_sec']:>7.2f}")
+    print(
+        f"{summary['mode']} vs eager on {summary['seconds']:.0f}s: {summary['speedup']:.2f}x model speed, "
+        f"SNR {summary['snr_db']:.1f} dB, log-spectral distance {summary['lsd_db']:.2f} dB -> {args.output_dir}"
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
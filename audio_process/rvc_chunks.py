@@ -0,0 +1,192 @@
+import os
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import soundfile as sf
+
+import rvc_engine
+from rvc_engine import PEAK_LIMIT, SAMPLE_RATE
+
+logger = logging.getLogger(__name__)
+
+# 音量を見る単位 (10ms) と、無音探索でならす幅 (50ms)
+ENERGY_HOP = SAMPLE_RATE // 100
+ENERGY_SMOOTH_FRAMES = 5
+
+
+def find_split_points(audio, chunk_sec=30.0, search_sec=2.0):
+    """chunk_sec ごとの区切り位置を、前後 search_sec の中で最も静かな位置にずらして返す (16kHz のサンプル位置)"""
+    frames = len(audio) // ENERGY_HOP
+    step = max(1, int(chunk_sec * 100))
+    search = max(0, min(int(search_sec * 100), step // 2 - 1))
+    energy = np.square(audio[:frames * ENERGY_HOP]).reshape(frames, ENERGY_HOP).sum(axis=1)
+    energy = np.convolve(energy, np.ones(ENERGY_SMOOTH_FRAMES), mode="same")
+
+    points = []
+    # 最後のチャンクが短くなりすぎないよう、残りが半分を切ったら区切らない
+    for center in range(step, frames - step // 2, step):
+        lo, hi = max(1, center - search), min(frames - 1, center + search + 1)
+        points.append(int(lo + np.argmin(energy[lo:hi])) * ENERGY_HOP)
+    return points
+
+
+def plan_chunks(length, split_points, overlap):
+    """区切り位置の前後 overlap/2 ずつを重ねた、各チャンクの入力範囲 (start, end) を返す"""
+    bounds = [0] + list(split_points) + [length]
+    half = overlap // 2
+    return [
+        (max(0, bounds[i] - half), min(length, bounds[i + 1] + half))
+        for i in range(len(bounds) - 1)
+    ]
+
+
+def overlap_add(pieces):
+    """(変換済みチャンク, 次のチャンクと重なるサンプル数) を順に受け取り、
+    重なりを線形クロスフェードでつないだ出力ブロックを順に返す。
+
+    同じ声を同じモデルで変換した信号同士なので、相関がある前提で線形 (和が1) の窓を使う。
+    保持するのは重なり1つ分だけなので、入力の長さによらずメモリは一定。
+    """
+    tail = np.zeros(0, dtype=np.float32)
+    for piece, next_overlap in pieces:
+        n = min(len(tail), len(piece))
+        if n:
+            fade = np.linspace(0.0, 1.0, n + 2, dtype=np.float32)[1:-1]
+            piece = piece.copy()
+            piece[:n] = tail[:n] * (1 - fade) + piece[:n] * fade
+        keep = min(next_overlap, len(piece) - n)
+        yield piece[:len(piece) - keep]
+        tail = piece[len(piece) - keep:]
+    if len(tail):
+        yield tail
+
+
+def _init_worker(threads, preload):
+    """ワーカープロセスの初期化。preload のモデルは最初のチャンクを待たずに読み込む"""
+    import torch
+    torch.set_num_threads(threads)
+    for engine_options in preload:
+        rvc_engine.get_engine(**engine_options)
+
+
+def _warm_up():
+    return os.getpid()
+
+
+def _convert_chunk(engine_options, key, audio):
+    engine, load_sec = rvc_engine.get_engine(**engine_options)
+    # 正規化はチャンクごとではなく、つないだ後に全体で 1 回だけかける
+    return engine.tgt_sr, engine.convert(audio, key, normalize=False), load_sec
+
+
+def open_pool(workers, preload=()):
+    """チャンク変換用のプロセスプールを開く。
+
+    ワーカーは読み込んだモデルをプロセスが終わるまで保持するので、
+    プールを使い回せば2曲目以降はモデルの読み込みが発生しない。
+    preload を渡した場合は全ワーカーを起動して読み込み終わるまで待つ。
+    """
+    start = time.time()
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(threads, list(preload)),
+    )
+    if preload:
+        # spawn のプールは空きワーカーが無いときだけ新しく起動するので、同時に投げれば全員起動する
+        for future in [pool.submit(_warm_up) for _ in range(workers)]:
+            future.result()
+        logger.info(f"RVC pool ready: {workers} workers, models preloaded in {time.time() - start:.1f}s")
+    return pool
+
+
+def _convert_in_order(audio, chunks, engine_options, workers, key, pool=None):
+    """チャンクを変換し、(tgt_sr, 変換結果, モデル読み込み秒数) を入力順に返す。
+
+    同時に抱える結果は workers*2 個まで。pool を渡さなければこの呼び出しの間だけプールを開く。
+    """
+    if workers <= 1:
+        for start, end in chunks:
+            yield _convert_chunk(engine_options, f"{key}:{start}", audio[start:end])
+        return
+
+    own_pool = pool is None
+    if own_pool:
+        pool = open_pool(workers)
+    try:
+        pending = deque()
+        for start, end in chunks:
+            pending.append(pool.submit(_convert_chunk, engine_options, f"{key}:{start}", audio[start:end]))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        if own_pool:
+            pool.shutdown(cancel_futures=True)
+
+
+def _fit_length(piece, length):
+    if len(piece) >= length:
+        return piece[:length]
+    return np.pad(piece, (0, length - len(piece)))
+
+
+def convert_file(input_path, output_path, engine_options, workers=1, chunk_sec=30.0, overlap_sec=1.0, search_sec=2.0, pool=None, stats=None):
+    """ボーカルをチャンクに分けて RVC 変換し、重なりをクロスフェードしながら output_path に書き出す。
+
+    engine_options は rvc_engine.get_engine の引数 (ワーカーに渡すので pickle できる値のみ)。
+    pool: open_pool で開いたプール (使い回す場合)。stats: 渡すと "load_sec" にモデル読み込み時間を足す。
+    モデルの中間特徴と変換結果はチャンク単位でしか持たないので、その分のメモリは曲の長さに依存しない。
+    入力は全体を 16kHz モノラル float32 (1分あたり約 4MB) で読み込む (ピークの正規化に全体が要るため)。
+    Pipeline の出力クリップ防止 (ピーク 0.99 超で全体を縮める) はチャンクごとには行わず、
+    つないだ結果を float の一時ファイルに書いてから、一括変換と同じく全体に 1 つの倍率でかける。
+    """
+    audio = rvc_engine.load_vocals(input_path)
+    chunks = plan_chunks(len(audio), find_split_points(audio, chunk_sec, search_sec), int(overlap_sec * SAMPLE_RATE))
+    logger.info(f"RVC chunked inference: {len(chunks)} chunks, {workers} workers")
+
+    float_path = f"{output_path}.{os.getpid()}.float.wav"
+    out = None
+    peak = 0.0
+    try:
+        results = _convert_in_order(audio, chunks, engine_options, workers, os.path.abspath(input_path), pool)
+
+        def pieces():
+            nonlocal out
+            for i, (tgt_sr, piece, load_sec) in enumerate(results):
+                if stats is not None:
+                    stats["load_sec"] = stats.get("load_sec", 0.0) + load_sec
+                if out is None:
+                    out = sf.SoundFile(float_path, "w", samplerate=tgt_sr, channels=1, subtype="FLOAT")
+                start, end = chunks[i]
+                to_out = lambda pos: round(pos * tgt_sr / SAMPLE_RATE)
+                next_overlap = to_out(end) - to_out(chunks[i + 1][0]) if i + 1 < len(chunks) else 0
+                yield _fit_length(piece, to_out(end) - to_out(start)), next_overlap
+                logger.info(f"RVC chunk {i + 1}/{len(chunks)} done")
+
+        for block in overlap_add(pieces()):
+            if len(block):
+                peak = max(peak, float(np.abs(block).max()))
+            out.write(block)
+        out.close()
+        _write_pcm16(float_path, output_path, gain=PEAK_LIMIT / peak if peak > PEAK_LIMIT else 1.0)
+    finally:
+        if out is not None:
+            out.close()
+        if os.path.exists(float_path):
+            os.remove(float_path)
+    return output_path
+
+
+def _write_pcm16(float_path, output_path, gain=1.0, blocksize=SAMPLE_RATE * 10):
+    """float の wav を gain 倍して 16bit の wav に書き出す (blocksize ずつ読むのでメモリは一定)"""
+    with sf.SoundFile(float_path) as src, sf.SoundFile(output_path, "w", samplerate=src.samplerate, channels=1, subtype="PCM_16") as dst:
+        for block in src.blocks(blocksize, dtype="float32"):
+            dst.write(np.clip(np.round(block * gain * 32768), -32768, 32767).astype(np.int16))
@@ -0,0 +1,204 @@
+import os
+import logging
+import numpy as np
+
+# PyTorch 2.6+ のセーフガード（weights_only=True）による互換性問題を解決
+# (torch が無い環境でもチャンク分割などは使えるよう、import できなければ何もしない)
+try:
+    import torch
+    from fairseq.data.dictionary import Dictionary
+    if hasattr(torch.serialization, 'add_safe_globals'):
+        torch.serialization.add_safe_globals([Dictionary])
+except ImportError:
+    pass
+
+try:
+    from rvc_python.infer import RVCInference
+    from rvc_python.lib.audio import load_audio
+    from rvc_python.modules.vc.utils import load_hubert
+except ImportError:
+    RVCInference = None
+
+from f0_engines import F0Cache, F0Extractor, f0_to_coarse
+import model_store
+import rvc_accel
+import rvc_index
+
+logger = logging.getLogger(__name__)
+
+# HuBERT / F0 推定の入力サンプリングレート
+SAMPLE_RATE = 16000
+# Pipeline は出力のピークがこれを超えると全体を縮めてから int16 にする
+PEAK_LIMIT = 0.99
+
+
+def _require_rvc_python():
+    # load_audio / load_hubert は rvc_python が import できたときだけ定義される
+    if not RVCInference:
+        raise ImportError("rvc-python is not installed.")
+
+
+def load_vocals(input_path):
+    """vc_single と同じ手順で 16kHz モノラルに読み込み、ピークを 0.95 に揃える"""
+    _require_rvc_python()
+    audio = load_audio(input_path, SAMPLE_RATE)
+    audio_max = np.abs(audio).max() / 0.95
+    if audio_max > 1:
+        audio /= audio_max
+    return audio
+
+
+class RVCEngine:
+    """RVC モデルを一度だけ読み込み、16kHz の音声配列をそのまま変換する。
+
+    vc_single はファイルパスしか受け取らないので、内部の Pipeline を直接呼ぶ。
+    変換パラメータは set_params で差し替えられるので、読み込んだモデルは複数のジョブで使い回せる。
+    times には呼び出しごとの処理時間 [特徴抽出+検索, F0, 合成] を積算する。
+    accel が "int8" なら声モデルと HuBERT を rvc_accel で量子化したものに差し替える。
+    """
+
+    def __init__(self, model_pth, index_file=None, accel=None, **params):
+        _require_rvc_python()
+
+        # index を変換ごとに読み直さず、変換済みの index があればそれを使う
+        rvc_index.install()
+        # モデル読み込み時の weights_only 問題を解決するための環境変数設定 (念のため)
+        os.environ["TORCH_LOAD_WEIGHTS_ONLY"] = "0"
+
+        with model_store.measure(f"RVC model {os.path.basename(model_pth)}") as report:
+            self.rvc = RVCInference(device="cpu")
+            self.rvc.load_model(model_pth, version="v2", index_path=index_file or "")
+            vc = self.rvc.vc
+            # HuBERT も vc_single 任せにせず読み込み時間に含める
+            vc.hubert_model = load_hubert(vc.config, vc.lib_dir)
+            hubert_path = os.path.join(vc.lib_dir, "base_model", "hubert_base.pt")
+            # 重みをファイルのメモリマップに差し替え、並列ワーカー間でページを共有する
+            report["mapped_mb"] = (
+                model_store.map_weights(vc.net_g, model_pth, "weight")
+                + model_store.map_weights(vc.hubert_model, hubert_path, "model")
+            ) / model_store.MB
+            # 変換済みの HuBERT も声モデルの隣に置く (rvc_python のパッケージ内には書けないことがある)
+            vc.net_g = rvc_accel.accelerate(vc.net_g, model_pth, accel)
+            vc.hubert_model = rvc_accel.accelerate(vc.hubert_model, hubert_path, accel, os.path.dirname(model_pth))
+        self.accel = accel or "eager"
+        self.load_report = report
+        self.load_sec = report["sec"]
+
+        # vc_single と同じく、学習途中の index 名は added 側に読み替える
+        self.file_index = (index_file or "").strip().replace("trained", "added")
+        self.times = [0.0, 0.0, 0.0]
+        self.f0 = None
+        # convert 中だけ、Pipeline.vc が返した区間ごとの出力のピークを入れる
+        self._peaks = None
+        self._wrap_get_f0()
+        self._wrap_vc()
+        self.set_params(**params)
+
+    @property
+    def f0_cache(self):
+        return self.f0.cache if self.f0 else None
+
+    def set_params(self, f0_method="crepe", protect=0.33, pitch_shift=0, index_rate=0.6, f0_fallback=(), f0_cache_dir=None):
+        """f0_fallback: f0_method が失敗したときに順に試す F0 エンジン (失敗した窓ごとに切り替わる)"""
+        self.rvc.set_params(
+            f0method=f0_method,
+            f0up_key=pitch_shift,
+            index_rate=index_rate,
+            protect=protect
+        )
+        cache = self.f0_cache
+        if not f0_cache_dir:
+            cache = None
+        elif cache is None or cache.cache_dir != f0_cache_dir:
+            cache = F0Cache(f0_cache_dir)
+        self.f0 = F0Extractor(self.rvc.vc.pipeline, [f0_method, *f0_fallback], cache)
+
+    def _wrap_get_f0(self):
+        """Pipeline.get_f0 を F0Extractor (キャッシュとエンジンの切り替え) に差し替える。vc_single 経由の変換にも効く"""
+        pipeline = self.rvc.vc.pipeline
+        extract = pipeline.get_f0
+
+        def get_f0(input_audio_path, x, p_len, f0_up_key, f0_method, filter_radius, inp_f0=None):
+            if inp_f0 is not None:
+                return extract(input_audio_path, x, p_len, f0_up_key, f0_method, filter_radius, inp_f0)
+            f0 = self.f0(x, p_len, filter_radius)
+            return f0_to_coarse(f0 * pow(2, f0_up_key / 12))
+
+        pipeline.get_f0 = get_f0
+
+    def _wrap_vc(self):
+        """Pipeline.vc を包み、Pipeline.pipeline が使う区間 (前後の t_pad_tgt を除く) のピークを記録する"""
+        pipeline = self.rvc.vc.pipeline
+        infer = pipeline.vc
+
+        def vc(*args, **kwargs):
+            audio = infer(*args, **kwargs)
+            if self._peaks is not None:
+                used = audio[pipeline.t_pad_tgt:len(audio) - pipeline.t_pad_tgt]
+                self._peaks.append(float(np.abs(used).max()) if len(used) else 0.0)
+            return audio
+
+        pipeline.vc = vc
+
+    @property
+    def tgt_sr(self):
+        return self.rvc.vc.tgt_sr
+
+    def convert(self, audio, key="audio", normalize=True):
+        """16kHz の float 配列を変換し、tgt_sr の float32 配列を返す。key は Pipeline に渡す入力名。
+
+        normalize=False なら Pipeline のピークの正規化を戻す (ピークは 1 を超えうる)。
+        チャンク変換で、チャンクごとに違う倍率で縮められないようにするため。
+        """
+        vc = self.rvc.vc
+        self._peaks = []
+        try:
+            result = vc.pipeline.pipeline(
+                vc.hubert_model,
+                vc.net_g,
+                0,
+                audio,
+                key,
+                self.times,
+                int(self.rvc.f0up_key),
+                self.rvc.f0method,
+                self.file_index,
+                self.rvc.index_rate,
+                vc.if_f0,
+                self.rvc.filter_radius,
+                vc.tgt_sr,
+                self.rvc.resample_sr,
+                self.rvc.rms_mix_rate,
+                vc.version,
+                self.rvc.protect,
+            )
+        finally:
+            peaks, self._peaks = self._peaks, None
+        result = result.astype(np.float32) / 32768
+        peak = max(peaks, default=0.0)
+        if normalize or peak <= PEAK_LIMIT:
+            return result
+        # 音量の合わせ込みやリサンプルが入るとピークが区間の出力から変わるので戻せない
+        if self.rvc.rms_mix_rate != 1 or vc.tgt_sr != self.rvc.resample_sr >= 16000:
+            logger.warning("Cannot undo the RVC output normalization with rms_mix_rate or resample_sr set")
+            return result
+        return result * (peak / PEAK_LIMIT)
+
+
+_engines = {}
+
+
+def get_engine(model_pth, index_file=None, accel=None, **params):
+    """プロセス内で読み込み済みのエンジンを (モデル, index, accel) ごとに使い回す。
+
+    (engine, このとき読み込みにかかった秒数) を返す。読み込み済みなら 0。
+    """
+    key = (os.path.abspath(model_pth), index_file or "", accel or "eager")
+    loaded = 0.0
+    if key not in _engines:
+        _engines[key] = RVCEngine(model_pth, index_file, accel)
+        loaded = _engines[key].load_sec
+        logger.info(f"RVC model loaded in {loaded:.1f}s: {model_pth}")
+    engine = _engines[key]
+    engine.set_params(**params)
+    return engine, loaded
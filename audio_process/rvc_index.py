@@ -0,0 +1,270 @@
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:
+    faiss = None
+
+logger = logging.getLogger(__name__)
+
+# HuBERT の特徴は 20ms ごと (16kHz で 320 サンプル) なので、音声1秒あたり 50 回検索する
+FRAMES_PER_SEC = 50
+# Pipeline.vc と同じ近傍数
+K = 8
+# 調整で試す検索パラメータ。IVF は nprobe、HNSW は efSearch
+NPROBES = (1, 2, 4, 8, 16, 32)
+EF_SEARCHES = (16, 32, 64, 128)
+HNSW_M = 32
+# 厳密な検索の上位 K 件のうち、この割合以上を返せるものの中から最速のものを選ぶ
+MIN_RECALL = 0.9
+# 計測に使う問い合わせの長さ (音声の秒数) と回数 (最速の回を使う)
+BENCH_SEC = 30
+BENCH_REPEATS = 3
+
+
+def tuned_paths(index_path):
+    """zundamon.index -> (zundamon.tuned.index, zundamon.tuned.json)"""
+    stem = os.path.splitext(index_path)[0]
+    return f"{stem}.tuned.index", f"{stem}.tuned.json"
+
+
+def _source_stamp(index_path):
+    stat = os.stat(index_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def tuned_index(index_path):
+    """index_path を変換したものがあり、元のファイルから作り直されていなければそのパス"""
+    path, meta_path = tuned_paths(index_path)
+    meta = _load_json(meta_path)
+    if meta and os.path.exists(path) and os.path.exists(index_path) and meta.get("source") == _source_stamp(index_path):
+        return path
+    return None
+
+
+def _set_params(index, params):
+    space = faiss.ParameterSpace()
+    for name, value in params.items():
+        space.set_index_parameter(index, name, value)
+
+
+def _vectors(index):
+    """index に入っている特徴 (Pipeline の big_npy と同じもの)"""
+    try:
+        return index.reconstruct_n(0, index.ntotal)
+    except RuntimeError:
+        # IVF は id -> リストの対応表が無いと reconstruct できない
+        faiss.extract_index_ivf(index).make_direct_map()
+        return index.reconstruct_n(0, index.ntotal)
+
+
+class LoadedIndex:
+    """読み込み済みの index と big_npy。Pipeline が使う search / reconstruct_n / ntotal だけを持つ"""
+
+    def __init__(self, index, vectors):
+        self.index = index
+        self.vectors = vectors
+        self.ntotal = index.ntotal
+
+    def search(self, x, k):
+        return self.index.search(x, k)
+
+    def reconstruct_n(self, start, n):
+        return self.vectors[start:start + n]
+
+
+class CachedFaiss:
+    """rvc_python の pipeline モジュールが参照する faiss の代わり。
+
+    Pipeline.pipeline は呼ばれるたびに index を読み直して全特徴を reconstruct するので、
+    チャンクに分けて変換すると同じ処理を何度も繰り返す。read_index を読み込み済みのもので返し、
+    変換済みの index (tune で作ったもの) があればそちらを検索パラメータを設定して使う。
+    """
+
+    def __init__(self, module):
+        self._faiss = module
+        self._loaded = {}
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self._faiss, name)
+
+    def read_index(self, path, *args):
+        with self._lock:
+            stamp = _source_stamp(path)
+            cached = self._loaded.get(path)
+            if cached is None or cached[0] != stamp:
+                cached = (stamp, load(path))
+                self._loaded[path] = cached
+            return cached[1]
+
+
+def load(index_path):
+    """index_path を読み込む。変換済みのものがあればそちらを使う"""
+    start = time.time()
+    path = tuned_index(index_path)
+    if path:
+        index = faiss.read_index(path)
+        meta = _load_json(tuned_paths(index_path)[1])
+        _set_params(index, meta["params"])
+        logger.info(f"Using tuned retrieval index {os.path.basename(path)} ({meta['kind']}, {meta['params']})")
+    else:
+        index = faiss.read_index(index_path)
+    loaded = LoadedIndex(index, _vectors(index))
+    logger.info(f"Retrieval index loaded in {time.time() - start:.1f}s: {loaded.ntotal} vectors")
+    return loaded
+
+
+def install(pipeline_module_name="rvc_python.modules.vc.pipeline"):
+    """rvc_python の Pipeline が使う faiss を CachedFaiss に差し替える (何度呼んでもよい)"""
+    module = sys.modules.get(pipeline_module_name)
+    if faiss is None or module is None or isinstance(module.faiss, CachedFaiss):
+        return
+    module.faiss = CachedFaiss(module.faiss)
+
+
+def _queries(vectors, n, seed=0):
+    """計測用の問い合わせ。index の特徴に特徴ごとの標準偏差の 1 割のノイズを足したもの
+
+    (変換時の問い合わせは声の特徴なので index の中身と同じ分布だが、完全には一致しない)。
+    """
+    rng = np.random.default_rng(seed)
+    picked = vectors[rng.integers(0, len(vectors), n)]
+    noise = rng.standard_normal(picked.shape).astype(np.float32) * vectors.std(axis=0) * 0.1
+    return np.ascontiguousarray(picked + noise, dtype=np.float32)
+
+
+def _measure(index, queries, truth, params):
+    _set_params(index, params)
+    index.search(queries[:FRAMES_PER_SEC], K)
+    elapsed = float("inf")
+    for _ in range(BENCH_REPEATS):
+        start = time.perf_counter()
+        _, ix = index.search(queries, K)
+        elapsed = min(elapsed, time.perf_counter() - start)
+    recall = np.mean([len(np.intersect1d(a, b)) / K for a, b in zip(ix, truth)])
+    return {
+        "params": params,
+        "ms_per_audio_sec": elapsed / (len(queries) / FRAMES_PER_SEC) * 1000,
+        "recall": float(recall),
+    }
+
+
+def _candidates(original, vectors):
+    """(種類, index, 試すパラメータのリスト)"""
+    d = vectors.shape[1]
+    yield "original", original, [{"nprobe": p} for p in NPROBES] if _is_ivf(original) else [{}]
+
+    nlist = max(1, min(int(4 * np.sqrt(len(vectors))), len(vectors) // 39))
+    ivf = faiss.index_factory(d, f"IVF{nlist},Flat")
+    ivf.train(vectors)
+    ivf.add(vectors)
+    yield f"IVF{nlist},Flat", ivf, [{"nprobe": p} for p in NPROBES if p <= nlist]
+
+    hnsw = faiss.IndexHNSWFlat(d, HNSW_M)
+    hnsw.add(vectors)
+    yield f"HNSW{HNSW_M},Flat", hnsw, [{"efSearch": ef} for ef in EF_SEARCHES]
+
+
+def _is_ivf(index):
+    try:
+        faiss.extract_index_ivf(index)
+        return True
+    except RuntimeError:
+        return False
+
+
+def tune(index_path, min_recall=MIN_RECALL):
+    """index_path から CPU で速い index を作って隣に保存し、計測結果を返す。
+
+    元の index (rvc_python は読み込んだままの nprobe=1 で使う)、作り直した IVF、HNSW について
+    検索パラメータを変えながら音声1秒あたりの検索時間と、厳密な検索に対する recall@8 を測り、
+    min_recall 以上のものの中で最速のものを選ぶ。
+    """
+    if faiss is None:
+        raise ImportError("faiss is not installed.")
+    start = time.time()
+    original = faiss.read_index(index_path)
+    vectors = _vectors(original)
+    load_sec = time.time() - start
+
+    queries = _queries(vectors, BENCH_SEC * FRAMES_PER_SEC)
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, K)
+
+    results = []
+    built = {}
+    for kind, index, param_grid in _candidates(original, vectors):
+        built[kind] = index
+        for params in param_grid:
+            row = {"kind": kind, **_measure(index, queries, truth, params)}
+            results.append(row)
+            logger.info(f"{kind} {params}: {row['ms_per_audio_sec']:.2f} ms per audio second, recall@{K} {row['recall']:.3f}")
+
+    # rvc_python がそのまま使った場合 (read_index 直後のパラメータ)
+    before = results[0]
+    accepted = [row for row in results if row["recall"] >= min_recall] or [max(results, key=lambda r: r["recall"])]
+    best = min(accepted, key=lambda r: r["ms_per_audio_sec"])
+
+    path, meta_path = tuned_paths(index_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    faiss.write_index(built[best["kind"]], tmp_path)
+    os.replace(tmp_path, path)
+    meta = {
+        "source": _source_stamp(index_path),
+        "kind": best["kind"],
+        "params": best["params"],
+        "min_recall": min_recall,
+        "load_sec": load_sec,
+        "before": before,
+        "after": best,
+        "results": results,
+    }
+    tmp_path = meta_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp_path, meta_path)
+    return meta
+
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Build a CPU-tuned copy of an RVC retrieval index and report search time")
+    parser.add_argument("index", nargs="?", default=os.path.join(base_dir, "models", "zundamon.index"))
+    parser.add_argument("--min-recall", type=float, default=MIN_RECALL)
+    args = parser.parse_args()
+
+    meta = tune(args.index, args.min_recall)
+    print(f"{'kind':<16} {'params':<18} {'ms/s':>7} {'recall':>7}")
+    for row in meta["results"]:
+        mark = " *" if row is meta["after"] else ""
+        params = ",".join(f"{k}={v}" for k, v in row["params"].items()) or "-"
+        print(f"{row['kind']:<16} {params:<18} {row['ms_per_audio_sec']:>7.2f} {row['recall']:>7.3f}{mark}")
+    before, after = meta["before"], meta["after"]
+    print(
+        f"Retrieval per audio second: {before['ms_per_audio_sec']:.2f} ms -> {after['ms_per_audio_sec']:.2f} ms "
+        f"(recall@{K} {before['recall']:.3f} -> {after['recall']:.3f}); saved {tuned_paths(args.index)[0]}"
+    )
+    print(f"Index load + reconstruct: {meta['load_sec']:.2f}s, now once per process instead of once per conversion call")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
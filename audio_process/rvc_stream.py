@@ -0,0 +1,271 @@
+import os
+import sys
+import time
+import queue
+import logging
+import argparse
+import threading
+
+import numpy as np
+import soundfile as sf
+
+import rvc_engine
+from rvc_engine import SAMPLE_RATE
+from rvc_chunks import _fit_length
+
+logger = logging.getLogger(__name__)
+
+# 入力を読む単位 (10ms)。先読みの待ち時間がこれより粗くならないように小さく取る
+FRAME_LEN = SAMPLE_RATE // 100
+# 入力から出力までの遅れの目標。block_sec + lookahead_sec (0.7s) に変換 1 ブロック分ほどの余裕を足したもの
+DEFAULT_TARGET_LATENCY_SEC = 1.5
+
+
+def file_source(path, realtime=True):
+    """ファイルを 16kHz モノラルで FRAME_LEN ずつ返す。realtime なら実際の再生速度で返す (ライブ入力の模擬)"""
+    audio = rvc_engine.load_vocals(path)
+    start = time.perf_counter()
+    for pos in range(0, len(audio), FRAME_LEN):
+        frame = audio[pos:pos + FRAME_LEN]
+        if realtime:
+            delay = start + (pos + len(frame)) / SAMPLE_RATE - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield frame
+
+
+def pipe_source(stream):
+    """16kHz モノラル s16le の生 PCM を読めた分ずつ返す (例: ffmpeg -f s16le -ar 16000 -ac 1 -)"""
+    pending = b""
+    while True:
+        data = stream.read1(FRAME_LEN * 2) if hasattr(stream, "read1") else stream.read(FRAME_LEN * 2)
+        if not data:
+            break
+        data = pending + data
+        usable = len(data) - len(data) % 2
+        pending = data[usable:]
+        if usable:
+            yield np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768
+
+
+class WavSink:
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def write(self, block, sr):
+        if self._file is None:
+            self._file = sf.SoundFile(self.path, "w", samplerate=sr, channels=1, subtype="PCM_16")
+        self._file.write(np.clip(np.round(block * 32768), -32768, 32767).astype(np.int16))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class PipeSink:
+    """tgt_sr モノラル s16le の生 PCM を書き出す (例: | ffplay -f s16le -ar 40000 -ac 1 -)"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, block, sr):
+        self.stream.write(np.clip(np.round(block * 32768), -32768, 32767).astype("<i2").tobytes())
+        self.stream.flush()
+
+    def close(self):
+        self.stream.flush()
+
+
+class StreamConverter:
+    """入力を block_sec ごとに RVC 変換して sink に書き出す。
+
+    各ブロックは前の context_sec と後ろの lookahead_sec を付けて変換し、ブロックの部分だけを使う
+    (RVC は入力の端で特徴や F0 が崩れるので)。つなぎ目は先読みの中の crossfade_sec で重ねる。
+    入力の遅れは block_sec + lookahead_sec + 変換時間。各ブロックは入力から target_latency_sec 後に出力し、
+    変換を始める時点で既に期限を過ぎたブロックは変換せずに無音にする (dropped)。変換が実時間に
+    追いつかなくても滞留した入力を捨てるので、遅れは target_latency_sec + 1 ブロックの変換時間を超えない。
+    変換したのに間に合わなかったブロックは late として数える。
+    target_latency_sec=None なら待ちも間引きもせず、遅れに上限はない (計測用)。
+    """
+
+    def __init__(self, engine, block_sec=0.5, context_sec=1.0, lookahead_sec=0.2, crossfade_sec=0.05,
+                 target_latency_sec=DEFAULT_TARGET_LATENCY_SEC):
+        if crossfade_sec > lookahead_sec:
+            raise ValueError("crossfade_sec must not exceed lookahead_sec")
+        self.engine = engine
+        self.block = int(block_sec * SAMPLE_RATE)
+        self.context = int(context_sec * SAMPLE_RATE)
+        self.lookahead = int(lookahead_sec * SAMPLE_RATE)
+        self.crossfade_sec = crossfade_sec
+        self.target_latency_sec = target_latency_sec
+        self.stats = {}
+
+    def _read(self, source, frames):
+        """source を別スレッドで読み、(フレーム, 最後のサンプルが届いた時刻) を frames に入れる。終わりは None"""
+        try:
+            for frame in source:
+                frames.put((frame, time.perf_counter()))
+        finally:
+            frames.put(None)
+
+    def run(self, source, sink):
+        frames = queue.Queue()
+        reader = threading.Thread(target=self._read, args=(source, frames), daemon=True)
+        reader.start()
+
+        tgt_sr = self.engine.tgt_sr
+        to_out = lambda n: round(n * tgt_sr / SAMPLE_RATE)
+        crossfade = to_out(int(self.crossfade_sec * SAMPLE_RATE))
+        fade = np.linspace(0.0, 1.0, crossfade + 2, dtype=np.float32)[1:-1]
+
+        # audio[0] は入力全体の base 番目のサンプル。context より前は捨てる
+        audio = np.zeros(0, dtype=np.float32)
+        base = 0
+        # (フレームの先頭の入力位置, そのサンプルが届いた時刻)。ブロックの先頭がいつ届いたかを引くのに使う
+        arrivals = []
+        next_out = 0
+        tail = np.zeros(0, dtype=np.float32)
+        latencies, process_secs = [], []
+        late = dropped = 0
+        done = False
+        started = time.perf_counter()
+
+        while True:
+            received = base + len(audio)
+            if not done and received < next_out + self.block + self.lookahead:
+                item = frames.get()
+                if item is None:
+                    done = True
+                else:
+                    frame, arrived = item
+                    arrivals.append((received, arrived - len(frame) / SAMPLE_RATE))
+                    audio = np.concatenate((audio, frame))
+                continue
+            if next_out >= received:
+                break
+
+            block_end = min(next_out + self.block, received)
+            start, end = max(base, next_out - self.context), min(received, block_end + self.lookahead)
+            while len(arrivals) > 1 and arrivals[1][0] <= next_out:
+                arrivals.pop(0)
+            first_arrival = arrivals[0][1] + (next_out - arrivals[0][0]) / SAMPLE_RATE
+            deadline = None if self.target_latency_sec is None else first_arrival + self.target_latency_sec
+            if deadline is not None and time.perf_counter() > deadline:
+                # もう間に合わないので変換せず無音にする (つなぎ目は前のブロックからのクロスフェードで消える)
+                converted = np.zeros(to_out(end - start), dtype=np.float32)
+                dropped += 1
+            else:
+                t0 = time.perf_counter()
+                converted = _fit_length(self.engine.convert(audio[start - base:end - base], f"stream:{next_out}"), to_out(end - start))
+                process_secs.append(time.perf_counter() - t0)
+
+            # ブロックの部分と、その後ろの crossfade 分 (次のブロックの頭と重ねる)
+            head = to_out(next_out - start)
+            piece = converted[head:head + to_out(block_end - next_out) + (crossfade if block_end < received else 0)]
+            n = min(len(tail), len(piece))
+            if n:
+                piece = piece.copy()
+                piece[:n] = tail[:n] * (1 - fade[:n]) + piece[:n] * fade[:n]
+            keep = crossfade if block_end < received else 0
+            out, tail = piece[:len(piece) - keep], piece[len(piece) - keep:]
+
+            if deadline is not None:
+                delay = deadline - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                elif delay < 0:
+                    late += 1
+            sink.write(out, tgt_sr)
+            latencies.append(time.perf_counter() - first_arrival)
+
+            next_out = block_end
+            drop = max(0, next_out - self.context) - base
+            if drop > 0:
+                audio, base = audio[drop:], base + drop
+
+        sink.close()
+        audio_sec = next_out / SAMPLE_RATE
+        rtf = np.array(process_secs) / (self.block / SAMPLE_RATE) if process_secs else np.zeros(1)
+        latency_ms = np.array(latencies or [0.0]) * 1000
+        latency = {f"p{p}": float(np.percentile(latency_ms, p)) for p in (50, 90, 95, 99)}
+        latency["max"] = float(latency_ms.max())
+        self.stats = {
+            "blocks": len(process_secs),
+            "audio_sec": audio_sec,
+            "wall_sec": time.perf_counter() - started,
+            "rtf": sum(process_secs) / audio_sec if audio_sec else 0.0,
+            "rtf_p95": float(np.percentile(rtf, 95)),
+            "latency_ms": latency,
+            "late_blocks": late,
+            "dropped_blocks": dropped,
+        }
+        return self.stats
+
+
+def report(stats, file=sys.stdout):
+    lat = stats["latency_ms"]
+    print(
+        f"{stats['blocks']} blocks, {stats['audio_sec']:.1f}s of audio in {stats['wall_sec']:.1f}s: "
+        f"RTF {stats['rtf']:.2f} (p95 block {stats['rtf_p95']:.2f})",
+        file=file,
+    )
+    print(
+        f"Latency ms: p50 {lat['p50']:.0f}, p90 {lat['p90']:.0f}, p95 {lat['p95']:.0f}, p99 {lat['p99']:.0f}, "
+        f"max {lat['max']:.0f}; late blocks {stats['late_blocks']}, dropped blocks {stats['dropped_blocks']}",
+        file=file,
+    )
+    keeps_up = stats["rtf_p95"] < 1.0
+    print(f"{'Keeps up' if keeps_up else 'Does NOT keep up'} with real time at this block size", file=file)
+
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Stream audio through the RVC voice block by block and report RTF and latency")
+    parser.add_argument("input", help="Input audio file, or - for 16kHz mono s16le on stdin")
+    parser.add_argument("output", help="Output wav, or - for mono s16le at the model rate on stdout")
+    parser.add_argument("--block-sec", type=float, default=0.5)
+    parser.add_argument("--context-sec", type=float, default=1.0)
+    parser.add_argument("--lookahead-sec", type=float, default=0.2)
+    parser.add_argument("--crossfade-sec", type=float, default=0.05)
+    parser.add_argument(
+        "--target-latency-sec",
+        type=float,
+        default=DEFAULT_TARGET_LATENCY_SEC,
+        help="Emit every block this long after its input arrived; blocks that cannot make it are replaced with silence. "
+        "0 disables the bound (latency then grows while conversion is slower than real time)",
+    )
+    parser.add_argument("--f0-method", default="pm", help="F0 engine per block (crepe is usually too slow for real time)")
+    parser.add_argument("--pitch-shift", type=int, default=0)
+    parser.add_argument("--no-realtime", action="store_true", help="Read an input file as fast as possible instead of at playback speed")
+    args = parser.parse_args()
+
+    from main import AudioProcessor, DEFAULT_RVC_MODEL, configure
+    processor = AudioProcessor(base_dir)
+    configure(processor)
+    model_pth, model_index = processor.model_paths(DEFAULT_RVC_MODEL)
+    processor.download_file(DEFAULT_RVC_MODEL["pth_url"], model_pth, DEFAULT_RVC_MODEL.get("pth_sha256"))
+    processor.download_file(DEFAULT_RVC_MODEL["index_url"], model_index, DEFAULT_RVC_MODEL.get("index_sha256"))
+
+    source = pipe_source(sys.stdin.buffer) if args.input == "-" else file_source(args.input, realtime=not args.no_realtime)
+    sink = PipeSink(sys.stdout.buffer) if args.output == "-" else WavSink(args.output)
+    stats = processor.phase3_rvc_stream(
+        source,
+        sink,
+        model_pth,
+        model_index,
+        f0_method=args.f0_method,
+        pitch_shift=args.pitch_shift,
+        block_sec=args.block_sec,
+        context_sec=args.context_sec,
+        lookahead_sec=args.lookahead_sec,
+        crossfade_sec=args.crossfade_sec,
+        target_latency_sec=args.target_latency_sec or None,
+    )
+    # 出力が stdout のときは音声と混ざらないよう stderr に出す
+    report(stats, file=sys.stderr if args.output == "-" else sys.stdout)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,153 @@
+import os
+import json
+import time
+import logging
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from scipy.io import wavfile
+
+import rvc_engine
+
+logger = logging.getLogger(__name__)
+
+_audio = None
+_audio_key = None
+
+
+def _init_worker(threads, vocals_path):
+    global _audio, _audio_key
+    import torch
+    torch.set_num_threads(threads)
+    _audio = rvc_engine.load_vocals(vocals_path)
+    _audio_key = os.path.abspath(vocals_path)
+
+
+def _render(engine_options, output_path):
+    """1つのパラメータの組み合わせで変換して書き出す。(出力, 変換秒数, F0 キャッシュヒット数) を返す"""
+    engine, load_sec = rvc_engine.get_engine(**engine_options)
+    hits = engine.f0_cache.hits if engine.f0_cache else 0
+    start = time.time()
+    converted = engine.convert(_audio, _audio_key)
+    wavfile.write(output_path, engine.tgt_sr, np.clip(np.round(converted * 32768), -32768, 32767).astype(np.int16))
+    elapsed = time.time() - start
+    return output_path, elapsed, load_sec, (engine.f0_cache.hits - hits) if engine.f0_cache else 0
+
+
+def variant_name(stem, pitch_shift, protect, index_rate):
+    return f"{stem}_shift{pitch_shift:+d}_protect{protect:g}_index{index_rate:g}.wav"
+
+
+def run_sweep(vocals_path, model_pth, index_file, output_dir, pitch_shifts=(0,), protects=(0.33,), index_rates=(0.6,),
+              f0_method="crepe", f0_cache_dir=None, workers=2):
+    """pitch_shift × protect × index_rate の全組み合わせを並列に変換する。
+
+    F0 は組み合わせによらず同じなので、最初の1つだけを先に変換して F0 キャッシュを作り、
+    残りはキャッシュを読むだけにする。各ワーカーはモデルを1回だけ読み込む。
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(vocals_path))[0]
+    grid = list(itertools.product(pitch_shifts, protects, index_rates))
+    jobs = []
+    for pitch_shift, protect, index_rate in grid:
+        options = dict(
+            model_pth=model_pth,
+            index_file=index_file,
+            f0_method=f0_method,
+            protect=protect,
+            pitch_shift=int(pitch_shift),
+            index_rate=index_rate,
+            f0_cache_dir=f0_cache_dir
+        )
+        jobs.append((options, os.path.join(output_dir, variant_name(stem, int(pitch_shift), protect, index_rate))))
+
+    workers = max(1, min(workers, len(jobs)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    results = []
+    start = time.time()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(threads, vocals_path),
+    ) as pool:
+        first = pool.submit(_render, *jobs[0]).result()
+        results.append(first)
+        logger.info(f"First variant (F0 extraction included) took {first[1]:.1f}s")
+        futures = [pool.submit(_render, *job) for job in jobs[1:]]
+        for future in as_completed(futures):
+            results.append(future.result())
+            logger.info(f"[{len(results)}/{len(jobs)}] {os.path.basename(results[-1][0])}: {results[-1][1]:.1f}s")
+
+    by_path = {path: (elapsed, load_sec, f0_hits) for path, elapsed, load_sec, f0_hits in results}
+    summary = {
+        "vocals": os.path.abspath(vocals_path),
+        "model": os.path.abspath(model_pth),
+        "f0_method": f0_method,
+        "workers": workers,
+        "wall_sec": time.time() - start,
+        "variants": [
+            {
+                "pitch_shift": options["pitch_shift"],
+                "protect": options["protect"],
+                "index_rate": options["index_rate"],
+                "output": output_path,
+                "convert_sec": by_path[output_path][0],
+                "model_load_sec": by_path[output_path][1],
+                "f0_cache_hits": by_path[output_path][2],
+            }
+            for options, output_path in jobs
+        ],
+    }
+    with open(os.path.join(output_dir, "sweep.json"), "w") as f:
+        json.dump(summary, f, indent=2)
+    return summary
+
+
+def _float_list(value):
+    return [float(v) for v in value.split(",")]
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+def main():
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Render a grid of RVC parameter combinations from one F0 extraction")
+    parser.add_argument("vocals", help="Separated vocals wav (e.g. output/vocals.wav)")
+    parser.add_argument("--model", default=os.path.join(base_dir, "models", "zundamon.pth"))
+    parser.add_argument("--index", default=os.path.join(base_dir, "models", "zundamon.index"))
+    parser.add_argument("--f0-method", default="crepe")
+    parser.add_argument("--pitch-shift", type=_int_list, default=[0])
+    parser.add_argument("--protect", type=_float_list, default=[0.33])
+    parser.add_argument("--index-rate", type=_float_list, default=[0.6])
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    parser.add_argument("--output-dir", default=os.path.join(base_dir, "output", "sweep"))
+    parser.add_argument("--f0-cache-dir", default=os.path.join(base_dir, "cache", "f0"))
+    args = parser.parse_args()
+
+    summary = run_sweep(
+        args.vocals,
+        args.model,
+        args.index if os.path.exists(args.index) else None,
+        args.output_dir,
+        pitch_shifts=args.pitch_shift,
+        protects=args.protect,
+        index_rates=args.index_rate,
+        f0_method=args.f0_method,
+        f0_cache_dir=args.f0_cache_dir,
+        workers=args.workers,
+    )
+    print(f"{'shift':>5} {'protect':>7} {'index':>5} {'sec':>6}  output")
+    for v in summary["variants"]:
+        print(f"{v['pitch_shift']:>+5d} {v['protect']:>7g} {v['index_rate']:>5g} {v['convert_sec']:>6.1f}  {os.path.basename(v['output'])}")
+    print(f"{len(summary['variants'])} variants in {summary['wall_sec']:.1f}s -> {args.output_dir}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,183 @@
+import math
+import numpy as np
+import soundfile as sf
+from scipy.io import wavfile
+from scipy.ndimage import minimum_filter1d, uniform_filter1d
+from scipy.signal import firwin, resample_poly
+
+# 1回に処理するフレーム数 (44.1kHz で約6秒)
+BLOCK_FRAMES = 1 << 18
+INT16_MAX = 32767
+# リミッターの先読み幅 (秒)
+LIMITER_LOOKAHEAD_SEC = 0.005
+
+
+class WavSource:
+    """WAV を int16 スケールのブロックとして読む。
+
+    16bit PCM は scipy の mmap で開くのでページキャッシュから直接読むだけになる。
+    それ以外 (24/32bit, float) は soundfile でシークして読み、pydub の
+    set_sample_width(2) と同じく下位ビットを切り捨てて 16bit にする。
+    """
+
+    def __init__(self, path):
+        info = sf.info(path)
+        self.rate = info.samplerate
+        self.channels = info.channels
+        self.frames = info.frames
+        self._data = None
+        self._file = None
+        if info.subtype == "PCM_16":
+            _, data = wavfile.read(path, mmap=True)
+            self._data = data.reshape(len(data), -1)
+        else:
+            self._file = sf.SoundFile(path)
+
+    def read(self, start, stop):
+        """[start, stop) を (frames, channels) で返す。範囲外は 0"""
+        lo, hi = max(0, start), min(self.frames, stop)
+        out = np.zeros((stop - start, self.channels), dtype=np.float32)
+        if hi > lo:
+            if self._data is not None:
+                out[lo - start:hi - start] = self._data[lo:hi]
+            else:
+                self._file.seek(lo)
+                block = self._file.read(hi - lo, dtype="int32", always_2d=True)
+                out[lo - start:hi - start] = block >> 16
+        return out
+
+    def read_pcm16(self, start, stop):
+        """16bit PCM のまま [start, stop) を返す (範囲内のみ)"""
+        return self._data[start:stop]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        self._data = None
+
+
+class Gain:
+    """pydub の apply_gain と同じく、整数サンプルに倍率をかけて切り捨てる"""
+
+    def __init__(self, source, gain_db):
+        self.source = source
+        self.factor = 10 ** (gain_db / 20)
+        self.rate, self.channels, self.frames = source.rate, source.channels, source.frames
+
+    def read(self, start, stop):
+        block = np.floor(self.source.read(start, stop).astype(np.float64) * self.factor)
+        return block.astype(np.float32)
+
+
+class Resampled:
+    """ポリフェーズフィルタで rate に変換したソース。
+
+    各ブロックの前後にフィルタ長分の入力を足して resample_poly にかけ、
+    はみ出した部分を捨てる。入力の開始位置を down の倍数に揃えているので、
+    結果は全体を一度に resample_poly した場合と (浮動小数点誤差を除いて) 一致する。
+    """
+
+    def __init__(self, source, rate):
+        self.source = source
+        self.rate = rate
+        self.channels = source.channels
+        g = math.gcd(rate, source.rate)
+        self.up, self.down = rate // g, source.rate // g
+        self.frames = -(-source.frames * self.up // self.down)
+        if self.up != self.down:
+            half_len = 10 * max(self.up, self.down)
+            self.window = firwin(2 * half_len + 1, 1.0 / max(self.up, self.down), window=("kaiser", 5.0)).astype(np.float32)
+            self.pad = half_len // self.up + 1
+
+    def read(self, start, stop):
+        if self.up == self.down:
+            return self.source.read(start, stop)
+        up, down = self.up, self.down
+        in_start = max(0, (start * down // up - self.pad) // down * down)
+        in_stop = min(self.source.frames, -(-stop * down // up) + self.pad)
+        out = np.zeros((stop - start, self.channels), dtype=np.float32)
+        if in_stop <= in_start:
+            return out
+        y = resample_poly(self.source.read(in_start, in_stop), up, down, axis=0, window=self.window)
+        offset = in_start * up // down
+        lo, hi = max(start, offset), min(stop, offset + len(y))
+        if hi > lo:
+            out[lo - start:hi - start] = y[lo - offset:hi - offset]
+        return out
+
+
+def limiter_gain(samples, lookahead):
+    """フルスケールを超える箇所だけ、先読みして滑らかにゲインを下げる。
+
+    最小値フィルタ (幅 2*lookahead+1) を幅 lookahead+1 で平均するので、
+    どのサンプルでも必要なゲイン以下になる。超えない区間のゲインは正確に 1。
+    """
+    peak = np.abs(samples).max(axis=1)
+    need = np.minimum(1.0, INT16_MAX / np.maximum(peak, 1.0))
+    gain = uniform_filter1d(minimum_filter1d(need, 2 * lookahead + 1), lookahead + 1)
+    return np.minimum(gain, need)[:, None]
+
+
+def to_int16(block):
+    if block.dtype == np.int16:
+        return block
+    block = np.round(block, out=block)
+    return np.clip(block, -INT16_MAX - 1, INT16_MAX, out=block).astype(np.int16)
+
+
+def write_blocks(output_path, source, frames=None, block_frames=BLOCK_FRAMES, process=None):
+    """source を先頭からブロックごとに読み、16bit WAV に逐次書き出す"""
+    frames = source.frames if frames is None else frames
+    with sf.SoundFile(output_path, "w", samplerate=source.rate, channels=source.channels, subtype="PCM_16") as out:
+        for start in range(0, frames, block_frames):
+            stop = min(frames, start + block_frames)
+            block = process(start, stop) if process else source.read(start, stop)
+            out.write(to_int16(block))
+    return output_path
+
+
+def normalize_wav(input_path, output_path, rate=44100):
+    """チャンネル数はそのままで rate / 16bit にそろえる"""
+    source = WavSource(input_path)
+    try:
+        if source.rate == rate and source._data is not None:
+            # 変換が要らなければ mmap から int16 のまま書き写す
+            return write_blocks(output_path, source, process=source.read_pcm16)
+        return write_blocks(output_path, Resampled(source, rate))
+    finally:
+        source.close()
+
+
+class _MixSource:
+    def __init__(self, rate, channels, frames):
+        self.rate, self.channels, self.frames = rate, channels, frames
+
+
+def mix_wavs(vocals_path, inst_path, output_path, vocal_gain_db=-6.0):
+    """pydub の inst.overlay(vocal + gain) をブロック単位で再現する。
+
+    サンプルレート・チャンネル数は大きい方に合わせ、長さは instrumental に揃える。
+    pydub は和がフルスケールを超えるとそのまま飽和させるが、ここではその前後だけ
+    リミッターでゲインを下げる。超えない区間の出力は pydub と同じ値になる。
+    """
+    vocal_file, inst_file = WavSource(vocals_path), WavSource(inst_path)
+    try:
+        rate = max(vocal_file.rate, inst_file.rate)
+        channels = max(vocal_file.channels, inst_file.channels)
+        vocal = Resampled(Gain(vocal_file, vocal_gain_db), rate)
+        inst = Resampled(inst_file, rate)
+        lookahead = max(1, int(rate * LIMITER_LOOKAHEAD_SEC))
+        context = 2 * lookahead
+
+        def process(start, stop):
+            lo, hi = start - context, stop + context
+            # モノラル側は (frames, 1) のままブロードキャストで全チャンネルに足す (pydub の set_channels と同じ)
+            mixed = inst.read(lo, hi) + vocal.read(lo, hi)
+            if np.abs(mixed).max() > INT16_MAX:
+                mixed *= limiter_gain(mixed, lookahead)
+            return mixed[context:context + stop - start]
+
+        return write_blocks(output_path, _MixSource(rate, channels, inst.frames), process=process)
+    finally:
+        vocal_file.close()
+        inst_file.close()
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import uuid
+import fcntl
+import logging
+import argparse
+import traceback
+
+from main import AudioProcessor, DEFAULT_RVC_MODEL, configure
+
+logger = logging.getLogger(__name__)
+
+# スプールの各状態のディレクトリ。ジョブは incoming → running → done / failed と rename で移る
+SPOOL_STATES = ("incoming", "running", "done", "failed")
+
+
+def spool_dirs(spool_dir):
+    dirs = {state: os.path.join(spool_dir, state) for state in SPOOL_STATES}
+    for path in dirs.values():
+        os.makedirs(path, exist_ok=True)
+    return dirs
+
+
+def _write_json(path, data):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def submit_job(spool_dir, input_path, output_path=None, rvc_model=None, job_id=None):
+    """スプールにジョブを置く。書き終わってから rename するので、ワーカーが書きかけを拾うことはない"""
+    dirs = spool_dirs(spool_dir)
+    job_id = job_id or time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:8]
+    job = {
+        "id": job_id,
+        "input": os.path.abspath(input_path),
+        "output": os.path.abspath(output_path) if output_path else None,
+        "rvc_model": rvc_model or DEFAULT_RVC_MODEL,
+        "submitted_at": time.time(),
+    }
+    _write_json(os.path.join(dirs["incoming"], f"{job_id}.json"), job)
+    return job_id
+
+
+def lock_dir(path):
+    """path を使うワーカーを1つに限る。取れなければ RuntimeError。ロックはプロセスが終われば外れる"""
+    lock = open(os.path.join(path, "audio_worker.lock"), "w")
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        raise RuntimeError(f"Another audio worker is already using {path}")
+    return lock
+
+
+class AudioWorker:
+    """分離モデルと RVC モデルを読み込んだまま、ディレクトリスプールのジョブを順に処理する。
+
+    モデルの読み込みは起動時の1回だけになり、各ジョブの結果 (done/<id>.json) には
+    そのジョブでかかった読み込み時間と処理時間が残る。
+
+    ジョブの中間ファイル (正規化・分離・変換の wav) は processor の output/ の固定パスに書くので、
+    ジョブは1つずつ処理し、ワーカーはスプールと output/ のそれぞれに1つだけにする (start でロックを取る)。
+    """
+
+    def __init__(self, processor, spool_dir, poll_sec=1.0):
+        self.processor = processor
+        self.spool_dir = spool_dir
+        self.dirs = spool_dirs(spool_dir)
+        self.poll_sec = poll_sec
+        self._locks = []
+
+    def start(self, rvc_model_infos=(DEFAULT_RVC_MODEL,)):
+        for path in (self.spool_dir, self.processor.output_dir):
+            self._locks.append(lock_dir(path))
+        # 前回の実行中に落ちたジョブは incoming に戻してやり直す (ワーカーは1つなので、running に残っているのは落ちたものだけ)
+        for name in os.listdir(self.dirs["running"]):
+            os.replace(os.path.join(self.dirs["running"], name), os.path.join(self.dirs["incoming"], name))
+
+        start = time.time()
+        self.processor.metrics = {"load_sec": {}, "phase_sec": {}}
+        self.processor.preload(rvc_model_infos)
+        logger.info(f"Worker ready: models loaded in {time.time() - start:.1f}s ({self.processor.metrics['load_sec']})")
+
+    def claim(self):
+        """一番古いジョブを running に移して返す"""
+        for name in sorted(os.listdir(self.dirs["incoming"])):
+            if not name.endswith(".json"):
+                continue
+            running_path = os.path.join(self.dirs["running"], name)
+            try:
+                os.rename(os.path.join(self.dirs["incoming"], name), running_path)
+            except FileNotFoundError:
+                continue
+            with open(running_path) as f:
+                return json.load(f), running_path
+        return None, None
+
+    def process(self, job, running_path):
+        output_path = job.get("output") or os.path.join(self.dirs["done"], f"{job['id']}.wav")
+        started_at = time.time()
+        try:
+            self.processor.run_full_process(job["input"], job.get("rvc_model") or DEFAULT_RVC_MODEL, final_dest=output_path)
+            state, error = "done", None
+        except Exception:
+            logger.error(f"Job {job['id']} failed")
+            state, error = "failed", traceback.format_exc()
+
+        metrics = self.processor.metrics
+        load_sec = sum(metrics["load_sec"].values())
+        total_sec = time.time() - started_at
+        job.update(
+            status=state,
+            output=output_path if state == "done" else None,
+            error=error,
+            queue_wait_sec=started_at - job.get("submitted_at", started_at),
+            load_sec=load_sec,
+            process_sec=total_sec - load_sec,
+            metrics=metrics,
+        )
+        _write_json(os.path.join(self.dirs[state], f"{job['id']}.json"), job)
+        os.remove(running_path)
+        logger.info(f"Job {job['id']} {state}: model load {load_sec:.1f}s, processing {total_sec - load_sec:.1f}s")
+        return job
+
+    def run_once(self):
+        """溜まっているジョブをすべて処理し、処理した件数を返す"""
+        count = 0
+        while True:
+            job, running_path = self.claim()
+            if job is None:
+                return count
+            self.process(job, running_path)
+            count += 1
+
+    def run_forever(self):
+        while True:
+            if not self.run_once():
+                time.sleep(self.poll_sec)
+
+    def close(self):
+        for lock in self._locks:
+            lock.close()
+        self._locks = []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resident audio worker that keeps the separation and RVC models loaded")
+    parser.add_argument("--spool", default=os.environ.get("AUDIO_SPOOL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "spool")))
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve = sub.add_parser("serve", help="Load the models once and process queued jobs")
+    serve.add_argument("--once", action="store_true", help="Exit when the queue is empty")
+    serve.add_argument("--poll", type=float, default=1.0)
+
+    submit = sub.add_parser("submit", help="Queue an input wav")
+    submit.add_argument("input")
+    submit.add_argument("--output")
+    args = parser.parse_args()
+
+    if args.command == "submit":
+        print(submit_job(args.spool, args.input, args.output))
+        return
+
+    processor = AudioProcessor(os.path.dirname(os.path.abspath(__file__)))
+    configure(processor)
+    worker = AudioWorker(processor, args.spool, poll_sec=args.poll)
+    try:
+        worker.start()
+        if args.once:
+            worker.run_once()
+        else:
+            worker.run_forever()
+    finally:
+        worker.close()
+        processor.close()
+
+
+if __name__ == "__main__":
+    main()
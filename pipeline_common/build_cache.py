@@ -0,0 +1,203 @@
+# audio_process と video_process の共通モジュール。Docker イメージでは main.py と同じ /app にコピーされる
+# (キャッシュの形式も共通で、同じディレクトリを共有できる)
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# キャッシュ形式やステージの中身を変えたらここを上げて古い成果物を無効にする
+CACHE_VERSION = 1
+
+# 公開前に落ちたビルドの一時ディレクトリは、これより古ければ prune で消す
+TMP_MAX_AGE_SEC = 24 * 3600
+
+# ステージの実行結果。status は "hit" / "built" / "rebuild" (dry run で再実行が必要なもの)
+StageResult = namedtuple("StageResult", ["name", "key", "status", "paths"])
+
+
+def limits_from_env(environ=os.environ):
+    """BUILD_CACHE_MAX_GB / BUILD_CACHE_MAX_AGE_DAYS (0 で無制限) を BuildCache の max_bytes / max_age_sec にする"""
+    max_gb = float(environ.get("BUILD_CACHE_MAX_GB", "20"))
+    max_days = float(environ.get("BUILD_CACHE_MAX_AGE_DAYS", "30"))
+    return {
+        "max_bytes": int(max_gb * 1e9) if max_gb > 0 else None,
+        "max_age_sec": max_days * 86400 if max_days > 0 else None,
+    }
+
+
+class BuildCache:
+    """ステージの出力を、入力ファイルの内容・上流ステージ・パラメータのハッシュをキーに保存して使い回す。
+
+    上流ステージは出力の中身ではなくキーで参照するので、dry run でも何も実行せずに
+    どのステージが作り直しになるかが分かる。成果物は一時ディレクトリに書いてから
+    rename で公開するので、途中で落ちても壊れた成果物がヒットすることはない。
+    成果物は出力ファイルの丸ごとのコピーなので、prune で max_bytes / max_age_sec を超えた分を消す。
+    """
+
+    def __init__(self, cache_dir, dry_run=False, max_bytes=None, max_age_sec=None):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.objects_dir = os.path.join(self.cache_dir, "objects")
+        self.dry_run = dry_run
+        self.max_bytes = max_bytes
+        self.max_age_sec = max_age_sec
+        self.plan = []
+        os.makedirs(self.objects_dir, exist_ok=True)
+        # 大きな入力 (音声・モデル) を毎回読み直さないよう、(サイズ, 更新時刻) が同じなら前回のハッシュを使う
+        self._hashes_path = os.path.join(self.cache_dir, "file_hashes.json")
+        try:
+            with open(self._hashes_path) as f:
+                self._hashes = json.load(f)
+        except (OSError, ValueError):
+            self._hashes = {}
+        # ステージを並行に実行するとき用 (メモの更新と書き出しを直列にする)
+        self._lock = threading.Lock()
+
+    def file_hash(self, path, block_size=1 << 20):
+        """ファイルの内容の sha256。無いファイルは "missing" (dry run で未ダウンロードのモデルなど)"""
+        path = os.path.abspath(path)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return "missing"
+        stamp = [st.st_size, st.st_mtime_ns]
+        with self._lock:
+            saved = self._hashes.get(path)
+        if saved and saved[:2] == stamp:
+            return saved[2]
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                h.update(block)
+        with self._lock:
+            self._hashes[path] = stamp + [h.hexdigest()]
+            tmp_path = f"{self._hashes_path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self._hashes, f)
+            os.replace(tmp_path, self._hashes_path)
+        return h.hexdigest()
+
+    def key(self, name, inputs=(), params=None):
+        """inputs はファイルパスか上流の StageResult のリスト"""
+        h = hashlib.sha256(f"{name}:v{CACHE_VERSION}".encode())
+        for item in inputs:
+            if isinstance(item, StageResult):
+                h.update(f"stage:{item.name}:{item.key}".encode())
+            else:
+                h.update(f"file:{self.file_hash(item)}".encode())
+        h.update(json.dumps(params or {}, sort_keys=True, default=str).encode())
+        return h.hexdigest()[:24]
+
+    def object_dir(self, name, key):
+        return os.path.join(self.objects_dir, f"{name}-{key}")
+
+    def lookup(self, name, key):
+        """公開済みの成果物を {出力名: パス} で返す。無ければ None"""
+        manifest_path = os.path.join(self.object_dir(name, key), "manifest.json")
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        paths = {out: os.path.join(self.object_dir(name, key), file) for out, file in manifest["outputs"].items()}
+        if not all(os.path.exists(p) for p in paths.values()):
+            return None
+        # prune は manifest の更新時刻を最後に使われた時刻として扱う
+        try:
+            os.utime(manifest_path)
+        except OSError:
+            pass
+        return paths
+
+    def publish(self, name, key, paths):
+        """{出力名: パス} のファイルをキャッシュにコピーし、キャッシュ側のパスを返す。
+
+        ステージは output/ の同じパスに上書きで書き出すので、ハードリンクではなくコピーする。
+        """
+        final_dir = self.object_dir(name, key)
+        tmp_dir = f"{final_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        outputs = {}
+        for out, path in paths.items():
+            outputs[out] = out + os.path.splitext(path)[1]
+            shutil.copyfile(path, os.path.join(tmp_dir, outputs[out]))
+        with open(os.path.join(tmp_dir, "manifest.json"), "w") as f:
+            json.dump({"stage": name, "key": key, "created_at": time.time(), "outputs": outputs}, f, indent=2)
+        try:
+            os.rename(tmp_dir, final_dir)
+        except OSError:
+            # 同じキーを他のプロセスが先に公開した (中身は同じはず)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return self.lookup(name, key)
+
+    def run(self, name, inputs, params, build):
+        """キャッシュにあればそれを、無ければ build() ({出力名: パス} を返す) を実行して公開する。
+
+        dry run では build を呼ばず、paths が None の StageResult を返す。
+        """
+        key = self.key(name, inputs, params)
+        paths = self.lookup(name, key)
+        if paths is not None:
+            result = StageResult(name, key, "hit", paths)
+        elif self.dry_run:
+            result = StageResult(name, key, "rebuild", None)
+        else:
+            result = StageResult(name, key, "built", self.publish(name, key, build()))
+        self.plan.append(result)
+        logger.info(f"Build cache {result.status:>7}: {name} ({key})")
+        return result
+
+    def prune(self):
+        """最後に使われてから max_age_sec を過ぎた成果物と、合計が max_bytes を超える分を古い順に消す。
+
+        このビルドで使った成果物は残す。dry run では何も消さない。(消した数, 消したバイト数) を返す。
+        """
+        if self.dry_run or (self.max_bytes is None and self.max_age_sec is None):
+            return 0, 0
+        now = time.time()
+        keep = {self.object_dir(r.name, r.key) for r in self.plan if r.key}
+        entries = []
+        for entry in os.scandir(self.objects_dir):
+            if not entry.is_dir():
+                continue
+            if entry.name.endswith(".tmp"):
+                if now - entry.stat().st_mtime > TMP_MAX_AGE_SEC:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            try:
+                used = os.stat(os.path.join(entry.path, "manifest.json")).st_mtime
+            except OSError:
+                used = entry.stat().st_mtime
+            size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+            entries.append((used, size, entry.path))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed, freed = 0, 0
+        for used, size, path in entries:
+            expired = self.max_age_sec is not None and now - used > self.max_age_sec
+            over = self.max_bytes is not None and total > self.max_bytes
+            if path in keep or not (expired or over):
+                continue
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+            freed += size
+        if removed:
+            logger.info(f"Build cache pruned {removed} outputs ({freed / 1e6:.0f} MB); {total / 1e6:.0f} MB left")
+        return removed, freed
+
+    def report(self):
+        """このビルドで各ステージがどうなったか (dry run なら何が作り直しになるか) を表示する"""
+        for result in self.plan:
+            print(f"{result.name:<12} {result.status:<8} {result.key}")
+        rebuild = [r.name for r in self.plan if r.status != "hit"]
+        label = "Would rebuild" if self.dry_run else "Rebuilt"
+        print(f"{label}: {', '.join(rebuild) if rebuild else 'nothing (all cached)'}")
@@ -0,0 +1,87 @@
+# build_cache.py と同じく audio_process と video_process の共通モジュール
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+
+class StageGraph:
+    """依存関係のあるステージを、依存がそろったものから別スレッドで並行に実行する。
+
+    ステージの関数は依存ステージの戻り値を deps の順に引数として受け取る。
+    重い処理 (ONNX / PyTorch / ffmpeg / ダウンロード) は GIL を離すので、スレッドで十分に重なる。
+    """
+
+    def __init__(self):
+        self.stages = {}
+        # name -> (開始, 終了) の run() 開始からの秒数
+        self.timings = {}
+        self.wall_sec = 0.0
+
+    def add(self, name, func, deps=()):
+        """依存先は先に add しておく (なので循環はできない)"""
+        unknown = [dep for dep in deps if dep not in self.stages]
+        if unknown:
+            raise ValueError(f"Unknown dependencies {unknown} for stage '{name}'")
+        self.stages[name] = (func, tuple(deps))
+
+    def _run_stage(self, name, func, args, origin):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.timings[name] = (start - origin, time.perf_counter() - origin)
+
+    def run(self, max_workers=None):
+        """全ステージを実行して {name: 戻り値} を返す。
+
+        どれかが失敗したら新しいステージは始めず、実行中のものが終わるのを待ってから例外を再送出する。
+        """
+        results = {}
+        pending = dict(self.stages)
+        running = {}
+        origin = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=max_workers or len(self.stages) or 1) as pool:
+                while pending or running:
+                    for name, (func, deps) in list(pending.items()):
+                        if all(dep in results for dep in deps):
+                            del pending[name]
+                            args = [results[dep] for dep in deps]
+                            running[pool.submit(self._run_stage, name, func, args, origin)] = name
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        try:
+                            results[name] = future.result()
+                        except Exception:
+                            logger.error(f"Stage '{name}' failed; skipping {sorted(pending) or 'nothing'}")
+                            raise
+        finally:
+            self.wall_sec = time.perf_counter() - origin
+        return results
+
+    def critical_path(self):
+        """最後に終わったステージから、それぞれが最後に待った依存をたどった経路"""
+        if not self.timings:
+            return []
+        name = max(self.timings, key=lambda n: self.timings[n][1])
+        path = [name]
+        while True:
+            deps = [dep for dep in self.stages[name][1] if dep in self.timings]
+            if not deps:
+                break
+            name = max(deps, key=lambda n: self.timings[n][1])
+            path.append(name)
+        return path[::-1]
+
+    def report(self):
+        """ステージごとの開始・終了・所要時間と、クリティカルパスを表示する"""
+        path = self.critical_path()
+        print(f"{'stage':<16} {'start':>7} {'end':>7} {'sec':>7}")
+        for name, (start, end) in sorted(self.timings.items(), key=lambda item: item[1][0]):
+            mark = " *" if name in path else ""
+            print(f"{name:<16} {start:>7.1f} {end:>7.1f} {end - start:>7.1f}{mark}")
+        busy = sum(self.timings[name][1] - self.timings[name][0] for name in path)
+        print(f"Critical path (*): {' -> '.join(path)} ({busy:.1f}s busy of {self.wall_sec:.1f}s wall)")
@@ -71,6 +71,13 @@ def _show_bird(obs: OBSClient, scene: str, source: str, duration_sec: float) ->
 def run(config: BirdConfig, rng: random.Random | None = None) -> int:
     rng = rng or random.Random()
     obs = OBSClient()
+    try:
+        return _direct(obs, config, rng)
+    finally:
+        obs.disconnect()
+
+
+def _direct(obs: OBSClient, config: BirdConfig, rng: random.Random) -> int:
     if not obs.connect():
         logger.error("Cannot connect to OBS, aborting bird director.")
         return 1
@@ -95,6 +102,8 @@ def run(config: BirdConfig, rng: random.Random | None = None) -> int:
         time.sleep(min(config.interval_sec, max(sleep_left, 0)))
 
     logger.info(f"Bird director finished. Total fires: {fire_count}")
+    stats = obs.scene_item_cache_stats()
+    logger.info(f"Scene item ID cache: {stats['hits']} hits, {stats['misses']} misses")
     return 0
 
 
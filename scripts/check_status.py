@@ -10,7 +10,10 @@ from rct.obs_client import OBSClient
 
 def main():
     client = OBSClient()
-    status = client.get_status()
+    try:
+        status = client.get_status()
+    finally:
+        client.disconnect()
 
     print("--- Radio Calisthenics Together Status ---")
     print(f"Connected: {'✅ YES' if status['connected'] else '❌ NO'}")
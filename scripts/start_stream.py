@@ -17,6 +17,7 @@ logger = setup_logger()
 
 def main():
     logger.info("--- Starting Phase 2 Live Process ---")
+    obs = None
 
     try:
         # 1. YouTube Live 枠の作成 または 既存枠の検索
@@ -107,6 +108,9 @@ def main():
         except Exception as email_err:
             logger.error(f"Email notification failed: {email_err}")
         sys.exit(1)
+    finally:
+        if obs:
+            obs.disconnect()
 
 if __name__ == "__main__":
     main()
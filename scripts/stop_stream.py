@@ -17,14 +17,17 @@ def main():
     logger.info("--- Stopping Stream Process ---")
     client = OBSClient()
 
-    if not client.connect():
-        logger.error("Could not connect to OBS. It might not be running.")
-        sys.exit(0) # Exit gracefully if OBS is already closed
-
-    if client.stop_streaming():
-        logger.info("Stop stream sequence completed successfully.")
-    else:
-        logger.error("Stop stream sequence failed.")
+    try:
+        if not client.connect():
+            logger.error("Could not connect to OBS. It might not be running.")
+            sys.exit(0) # Exit gracefully if OBS is already closed
+
+        if client.stop_streaming():
+            logger.info("Stop stream sequence completed successfully.")
+        else:
+            logger.error("Stop stream sequence failed.")
+    finally:
+        client.disconnect()
 
     # 翌日の枠を予約する（24時間前予約の実現）
     try:
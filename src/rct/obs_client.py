@@ -1,31 +1,229 @@
 import obsws_python as obs
+from obsws_python.error import OBSSDKRequestError
+import json
 import time
+import uuid
 import subprocess
 import os
+import threading
+from dataclasses import dataclass
+from typing import Optional
 from .logger import setup_logger
 from .settings import settings
 
 logger = setup_logger()
 
 MEDIA_BUFFER_WAIT_SEC = 5  # media source restart 後にエンコーダーがバッファ蓄積する時間
+BATCH_SERIAL_REALTIME = 0  # RequestBatch の executionType。Sleep は sleepMillis で指定する
+
+
+@dataclass(frozen=True)
+class BatchResult:
+    """RequestBatch の1ステップの結果"""
+    request_type: str
+    ok: bool
+    code: int
+    comment: Optional[str]
+    data: dict
+
+    def error(self):
+        return OBSSDKRequestError(self.request_type, self.code, self.comment)
+
 
 class OBSClient:
+    """OBS WebSocket のクライアント。
+
+    リクエスト用とイベント用の2本の接続を持つ。使い終わったら disconnect() するか、
+    with OBSClient() as obs: の形で使う。
+    """
+
     def __init__(self):
         self.host = settings.OBS_WS_HOST
         self.port = settings.OBS_WS_PORT
         self.password = settings.OBS_WS_PASSWORD
         self.client = None
+        # シーンアイテムの増減・シーン名の変更を受け取るイベント接続。無ければ ID をキャッシュしない
+        self.events = None
+        # (scene, source) -> scene item ID。接続ごとに持ち、イベントで捨てる
+        self._scene_item_ids = {}
+        self._scene_item_lock = threading.Lock()
+        # キャッシュを捨てるたびに増やす。問い合わせ中に捨てられた ID を入れないため
+        self._scene_item_generation = 0
+        self.scene_item_cache_hits = 0
+        self.scene_item_cache_misses = 0
+        # リクエスト用 websocket の往復 (送信 → 応答の受信) を直列にする。send_batch と共有
+        self._request_lock = threading.RLock()
 
     def connect(self):
         if self.client:
             return True
         try:
             self.client = obs.ReqClient(host=self.host, port=self.port, password=self.password, timeout=10)
+            self._serialize_requests(self.client)
             self.client.get_version()
-            return True
         except Exception as e:
             logger.error(f"Failed to connect to OBS at {self.host}:{self.port} - {e}")
             return False
+        self._clear_scene_item_cache()
+        self._subscribe_events()
+        return True
+
+    def _serialize_requests(self, client):
+        """ReqClient は送信の直後に届いた応答を自分のものとして受け取るので、
+        send_batch と同時に走らないよう、往復ごとに _request_lock を取らせる。"""
+        base = client.base_client
+        req = base.req
+
+        def locked_req(*args, **kwargs):
+            with self._request_lock:
+                return req(*args, **kwargs)
+
+        base.req = locked_req
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.disconnect()
+
+    def _subscribe_events(self):
+        # 再接続のときに前のイベント接続を残さない
+        self._close_events()
+        try:
+            self.events = obs.EventClient(
+                host=self.host, port=self.port, password=self.password, timeout=10,
+                subs=obs.Subs.SCENES | obs.Subs.SCENEITEMS,
+            )
+            self.events.callback.register([
+                self.on_scene_item_created,
+                self.on_scene_item_removed,
+                self.on_scene_name_changed,
+            ])
+        except Exception as e:
+            logger.warning(f"OBS event subscription failed; scene item IDs will not be cached - {e}")
+            self.events = None
+
+    # EventClient はメソッド名 (on_<event>) でイベントを振り分ける
+    def on_scene_item_created(self, data):
+        self._invalidate_scene_items(lambda scene, source: (scene, source) == (data.scene_name, data.source_name))
+
+    def on_scene_item_removed(self, data):
+        self._invalidate_scene_items(lambda scene, source: (scene, source) == (data.scene_name, data.source_name))
+
+    def on_scene_name_changed(self, data):
+        self._invalidate_scene_items(lambda scene, source: scene in (data.old_scene_name, data.scene_name))
+
+    def _invalidate_scene_items(self, match):
+        with self._scene_item_lock:
+            self._scene_item_generation += 1
+            for key in [key for key in self._scene_item_ids if match(*key)]:
+                del self._scene_item_ids[key]
+
+    def _clear_scene_item_cache(self):
+        self._invalidate_scene_items(lambda scene, source: True)
+
+    def _scene_item_id(self, scene_name, source_name):
+        """(scene item ID, キャッシュから取ったか) を返す"""
+        key = (scene_name, source_name)
+        with self._scene_item_lock:
+            if key in self._scene_item_ids:
+                self.scene_item_cache_hits += 1
+                return self._scene_item_ids[key], True
+            self.scene_item_cache_misses += 1
+            generation = self._scene_item_generation
+        scene_item_id = self.client.get_scene_item_id(scene_name, source_name).scene_item_id
+        if self.events is not None:
+            with self._scene_item_lock:
+                if generation == self._scene_item_generation:
+                    self._scene_item_ids[key] = scene_item_id
+        return scene_item_id, False
+
+    def scene_item_cache_stats(self):
+        with self._scene_item_lock:
+            return {
+                "hits": self.scene_item_cache_hits,
+                "misses": self.scene_item_cache_misses,
+                "size": len(self._scene_item_ids),
+            }
+
+    def send_batch(self, requests, halt_on_failure=True):
+        """[(requestType, requestData), ...] を1往復の RequestBatch (SERIAL_REALTIME) で送り、
+        実行されたステップの BatchResult を順に返す。
+
+        Sleep は OBS 側で実行されるので、ステップ間の間隔は websocket の遅延に左右されない。
+        halt_on_failure なら失敗したステップ以降は実行されない (結果も返らない)。
+        obsws_python の ReqClient にはバッチの API が無いので、同じ websocket に直接送る。
+        ReqClient の往復とは _request_lock で直列にするので、他のスレッドの応答を受け取ることはない。
+        """
+        request_id = uuid.uuid4().hex
+        payload = {
+            "op": 8,
+            "d": {
+                "requestId": request_id,
+                "haltOnFailure": halt_on_failure,
+                "executionType": BATCH_SERIAL_REALTIME,
+                "requests": [
+                    {"requestType": request_type, **({"requestData": data} if data else {})}
+                    for request_type, data in requests
+                ],
+            },
+        }
+        ws = self.client.base_client.ws
+        timeout = ws.gettimeout()
+        sleep_sec = sum((data or {}).get("sleepMillis", 0) for request_type, data in requests if request_type == "Sleep") / 1000
+        # バッチ全体が終わるまで応答は返らないので、Sleep の合計だけ待ち時間を延ばす
+        with self._request_lock:
+            ws.settimeout(timeout + sleep_sec if timeout is not None else None)
+            try:
+                ws.send(json.dumps(payload))
+                while True:
+                    response = json.loads(ws.recv())
+                    if response.get("op") == 9 and response["d"].get("requestId") == request_id:
+                        break
+                    # ロック中に届く他の応答は、タイムアウトした以前のリクエストの遅れた応答だけ
+                    logger.debug(f"Discarding stale OBS response: {response}")
+            finally:
+                ws.settimeout(timeout)
+        return [
+            BatchResult(
+                result["requestType"],
+                result["requestStatus"]["result"],
+                result["requestStatus"]["code"],
+                result["requestStatus"].get("comment"),
+                result.get("responseData") or {},
+            )
+            for result in response["d"]["results"]
+        ]
+
+    def _media_refresh_requests(self, scene_name, source_name, scene_item_id):
+        """非表示 → 再送開始 → PAUSE で位置0に凍結 → 表示 → バッファ蓄積待ち"""
+        return [
+            ("SetSceneItemEnabled", {"sceneName": scene_name, "sceneItemId": scene_item_id, "sceneItemEnabled": False}),
+            ("Sleep", {"sleepMillis": 500}),
+            ("TriggerMediaInputAction", {"inputName": source_name, "mediaAction": "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_RESTART"}),
+            ("TriggerMediaInputAction", {"inputName": source_name, "mediaAction": "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PAUSE"}),
+            ("SetSceneItemEnabled", {"sceneName": scene_name, "sceneItemId": scene_item_id, "sceneItemEnabled": True}),
+            ("Sleep", {"sleepMillis": MEDIA_BUFFER_WAIT_SEC * 1000}),
+        ]
+
+    def _refresh_media_source(self, scene_name, source_name):
+        """メディアソースをリフレッシュし、続けて取った配信状態 (outputActive) を返す。取れなければ None"""
+        for attempt in range(2):
+            scene_item_id, cached = self._scene_item_id(scene_name, source_name)
+            logger.info(f"Waiting {MEDIA_BUFFER_WAIT_SEC}s for media buffer to fill (paused at position 0)...")
+            results = self.send_batch(
+                self._media_refresh_requests(scene_name, source_name, scene_item_id) + [("GetStreamStatus", None)]
+            )
+            failed = next((result for result in results if not result.ok), None)
+            if failed is None:
+                logger.info("Media source refreshed and paused at position 0.")
+                return results[-1].data.get("outputActive")
+            if cached and failed.request_type == "SetSceneItemEnabled" and attempt == 0:
+                # イベントを取りこぼして古い ID を使った可能性があるので、引き直して一度だけやり直す
+                self._invalidate_scene_items(lambda scene, source: (scene, source) == (scene_name, source_name))
+                continue
+            logger.warning(f"Media refresh failed: {failed.error()}")
+            return None
 
     def start_streaming(self):
         if not self.connect():
@@ -36,31 +234,24 @@ class OBSClient:
             self.client.set_current_program_scene(settings.OBS_SCENE_NAME)
 
             # 動画ソースのリセット（上書き対策）
+            # 非表示 → RESTART → PAUSE → 表示 → 待機 → GetStreamStatus を1つのバッチで送り、間隔は OBS 側の Sleep で取る
+            #    5/1インシデント: バッファ待機中に動画が再生されてしまい、
+            #    視聴者には冒頭5〜10秒が抜けて見えていた → PAUSE して位置0で凍結
+            #    4/30インシデント: 0.012秒で start_stream を呼んで lag 25%, drop 9.7%、
+            #    実効0.5fps しか出ず YouTube に stalled stream と判断され15分後切断 → 静止画のままバッファ蓄積を待つ
+            output_active = None
             if settings.OBS_MEDIA_SOURCE_NAME:
                 logger.info(f"Force refreshing media source: '{settings.OBS_MEDIA_SOURCE_NAME}'")
                 try:
-                    # 1. 一旦非表示にして描画を止める
-                    self.set_scene_item_enabled(settings.OBS_SCENE_NAME, settings.OBS_MEDIA_SOURCE_NAME, False)
-                    time.sleep(0.5)
-                    # 2. 再送を開始し、PAUSE して位置0で凍結
-                    #    5/1インシデント: バッファ待機中に動画が再生されてしまい、
-                    #    視聴者には冒頭5〜10秒が抜けて見えていた
-                    self.client.trigger_media_input_action(settings.OBS_MEDIA_SOURCE_NAME, "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_RESTART")
-                    self.client.trigger_media_input_action(settings.OBS_MEDIA_SOURCE_NAME, "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PAUSE")
-                    self.set_scene_item_enabled(settings.OBS_SCENE_NAME, settings.OBS_MEDIA_SOURCE_NAME, True)
-                    # 3. エンコーダーがフレームバッファを蓄積するまで静止画で待機
-                    #    4/30インシデント: 0.012秒で start_stream を呼んで lag 25%, drop 9.7%、
-                    #    実効0.5fps しか出ず YouTube に stalled stream と判断され15分後切断
-                    logger.info(f"Waiting {MEDIA_BUFFER_WAIT_SEC}s for media buffer to fill (paused at position 0)...")
-                    time.sleep(MEDIA_BUFFER_WAIT_SEC)
-                    logger.info("Media source refreshed and paused at position 0.")
+                    output_active = self._refresh_media_source(settings.OBS_SCENE_NAME, settings.OBS_MEDIA_SOURCE_NAME)
                 except Exception as e:
                     logger.warning(f"Media refresh failed: {e}")
             else:
                 logger.info("No media source specified for restart.")
 
-            status = self.client.get_stream_status()
-            if status.output_active:
+            if output_active is None:
+                output_active = self.client.get_stream_status().output_active
+            if output_active:
                 logger.warning(
                     "Stream is already active (possibly stale state). "
                     "Forcing stop before restart to avoid stuck reconnect loop."
@@ -72,19 +263,25 @@ class OBSClient:
                 time.sleep(2)
 
             logger.info("Starting stream output...")
-            self.client.start_stream()
+            if not settings.OBS_MEDIA_SOURCE_NAME:
+                self.client.start_stream()
+                return True
 
-            # 配信開始後にメディアを再生開始 (視聴者は位置0から見える)
-            if settings.OBS_MEDIA_SOURCE_NAME:
-                time.sleep(0.5)  # ストリームが安定するまで少し待つ
-                try:
-                    self.client.trigger_media_input_action(
-                        settings.OBS_MEDIA_SOURCE_NAME,
-                        "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PLAY"
-                    )
-                    logger.info("Media playback resumed from position 0.")
-                except Exception as e:
-                    logger.warning(f"Media play resume failed: {e}")
+            # 配信開始後にメディアを再生開始 (視聴者は位置0から見える)。ストリームが安定するまで OBS 側で少し待つ
+            results = self.send_batch([
+                ("StartStream", None),
+                ("Sleep", {"sleepMillis": 500}),
+                ("TriggerMediaInputAction", {
+                    "inputName": settings.OBS_MEDIA_SOURCE_NAME,
+                    "mediaAction": "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PLAY",
+                }),
+            ])
+            if not results[0].ok:
+                raise results[0].error()
+            if results[-1].ok and results[-1].request_type == "TriggerMediaInputAction":
+                logger.info("Media playback resumed from position 0.")
+            else:
+                logger.warning(f"Media play resume failed: {results[-1].error()}")
             return True
         except Exception as e:
             logger.error(f"Start stream error: {e}")
@@ -104,9 +301,16 @@ class OBSClient:
         if not self.connect():
             return False
         try:
-            resp = self.client.get_scene_item_id(scene_name, source_name)
-            scene_item_id = resp.scene_item_id
-            self.client.set_scene_item_enabled(scene_name, scene_item_id, enabled)
+            scene_item_id, cached = self._scene_item_id(scene_name, source_name)
+            try:
+                self.client.set_scene_item_enabled(scene_name, scene_item_id, enabled)
+            except OBSSDKRequestError:
+                if not cached:
+                    raise
+                # イベントを取りこぼして古い ID を使った可能性があるので、引き直して一度だけやり直す
+                self._invalidate_scene_items(lambda scene, source: (scene, source) == (scene_name, source_name))
+                scene_item_id, _ = self._scene_item_id(scene_name, source_name)
+                self.client.set_scene_item_enabled(scene_name, scene_item_id, enabled)
             return True
         except Exception as e:
             logger.warning(f"Failed to set scene item enabled ({source_name}): {e}")
@@ -157,6 +361,20 @@ class OBSClient:
             "scene": scene
         }
 
+    def _close_events(self):
+        if self.events:
+            try:
+                self.events.disconnect()
+            except Exception as e:
+                logger.warning(f"Failed to close OBS event connection: {e}")
+            self.events = None
+
     def disconnect(self):
+        self._close_events()
+        self._clear_scene_item_cache()
         if self.client:
+            try:
+                self.client.disconnect()
+            except Exception as e:
+                logger.warning(f"Failed to close OBS connection: {e}")
             self.client = None
@@ -0,0 +1,115 @@
+"""
+video_process/benchmark.py のテスト
+
+合成クリップの生成と、結果 JSON の書き出し・baseline との比較 (遅くなったケースで
+終了コード 1) を確認する。各ステージの計測自体は別プロセスで動くので、ここでは差し替える。
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'video_process'))
+
+import benchmark
+
+
+def fake_run_case(fps_by_stage):
+    def run_case(stage, clip, options):
+        return {**benchmark.latency_stats([0.01] * options["frames"], options["frames"] / fps_by_stage[stage], options["frames"]),
+                "peak_rss_mb": 100.0}
+    return run_case
+
+
+class TestGenerateClip:
+    def test_writes_a_readable_clip_once(self, tmp_path):
+        path = str(tmp_path / "clips" / "360p_5f.mp4")
+
+        benchmark.generate_clip(path, 640, 360, 5)
+
+        cap = cv2.VideoCapture(path)
+        assert int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) == 640
+        assert int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) == 360
+        assert int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == 5
+        cap.release()
+        assert os.listdir(tmp_path / "clips") == ["360p_5f.mp4"]
+
+        mtime = os.path.getmtime(path)
+        benchmark.generate_clip(path, 640, 360, 5)
+        assert os.path.getmtime(path) == mtime
+
+    def test_synthetic_landmarks_move(self):
+        landmarks = benchmark.synthetic_landmarks(60)
+
+        assert landmarks.shape == (60, 33, 4)
+        assert np.isfinite(landmarks).all()
+        assert np.ptp(landmarks[:, 0, 0]) > 0.01
+
+
+class TestLatencyStats:
+    def test_percentiles_and_fps(self):
+        stats = benchmark.latency_stats([0.001] * 99 + [0.1], 2.0, 100)
+
+        assert stats["fps"] == 50
+        assert stats["p50_ms"] == pytest.approx(1.0)
+        assert stats["p99_ms"] > 1.0
+
+    def test_without_samples_reports_throughput_only(self):
+        assert "p50_ms" not in benchmark.latency_stats([], 1.0, 30)
+
+
+class TestMain:
+    def run(self, tmp_path, monkeypatch, fps, *args):
+        monkeypatch.setattr(benchmark, "generate_clip", lambda path, width, height, frames: path)
+        monkeypatch.setattr(benchmark, "run_case", fake_run_case(fps))
+        output = str(tmp_path / "result.json")
+        code = benchmark.main(["--resolutions", "360p", "--frames", "10", "--stages", "decode,render",
+                               "--output", output, *args])
+        return code, output
+
+    def test_writes_results(self, tmp_path, monkeypatch):
+        code, output = self.run(tmp_path, monkeypatch, {"decode": 200, "render": 100})
+
+        assert code == 0
+        with open(output) as f:
+            report = json.load(f)
+        assert [(r["case"], r["stage"]) for r in report["results"]] == [("360p_10f", "decode"), ("360p_10f", "render")]
+        assert report["results"][1]["fps"] == pytest.approx(100)
+
+    def test_regression_beyond_tolerance_fails(self, tmp_path, monkeypatch):
+        _, baseline = self.run(tmp_path, monkeypatch, {"decode": 200, "render": 100})
+        os.replace(baseline, tmp_path / "baseline.json")
+
+        # decode は 5% 遅いだけ、render は 30% 遅い
+        code, _ = self.run(tmp_path, monkeypatch, {"decode": 190, "render": 70},
+                           "--baseline", str(tmp_path / "baseline.json"), "--tolerance", "0.1")
+
+        assert code == 1
+
+    def test_within_tolerance_passes(self, tmp_path, monkeypatch):
+        _, baseline = self.run(tmp_path, monkeypatch, {"decode": 200, "render": 100})
+        os.replace(baseline, tmp_path / "baseline.json")
+
+        code, _ = self.run(tmp_path, monkeypatch, {"decode": 190, "render": 95},
+                           "--baseline", str(tmp_path / "baseline.json"))
+
+        assert code == 0
+
+    def test_unknown_stage_is_rejected(self):
+        assert benchmark.main(["--stages", "decode,upload"]) == 2
+
+
+def test_compare_flags_only_slower_cases():
+    results = [{"case": "a", "stage": "decode", "fps": 80.0}, {"case": "a", "stage": "render", "fps": 150.0},
+               {"case": "b", "stage": "decode", "fps": 10.0}]
+    baseline = {"results": [{"case": "a", "stage": "decode", "fps": 100.0}, {"case": "a", "stage": "render", "fps": 100.0}]}
+
+    regressions = benchmark.compare_with_baseline(results, baseline, tolerance=0.1)
+
+    assert [(r["case"], r["stage"]) for r in regressions] == [("a", "decode")]
+    assert regressions[0]["change"] == pytest.approx(-0.2)
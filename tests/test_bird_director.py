@@ -1,6 +1,7 @@
 import random
 import sys
 import os
+from unittest.mock import MagicMock
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "scripts")))
 
@@ -61,3 +62,34 @@ def test_plan_schedule_count_within_expected_range():
     plan = plan_schedule(duration_sec=900, interval_sec=30, probability=0.15, seed=1)
     assert 0 <= len(plan) <= 30
     assert all(0 <= t < 900 for t in plan)
+
+
+def test_run_disconnects_from_obs(monkeypatch):
+    import bird_director
+
+    obs = MagicMock()
+    obs.connect.return_value = True
+    obs.scene_item_cache_stats.return_value = {"hits": 0, "misses": 0, "size": 0}
+    monkeypatch.setattr(bird_director, "OBSClient", lambda: obs)
+    config = bird_director.BirdConfig(
+        scene_name="SCENE", source_name="bird", duration_sec=0,
+        interval_sec=1, probability=0.0, show_duration_sec=0,
+    )
+
+    assert bird_director.run(config) == 0
+    obs.disconnect.assert_called_once()
+
+
+def test_run_disconnects_when_connect_fails(monkeypatch):
+    import bird_director
+
+    obs = MagicMock()
+    obs.connect.return_value = False
+    monkeypatch.setattr(bird_director, "OBSClient", lambda: obs)
+    config = bird_director.BirdConfig(
+        scene_name="SCENE", source_name="bird", duration_sec=0,
+        interval_sec=1, probability=0.0, show_duration_sec=0,
+    )
+
+    assert bird_director.run(config) == 1
+    obs.disconnect.assert_called_once()
@@ -0,0 +1,93 @@
+"""
+pipeline_common/build_cache.py のテスト
+
+成果物の公開・ヒットと、prune による古い成果物の削除を確認する。
+"""
+import os
+import sys
+import time
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'pipeline_common'))
+
+import build_cache
+
+
+def build_stage(cache, tmp_path, name, size):
+    source = tmp_path / f"{name}.wav"
+    source.write_bytes(b"x" * size)
+    out = tmp_path / f"{name}.out"
+
+    def build():
+        out.write_bytes(source.read_bytes())
+        return {"wav": str(out)}
+
+    return cache.run(name, [str(source)], {}, build)
+
+
+def age(result, seconds):
+    manifest = os.path.join(os.path.dirname(result.paths["wav"]), "manifest.json")
+    past = time.time() - seconds
+    os.utime(manifest, (past, past))
+
+
+class TestBuildCache:
+    def test_second_run_is_a_hit(self, tmp_path):
+        cache = build_cache.BuildCache(str(tmp_path / "cache"))
+        first = build_stage(cache, tmp_path, "mix", 10)
+
+        second = build_stage(cache, tmp_path, "mix", 10)
+
+        assert (first.status, second.status) == ("built", "hit")
+        assert second.paths == first.paths
+
+
+class TestPrune:
+    def test_removes_outputs_unused_for_longer_than_max_age(self, tmp_path):
+        cache = build_cache.BuildCache(str(tmp_path / "cache"), max_age_sec=3600)
+        old = build_stage(cache, tmp_path, "old", 10)
+        age(old, 7200)
+        cache.plan = []
+        recent = build_stage(cache, tmp_path, "recent", 10)
+
+        removed, freed = cache.prune()
+
+        assert removed == 1 and freed >= 10
+        assert cache.lookup("old", old.key) is None
+        assert cache.lookup("recent", recent.key) is not None
+
+    def test_removes_least_recently_used_outputs_over_max_bytes(self, tmp_path):
+        cache = build_cache.BuildCache(str(tmp_path / "cache"), max_bytes=2500)
+        results = [build_stage(cache, tmp_path, f"stage{i}", 1000) for i in range(3)]
+        for i, result in enumerate(results):
+            age(result, 300 - i * 100)
+        # stage0 は最も古く作られたが、最後に使われた
+        assert cache.lookup("stage0", results[0].key) is not None
+        cache.plan = []
+
+        removed, freed = cache.prune()
+
+        assert removed == 1 and freed >= 1000
+        assert cache.lookup("stage1", results[1].key) is None
+        assert cache.lookup("stage0", results[0].key) is not None
+        assert cache.lookup("stage2", results[2].key) is not None
+
+    def test_keeps_outputs_used_by_this_build(self, tmp_path):
+        cache = build_cache.BuildCache(str(tmp_path / "cache"), max_bytes=0)
+        result = build_stage(cache, tmp_path, "mix", 10)
+
+        assert cache.prune() == (0, 0)
+        assert cache.lookup("mix", result.key) is not None
+
+    def test_dry_run_removes_nothing(self, tmp_path):
+        build_stage(build_cache.BuildCache(str(tmp_path / "cache")), tmp_path, "mix", 10)
+        cache = build_cache.BuildCache(str(tmp_path / "cache"), dry_run=True, max_bytes=0)
+
+        assert cache.prune() == (0, 0)
+
+    def test_limits_from_env(self):
+        assert build_cache.limits_from_env({}) == {"max_bytes": 20 * 10**9, "max_age_sec": 30 * 86400}
+        assert build_cache.limits_from_env({"BUILD_CACHE_MAX_GB": "0", "BUILD_CACHE_MAX_AGE_DAYS": "0"}) == {
+            "max_bytes": None,
+            "max_age_sec": None,
+        }
@@ -0,0 +1,292 @@
+"""
+audio_process/downloads.py のテスト
+
+http.server でモデル配布サーバー (Hugging Face の 302 + CDN) の代わりを立て、
+Range での再開・If-Range の不一致・sha256 の不一致・HEAD の失敗を確認する。
+"""
+import os
+import sys
+import json
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'audio_process'))
+
+import downloads
+
+CONTENT = bytes(range(256)) * 400
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+class FakeHub:
+    """/resolve/<name> は X-Linked-Etag 付きの 302 を返し、/cdn/<name> が中身を返す"""
+
+    def __init__(self):
+        self.content = CONTENT
+        self.etag = '"cdn-v1"'
+        self.linked_sha256 = SHA256
+        self.head_status = 200
+        self.send_content_length = True
+        # 最初の GET で送るバイト数 (途中で接続が切れる場合)
+        self.truncate_first_get = None
+        self.requests = []
+
+        hub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                hub.handle(self, head=True)
+
+            def do_GET(self):
+                hub.handle(self, head=False)
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/resolve/model.pth"
+
+    def handle(self, handler, head):
+        self.requests.append((handler.command, handler.path, dict(handler.headers)))
+        if handler.path.startswith("/resolve/"):
+            handler.send_response(302)
+            handler.send_header("Location", handler.path.replace("/resolve/", "/cdn/"))
+            handler.send_header("X-Linked-Etag", f'"{self.linked_sha256}"')
+            handler.send_header("Content-Length", "0")
+            handler.end_headers()
+            return
+        if head and self.head_status != 200:
+            handler.send_response(self.head_status)
+            handler.end_headers()
+            return
+
+        body, status = self.content, 200
+        total = len(self.content)
+        range_header = handler.headers.get("Range")
+        if_range = handler.headers.get("If-Range")
+        if range_header and (if_range is None or if_range == self.etag):
+            offset = int(range_header.removeprefix("bytes=").rstrip("-"))
+            if offset >= total:
+                handler.send_response(416)
+                handler.send_header("Content-Range", f"bytes */{total}")
+                handler.send_header("Content-Length", "0")
+                handler.end_headers()
+                return
+            body, status = self.content[offset:], 206
+
+        handler.send_response(status)
+        handler.send_header("ETag", self.etag)
+        handler.send_header("Accept-Ranges", "bytes")
+        if status == 206:
+            handler.send_header("Content-Range", f"bytes {total - len(body)}-{total - 1}/{total}")
+        if self.send_content_length or not head:
+            handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        if head:
+            return
+        if self.truncate_first_get is not None:
+            body = body[:self.truncate_first_get]
+            self.truncate_first_get = None
+            handler.wfile.write(body)
+            handler.close_connection = True
+            return
+        handler.wfile.write(body)
+
+    def gets(self):
+        return [headers for method, path, headers in self.requests if method == "GET" and path.startswith("/cdn/")]
+
+
+@pytest.fixture
+def hub():
+    hub = FakeHub()
+    hub.thread.start()
+    yield hub
+    hub.server.shutdown()
+    hub.server.server_close()
+
+
+@pytest.fixture(autouse=True)
+def no_retry_wait(monkeypatch):
+    monkeypatch.setattr(downloads.time, "sleep", lambda sec: None)
+
+
+def read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class TestDownload:
+    def test_verifies_sha256_from_redirect(self, hub, tmp_path):
+        dest = str(tmp_path / "model.pth")
+
+        downloads.download(hub.url, dest)
+
+        assert read(dest) == CONTENT
+        record = json.loads(read(dest + ".download.json"))
+        assert record["sha256"] == SHA256
+        assert not os.path.exists(dest + ".part")
+
+    def test_sha256_mismatch_deletes_the_download(self, hub, tmp_path):
+        hub.linked_sha256 = "0" * 64
+        dest = str(tmp_path / "model.pth")
+
+        with pytest.raises(IOError, match="Checksum mismatch"):
+            downloads.download(hub.url, dest)
+
+        assert not os.path.exists(dest)
+        assert not os.path.exists(dest + ".part")
+
+    def test_resumes_part_with_range(self, hub, tmp_path):
+        dest = str(tmp_path / "model.pth")
+        write(dest + ".part", CONTENT[:10000])
+        write(dest + ".part.json", json.dumps({"etag": hub.etag, "sha256": SHA256}).encode())
+
+        downloads.download(hub.url, dest)
+
+        assert read(dest) == CONTENT
+        (get,) = hub.gets()
+        assert get["Range"] == "bytes=10000-"
+        assert get["If-Range"] == hub.etag
+
+    def test_resumes_after_interrupted_transfer(self, hub, tmp_path, monkeypatch):
+        # 読み込みの単位より手前で切れた分は書かれないので、単位を小さくして途中まで書かせる
+        monkeypatch.setattr(downloads, "CHUNK_SIZE", 4096)
+        hub.truncate_first_get = 30000
+        dest = str(tmp_path / "model.pth")
+
+        downloads.download(hub.url, dest)
+
+        assert read(dest) == CONTENT
+        first, second = hub.gets()
+        assert "Range" not in first
+        offset = int(second["Range"].removeprefix("bytes=").rstrip("-"))
+        assert 0 < offset <= 30000
+
+    def test_if_range_mismatch_restarts_from_the_beginning(self, hub, tmp_path):
+        dest = str(tmp_path / "model.pth")
+        # 前回は別の版を途中まで落としていた
+        write(dest + ".part", b"x" * 10000)
+        write(dest + ".part.json", json.dumps({"etag": '"cdn-v0"', "sha256": None}).encode())
+
+        downloads.download(hub.url, dest)
+
+        assert read(dest) == CONTENT
+        (get,) = hub.gets()
+        assert get["If-Range"] == '"cdn-v0"'
+
+    def test_existing_file_with_record_is_not_checked_again(self, hub, tmp_path):
+        dest = str(tmp_path / "model.pth")
+        downloads.download(hub.url, dest)
+        hub.requests.clear()
+
+        downloads.download(hub.url, dest)
+
+        assert hub.requests == []
+
+
+class TestExistingFileWithoutRecord:
+    def test_truncated_file_is_resumed(self, hub, tmp_path):
+        dest = str(tmp_path / "model.pth")
+        write(dest, CONTENT[:5000])
+
+        downloads.download(hub.url, dest)
+
+        assert read(dest) == CONTENT
+        (get,) = hub.gets()
+        assert get["Range"] == "bytes=5000-"
+
+    def test_head_failure_keeps_the_file_in_place(self, hub, tmp_path):
+        # オフラインのコンテナに以前の実装で落としたモデルがある場合
+        hub.head_status = 503
+        dest = str(tmp_path / "model.pth")
+        write(dest, CONTENT)
+
+        downloads.download(hub.url, dest)
+
+        assert read(dest) == CONTENT
+        assert hub.gets() == []
+        # 確かめていないので記録は書かず、次につながったときに確かめる
+        assert not os.path.exists(dest + ".download.json")
+        assert not os.path.exists(dest + ".part")
+
+    def test_unreachable_server_keeps_the_file_in_place(self, hub, tmp_path):
+        dest = str(tmp_path / "model.pth")
+        write(dest, CONTENT[:5000])
+        hub.server.shutdown()
+        hub.server.server_close()
+
+        downloads.download(hub.url, dest)
+
+        assert read(dest) == CONTENT[:5000]
+        assert not os.path.exists(dest + ".part")
+
+    def test_truncated_file_is_resumed_once_the_server_is_reachable(self, hub, tmp_path):
+        hub.head_status = 503
+        dest = str(tmp_path / "model.pth")
+        write(dest, CONTENT[:5000])
+        downloads.download(hub.url, dest)
+        hub.head_status = 200
+
+        downloads.download(hub.url, dest)
+
+        assert read(dest) == CONTENT
+        (get,) = hub.gets()
+        assert get["Range"] == "bytes=5000-"
+
+    def test_missing_content_length_does_not_delete_the_file(self, hub, tmp_path):
+        hub.send_content_length = False
+        hub.linked_sha256 = "not-a-sha"
+        dest = str(tmp_path / "model.pth")
+        write(dest, CONTENT)
+
+        downloads.download(hub.url, dest)
+
+        assert read(dest) == CONTENT
+        (get,) = hub.gets()
+        assert get["Range"] == f"bytes={len(CONTENT)}-"
+
+    def test_corrupted_file_of_the_right_size_is_downloaded_again(self, hub, tmp_path):
+        dest = str(tmp_path / "model.pth")
+        write(dest, b"x" * len(CONTENT))
+
+        downloads.download(hub.url, dest)
+
+        assert read(dest) == CONTENT
+        (get,) = hub.gets()
+        assert "Range" not in get
+
+
+class TestDownloadAll:
+    def test_each_worker_thread_gets_its_own_session(self, hub, tmp_path, monkeypatch):
+        sessions = []
+        original = downloads.download
+
+        def spy(url, dest_path, sha256=None, session=None, retries=downloads.RETRIES):
+            sessions.append((threading.get_ident(), session))
+            return original(url, dest_path, sha256, session, retries)
+
+        monkeypatch.setattr(downloads, "download", spy)
+        items = [(hub.url, str(tmp_path / f"model{i}.pth"), SHA256) for i in range(6)]
+
+        downloads.download_all(items, max_workers=3)
+
+        assert all(read(dest) == CONTENT for _, dest, _ in items)
+        by_thread = {}
+        for thread, session in sessions:
+            by_thread.setdefault(thread, set()).add(id(session))
+        assert all(len(ids) == 1 for ids in by_thread.values())
+        assert len({id(session) for _, session in sessions}) == len(by_thread)
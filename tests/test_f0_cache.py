@@ -0,0 +1,140 @@
+"""
+F0 キャッシュ (f0_engines.F0Cache と RVCEngine の get_f0 の差し替え) のテスト
+
+ピッチシフト前の F0 をキャッシュし、シフトとメル量子化を後からかけ直しても、
+rvc_python の Pipeline.get_f0 がシフト込みで推定した結果と同じになること、
+pitch_shift を変えた再変換では F0 を推定し直さないことを、偽の F0 エンジンで確認する。
+"""
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'audio_process'))
+
+import f0_engines
+import rvc_engine
+
+SR = 16000
+HOP = 160
+
+
+def rvc_python_get_f0_tail(f0, f0_up_key):
+    """rvc_python の Pipeline.get_f0 の後半 (シフトと量子化) をそのまま写したもの"""
+    f0_min, f0_max = 50, 1100
+    f0_mel_min = 1127 * np.log(1 + f0_min / 700)
+    f0_mel_max = 1127 * np.log(1 + f0_max / 700)
+    f0 = f0 * pow(2, f0_up_key / 12)
+    f0bak = f0.copy()
+    f0_mel = 1127 * np.log(1 + f0 / 700)
+    f0_mel[f0_mel > 0] = (f0_mel[f0_mel > 0] - f0_mel_min) * 254 / (f0_mel_max - f0_mel_min) + 1
+    f0_mel[f0_mel <= 1] = 1
+    f0_mel[f0_mel > 255] = 255
+    return np.rint(f0_mel).astype(np.int32), f0bak
+
+
+def voiced_f0(p_len, dtype):
+    """無声 (0) の区間を含む F0 曲線"""
+    f0 = 100 + 300 * np.abs(np.sin(np.arange(p_len) / 20))
+    f0[::7] = 0
+    return f0.astype(dtype)
+
+
+@pytest.fixture
+def counting_engine(monkeypatch):
+    calls = []
+
+    def extract(pipeline, x, p_len, filter_radius):
+        calls.append(len(x))
+        return voiced_f0(p_len, np.float32)
+
+    monkeypatch.setitem(f0_engines.ENGINES, "counted", extract)
+    return calls
+
+
+def wrapped_pipeline(cache_dir):
+    """モデルを読み込まずに、RVCEngine の get_f0 の差し替えだけを行う"""
+    def original_get_f0(*args):
+        raise AssertionError("the original get_f0 is only used for inp_f0")
+
+    pipeline = types.SimpleNamespace(sr=SR, window=HOP, get_f0=original_get_f0)
+    engine = object.__new__(rvc_engine.RVCEngine)
+    engine.rvc = types.SimpleNamespace(vc=types.SimpleNamespace(pipeline=pipeline))
+    engine._wrap_get_f0()
+    engine.f0 = f0_engines.F0Extractor(pipeline, ["counted"], f0_engines.F0Cache(cache_dir))
+    return pipeline, engine
+
+
+class TestShiftAfterCache:
+    @pytest.mark.parametrize("dtype", [np.float32, np.float64])
+    @pytest.mark.parametrize("f0_up_key", [-7, 0, 5, 12])
+    def test_matches_rvc_python_arithmetic(self, dtype, f0_up_key):
+        f0 = voiced_f0(500, dtype)
+
+        coarse, shifted = f0_engines.f0_to_coarse(f0 * pow(2, f0_up_key / 12))
+        expected_coarse, expected_shifted = rvc_python_get_f0_tail(f0, f0_up_key)
+
+        np.testing.assert_array_equal(coarse, expected_coarse)
+        np.testing.assert_array_equal(shifted, expected_shifted)
+
+    def test_pitch_shift_sweep_extracts_once(self, counting_engine, tmp_path):
+        pipeline, engine = wrapped_pipeline(str(tmp_path))
+        x = np.random.default_rng(0).standard_normal(SR * 3)
+        p_len = len(x) // HOP
+
+        for f0_up_key in (0, 4, -3):
+            coarse, shifted = pipeline.get_f0("vocals.wav", x, p_len, f0_up_key, "counted", 3)
+            expected_coarse, expected_shifted = rvc_python_get_f0_tail(voiced_f0(p_len, np.float32), f0_up_key)
+            np.testing.assert_array_equal(coarse, expected_coarse)
+            np.testing.assert_array_equal(shifted, expected_shifted)
+
+        assert len(counting_engine) == 1
+        assert (engine.f0_cache.hits, engine.f0_cache.misses) == (2, 1)
+
+    def test_cache_is_shared_across_processes(self, counting_engine, tmp_path):
+        x = np.random.default_rng(0).standard_normal(SR)
+        first, _ = wrapped_pipeline(str(tmp_path))
+        first.get_f0("vocals.wav", x, len(x) // HOP, 0, "counted", 3)
+
+        # 別のワーカープロセス相当 (新しいキャッシュのインスタンス)
+        second, engine = wrapped_pipeline(str(tmp_path))
+        second.get_f0("vocals.wav", x, len(x) // HOP, 12, "counted", 3)
+
+        assert len(counting_engine) == 1
+        assert engine.f0_cache.hits == 1
+
+
+class TestF0Cache:
+    def test_key_depends_on_audio_length_and_method(self, tmp_path):
+        cache = f0_engines.F0Cache(str(tmp_path))
+        x = np.zeros(SR, dtype=np.float64)
+        key = cache.path(x, 100, "crepe", 3)
+
+        assert cache.path(x.copy(), 100, "crepe", 3) == key
+        assert cache.path(x + 1e-9, 100, "crepe", 3) != key
+        assert cache.path(x, 101, "crepe", 3) != key
+        assert cache.path(x, 100, "rmvpe", 3) != key
+        assert cache.path(x.astype(np.float32), 100, "crepe", 3) != key
+
+    def test_filter_radius_only_matters_for_harvest(self, tmp_path):
+        cache = f0_engines.F0Cache(str(tmp_path))
+        x = np.zeros(SR)
+
+        assert cache.path(x, 100, "crepe", 3) == cache.path(x, 100, "crepe", 5)
+        assert cache.path(x, 100, "harvest", 3) != cache.path(x, 100, "harvest", 5)
+
+    def test_unreadable_entry_is_a_miss_and_is_rewritten(self, counting_engine, tmp_path):
+        pipeline, engine = wrapped_pipeline(str(tmp_path))
+        x = np.random.default_rng(0).standard_normal(SR)
+        pipeline.get_f0("vocals.wav", x, len(x) // HOP, 0, "counted", 3)
+        (entry,) = os.listdir(tmp_path)
+        (tmp_path / entry).write_bytes(b"truncated")
+
+        pipeline.get_f0("vocals.wav", x, len(x) // HOP, 0, "counted", 3)
+
+        assert len(counting_engine) == 2
+        assert np.load(tmp_path / entry).shape == (len(x) // HOP,)
+        assert os.listdir(tmp_path) == [entry]
@@ -0,0 +1,108 @@
+"""
+audio_process/f0_engines.py のテスト
+
+F0Extractor のフォールバックが、音声全体で 1 回呼ばれたとき (チャンク変換なし) にも
+失敗した窓だけに効くことを、偽の F0 エンジンで確認する。
+"""
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'audio_process'))
+
+import f0_engines
+
+SR = 16000
+HOP = 160
+
+
+def fake_engine(value, bad=None):
+    """x の値をそのまま F0 にする。bad の範囲 (サンプル位置の値) を含む入力では NaN を返す"""
+    def extract(pipeline, x, p_len, filter_radius):
+        f0 = x[::HOP][:p_len].astype(np.float64) * 0 + value
+        if bad is not None and np.any((x >= bad[0]) & (x < bad[1])):
+            f0[:] = np.nan
+        return f0
+    return extract
+
+
+@pytest.fixture
+def pipeline():
+    return types.SimpleNamespace(sr=SR, window=HOP)
+
+
+@pytest.fixture
+def engines(monkeypatch):
+    # 入力の値をサンプル位置にしておき、どの区間を渡されたかを判別できるようにする
+    monkeypatch.setitem(f0_engines.ENGINES, "primary", fake_engine(200.0, bad=(12 * SR, 13 * SR)))
+    monkeypatch.setitem(f0_engines.ENGINES, "backup", fake_engine(100.0))
+
+
+def positions(sec):
+    return np.arange(int(sec * SR), dtype=np.float64)
+
+
+class TestF0Extractor:
+    def test_uses_primary_when_it_succeeds(self, pipeline, engines):
+        extractor = f0_engines.F0Extractor(pipeline, ["primary", "backup"])
+        x = positions(10)
+
+        f0 = extractor(x, len(x) // HOP, 3)
+
+        assert (f0 == 200.0).all()
+        assert extractor.fallbacks == 0
+
+    def test_falls_back_only_in_the_failed_window(self, pipeline, engines):
+        extractor = f0_engines.F0Extractor(pipeline, ["primary", "backup"], window_sec=5.0, margin_sec=0.5)
+        x = positions(20)
+        p_len = len(x) // HOP
+
+        f0 = extractor(x, p_len, 3)
+
+        assert len(f0) == p_len
+        per_sec = SR // HOP
+        assert (f0[:10 * per_sec] == 200.0).all()
+        assert (f0[10 * per_sec:15 * per_sec] == 100.0).all()
+        assert (f0[15 * per_sec:] == 200.0).all()
+        assert extractor.fallbacks == 1
+
+    def test_single_window_skips_the_primary_on_retry(self, pipeline, monkeypatch):
+        calls = []
+
+        def failing(pipeline, x, p_len, filter_radius):
+            calls.append(len(x))
+            raise RuntimeError("boom")
+
+        monkeypatch.setitem(f0_engines.ENGINES, "primary", failing)
+        monkeypatch.setitem(f0_engines.ENGINES, "backup", fake_engine(100.0))
+        extractor = f0_engines.F0Extractor(pipeline, ["primary", "backup"], window_sec=5.0)
+        x = positions(2)
+
+        f0 = extractor(x, len(x) // HOP, 3)
+
+        assert (f0 == 100.0).all()
+        assert len(calls) == 1
+
+    def test_raises_when_every_engine_fails(self, pipeline, monkeypatch):
+        monkeypatch.setitem(f0_engines.ENGINES, "primary", fake_engine(200.0, bad=(0, SR)))
+        extractor = f0_engines.F0Extractor(pipeline, ["primary"])
+        x = positions(2)
+
+        with pytest.raises(ValueError, match="non-finite"):
+            extractor(x, len(x) // HOP, 3)
+
+    def test_caches_each_window(self, pipeline, engines, tmp_path):
+        cache = f0_engines.F0Cache(str(tmp_path))
+        x = positions(20)
+        first = f0_engines.F0Extractor(pipeline, ["primary", "backup"], cache)(x, len(x) // HOP, 3)
+        cache.hits = cache.misses = 0
+
+        second = f0_engines.F0Extractor(pipeline, ["primary", "backup"], cache)(x, len(x) // HOP, 3)
+
+        np.testing.assert_array_equal(first, second)
+        # 全体は失敗するので保存されず、窓ごとの結果 (3 窓は primary、1 窓は backup) だけが使われる
+        assert cache.hits == 4
@@ -0,0 +1,205 @@
+"""
+video_process/ffmpeg_io.py のテスト
+
+PATH に置いた偽の ffmpeg (エンコードもデコードもしないでバイト列をそのまま渡す) で、
+描画の途中で失敗したときに ffmpeg が止められ、書きかけの動画が残らないことと、
+FFmpegReader がリングバッファにフレームを読み込むことを確認する。
+本物の ffmpeg があれば、エンコードしてから読み戻す往復も確認する。
+"""
+import os
+import sys
+import stat
+import shutil
+import importlib.util
+
+import numpy as np
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+video_dir = os.path.join(project_root, 'video_process')
+sys.path.insert(0, video_dir)
+
+import ffmpeg_io
+
+# 出力先が "-" なら入力 (-i の次の引数) を stdout に、それ以外なら stdin を出力先にそのまま書く
+FAKE_FFMPEG = """#!/bin/sh
+for last; do
+  if [ "$prev" = "-i" ] && [ "$last" != "-" ]; then input=$last; fi
+  prev=$last
+done
+if [ "$last" = "-" ]; then cat "$input"; else cat > "$last"; fi
+"""
+
+
+@pytest.fixture
+def fake_ffmpeg(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    path = bin_dir / "ffmpeg"
+    path.write_text(FAKE_FFMPEG)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+
+@pytest.fixture(scope="module")
+def video_main():
+    # audio_process にも main.py があるので、video_process のものを別名で読み込む
+    pytest.importorskip("cv2")
+    pytest.importorskip("mediapipe")
+    spec = importlib.util.spec_from_file_location("video_main", os.path.join(video_dir, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def standing_pose(frames):
+    landmarks = np.zeros((frames, 33, 4), dtype=np.float32)
+    landmarks[..., 0] = np.linspace(0.4, 0.6, 33)
+    landmarks[..., 1] = np.linspace(0.1, 0.9, 33)
+    landmarks[..., 3] = 0.9
+    return landmarks
+
+
+class TestFFmpegWriter:
+    def test_release_keeps_the_output(self, fake_ffmpeg, tmp_path):
+        output = str(tmp_path / "out.mp4")
+        writer = ffmpeg_io.FFmpegWriter(output, 4, 2, 30)
+        frame = np.arange(24, dtype=np.uint8).reshape(2, 4, 3)
+
+        writer.write(frame)
+        writer.release()
+
+        with open(output, "rb") as f:
+            assert f.read() == frame.tobytes()
+
+    def test_abort_stops_ffmpeg_and_removes_the_output(self, fake_ffmpeg, tmp_path):
+        output = str(tmp_path / "out.mp4")
+        writer = ffmpeg_io.FFmpegWriter(output, 4, 2, 30)
+        writer.write(np.zeros((2, 4, 3), dtype=np.uint8))
+
+        writer.abort()
+
+        assert writer.proc.poll() is not None
+        assert not os.path.exists(output)
+
+    def test_wrong_frame_size_is_rejected(self, fake_ffmpeg, tmp_path):
+        writer = ffmpeg_io.FFmpegWriter(str(tmp_path / "out.mp4"), 4, 2, 30)
+        try:
+            with pytest.raises(ValueError, match="Frame size mismatch"):
+                writer.write(np.zeros((2, 2, 3), dtype=np.uint8))
+        finally:
+            writer.abort()
+
+
+class TestRenderVideo:
+    def test_failure_while_drawing_leaves_no_partial_video(self, video_main, fake_ffmpeg, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        tracer = video_main.VideoTracer()
+        writers = []
+        open_writer = tracer.open_writer
+
+        def spy(*args, **kwargs):
+            out, path = open_writer(*args, **kwargs)
+            writers.append(out)
+            return out, path
+
+        def broken(*args):
+            raise RuntimeError("draw failed")
+
+        monkeypatch.setattr(tracer, "open_writer", spy)
+        monkeypatch.setattr(video_main.skeleton_renderer, "draw_skeleton", broken)
+        output = str(tmp_path / "stickman.mp4")
+
+        with pytest.raises(RuntimeError, match="draw failed"):
+            tracer.render_video(standing_pose(5), 64, 48, 30.0, output_path=output)
+
+        (writer,) = writers
+        assert writer.proc.poll() is not None
+        assert not os.path.exists(output)
+
+    def test_completed_render_keeps_the_video(self, video_main, fake_ffmpeg, tmp_path, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        output = str(tmp_path / "stickman.mp4")
+
+        video_main.VideoTracer().render_video(standing_pose(5), 64, 48, 30.0, output_path=output)
+
+        assert os.path.getsize(output) == 5 * 64 * 48 * 3
+
+
+def gradient_frames(count, width=8, height=6):
+    frames = np.empty((count, height, width, 3), dtype=np.uint8)
+    for i in range(count):
+        frames[i, ..., 0] = i * 40
+        frames[i, ..., 1] = np.arange(width) * 30
+        frames[i, ..., 2] = np.arange(height)[:, None] * 40
+    return frames
+
+
+class TestFFmpegReader:
+    def test_round_trip_through_the_writer(self, fake_ffmpeg, tmp_path):
+        output = str(tmp_path / "out.mp4")
+        frames = gradient_frames(5)
+        writer = ffmpeg_io.FFmpegWriter(output, 8, 6, 30)
+        for frame in frames:
+            writer.write(frame)
+        writer.release()
+
+        reader = ffmpeg_io.FFmpegReader(output, 8, 6)
+        try:
+            read = []
+            while (frame := reader.read()) is not None:
+                read.append(frame.copy())
+        finally:
+            reader.release()
+
+        np.testing.assert_array_equal(np.stack(read), frames)
+
+    def test_reads_into_the_ring_buffers(self, fake_ffmpeg, tmp_path):
+        path = tmp_path / "frames.raw"
+        path.write_bytes(gradient_frames(3).tobytes())
+
+        reader = ffmpeg_io.FFmpegReader(str(path), 8, 6, ring_size=2)
+        try:
+            first, second, third = reader.read(), reader.read(), reader.read()
+            # リングが一周すると同じバッファを上書きする
+            assert first is third
+            assert first is not second
+            np.testing.assert_array_equal(third, gradient_frames(3)[2])
+            assert reader.read() is None
+        finally:
+            reader.release()
+
+    def test_truncated_last_frame_is_dropped(self, fake_ffmpeg, tmp_path):
+        path = tmp_path / "frames.raw"
+        path.write_bytes(gradient_frames(2).tobytes()[:-10])
+
+        reader = ffmpeg_io.FFmpegReader(str(path), 8, 6)
+        try:
+            assert reader.read() is not None
+            assert reader.read() is None
+        finally:
+            reader.release()
+
+    @pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not installed")
+    def test_real_ffmpeg_round_trip(self, tmp_path):
+        output = str(tmp_path / "out.mp4")
+        # yuv420p の色差の間引きで崩れないよう、単色のフレームにする
+        colors = [(0, 0, 255), (0, 255, 0), (255, 0, 0), (128, 128, 128)]
+        frames = np.stack([np.full((48, 64, 3), color, dtype=np.uint8) for color in colors])
+        writer = ffmpeg_io.FFmpegWriter(output, 64, 48, 30)
+        for frame in frames:
+            writer.write(frame)
+        writer.release()
+
+        reader = ffmpeg_io.FFmpegReader(output, 64, 48)
+        try:
+            read = []
+            while (frame := reader.read()) is not None:
+                read.append(frame.copy())
+        finally:
+            reader.release()
+
+        assert len(read) == len(frames)
+        # writer は BGR、reader は RGB。x264 の量子化の分だけずれてよい
+        diff = np.abs(np.stack(read).astype(np.int16) - frames[..., ::-1].astype(np.int16))
+        assert diff.mean() < 8
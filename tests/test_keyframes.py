@@ -0,0 +1,132 @@
+"""
+キーフレームだけ推論して間を補間する trace_frames のテスト
+
+画像の明るさをそのまま x 座標として返す偽の Pose で、推論するフレームの選び方と、
+間のフレームが前後のキーフレームから線形補間されることを確認する。
+"""
+import os
+import sys
+import types
+import importlib.util
+
+import numpy as np
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+video_dir = os.path.join(project_root, 'video_process')
+sys.path.insert(0, video_dir)
+
+import landmark_filters
+
+
+@pytest.fixture(scope="module")
+def video_main():
+    # audio_process にも main.py があるので、video_process のものを別名で読み込む
+    pytest.importorskip("cv2")
+    pytest.importorskip("mediapipe")
+    spec = importlib.util.spec_from_file_location("video_main", os.path.join(video_dir, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class FrameReader:
+    def __init__(self, frames):
+        self.frames = list(frames)
+
+    def read(self):
+        return self.frames.pop(0) if self.frames else None
+
+
+class BrightnessPose:
+    """画像の平均輝度 / 255 を全関節の x にする。missing に入っている輝度では見失う"""
+
+    def __init__(self, missing=()):
+        self.missing = set(missing)
+        self.calls = []
+
+    def process(self, image):
+        level = int(image.mean())
+        self.calls.append(level)
+        if level in self.missing:
+            return types.SimpleNamespace(pose_landmarks=None)
+        landmark = types.SimpleNamespace(x=level / 255, y=0.5, z=0.0, visibility=0.9)
+        return types.SimpleNamespace(pose_landmarks=types.SimpleNamespace(landmark=[landmark] * 33))
+
+
+def ramp(levels):
+    return [np.full((36, 64, 3), level, dtype=np.uint8) for level in levels]
+
+
+class TestTraceFrames:
+    def test_infers_every_nth_frame_and_interpolates_between(self, video_main):
+        levels = np.arange(10) * 20
+        pose = BrightnessPose()
+
+        landmarks, inferred = video_main.trace_frames(FrameReader(ramp(levels)), pose, 0, 10, keyframe_interval=3)
+
+        # 区間の最初と最後は必ず推論する
+        assert np.flatnonzero(inferred).tolist() == [0, 3, 6, 9]
+        assert len(pose.calls) == 4
+        np.testing.assert_allclose(landmarks[:, 0, 0], levels / 255, atol=1e-6)
+
+    def test_motion_above_threshold_forces_inference(self, video_main):
+        levels = [0, 0, 0, 200, 200, 200, 200, 200, 200, 200]
+        pose = BrightnessPose()
+
+        _, inferred = video_main.trace_frames(
+            FrameReader(ramp(levels)), pose, 0, 10, keyframe_interval=4, motion_threshold=10
+        )
+
+        assert np.flatnonzero(inferred).tolist() == [0, 3, 7, 9]
+
+    def test_failed_keyframe_stays_missing(self, video_main):
+        levels = np.arange(7) * 20
+        pose = BrightnessPose(missing={60})
+
+        landmarks, inferred = video_main.trace_frames(FrameReader(ramp(levels)), pose, 0, 7, keyframe_interval=3)
+
+        assert inferred[3]
+        # 見失ったキーフレームは NaN のまま、間のフレームは検出できた前後のキーフレームから埋める
+        assert np.isnan(landmarks[3]).all()
+        keep = [0, 1, 2, 4, 5, 6]
+        np.testing.assert_allclose(landmarks[keep, 0, 0], levels[keep] / 255, atol=1e-6)
+
+    def test_warmup_frames_are_inferred_but_dropped(self, video_main):
+        levels = np.arange(8) * 20
+        pose = BrightnessPose()
+
+        landmarks, inferred = video_main.trace_frames(
+            FrameReader(ramp(levels)), pose, 3, 8, first=0, keyframe_interval=2
+        )
+
+        assert len(landmarks) == 5
+        assert pose.calls[0] == 0
+        np.testing.assert_allclose(landmarks[:, 0, 0], levels[3:] / 255, atol=1e-6)
+
+
+class TestInterpolateKeyframes:
+    def test_leaves_edges_without_two_keyframes(self):
+        landmarks = np.full((6, 33, 4), np.nan, dtype=np.float32)
+        landmarks[1] = 0.2
+        landmarks[3] = 0.4
+        inferred = np.array([False, True, False, True, False, False])
+
+        out = landmark_filters.interpolate_keyframes(landmarks, inferred)
+
+        np.testing.assert_allclose(out[2], 0.3, atol=1e-6)
+        assert np.isnan(out[[0, 4, 5]]).all()
+
+
+class TestLandmarkError:
+    def test_measures_pixels_on_visible_reference_points(self):
+        reference = np.zeros((2, 33, 4), dtype=np.float32)
+        reference[..., 3] = 0.9
+        reference[1, 5:, 3] = 0.1
+        landmarks = reference.copy()
+        landmarks[..., 0] += 0.01
+
+        error = landmark_filters.landmark_error(landmarks, reference, 1000, 500)
+
+        assert error["points"] == 33 + 5
+        assert error["mean_px"] == pytest.approx(10, abs=1e-3)
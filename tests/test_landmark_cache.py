@@ -0,0 +1,88 @@
+"""
+video_process/landmark_cache.py のテスト
+
+float16 の .npy に保存したランドマークが、NaN (未検出) も含めて描画に影響しない精度で
+読み戻せることと、キャッシュキーが動画の中身と Pose の設定で変わることを確認する。
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'video_process'))
+
+import landmark_cache
+
+
+def traced_landmarks(frames=120):
+    rng = np.random.default_rng(0)
+    landmarks = rng.random((frames, 33, 4), dtype=np.float32)
+    landmarks[10:15] = np.nan
+    return landmarks
+
+
+class TestSaveLoad:
+    def test_round_trip_within_float16_precision(self, tmp_path):
+        landmarks = traced_landmarks()
+        meta = {"width": 1920, "height": 1080, "fps": 29.97}
+        path = landmark_cache.cache_path(str(tmp_path / "landmarks"), "key")
+
+        landmark_cache.save_landmarks(path, landmarks, meta)
+        loaded, loaded_meta = landmark_cache.load_landmarks(path)
+
+        assert loaded_meta == meta
+        assert loaded.dtype == np.float16
+        assert isinstance(loaded, np.memmap)
+        assert loaded.shape == landmarks.shape
+        np.testing.assert_array_equal(np.isnan(loaded), np.isnan(landmarks))
+        # [0, 1] の値は float16 で 2^-11 まで丸まる
+        np.testing.assert_allclose(loaded.astype(np.float32), landmarks, atol=2 ** -11)
+
+    def test_precision_is_below_one_pixel_at_1080p(self, tmp_path):
+        skeleton_renderer = pytest.importorskip("skeleton_renderer")
+        landmarks = traced_landmarks()
+        landmarks[..., 3] = 1.0
+        path = landmark_cache.cache_path(str(tmp_path), "key")
+
+        landmark_cache.save_landmarks(path, landmarks, {})
+        loaded, _ = landmark_cache.load_landmarks(path)
+
+        offsets = np.zeros(len(landmarks))
+        expected, visible = skeleton_renderer.project(landmarks, offsets, 1920, 1080)
+        actual, _ = skeleton_renderer.project(loaded.astype(np.float32), offsets, 1920, 1080)
+        assert np.abs(actual[visible] - expected[visible]).max() <= 1
+
+    def test_leaves_no_temporary_files(self, tmp_path):
+        path = landmark_cache.cache_path(str(tmp_path), "key")
+
+        landmark_cache.save_landmarks(path, traced_landmarks(), {})
+
+        assert sorted(os.listdir(tmp_path)) == ["key.json", "key.npy"]
+
+    def test_missing_meta_is_a_miss(self, tmp_path):
+        path = landmark_cache.cache_path(str(tmp_path), "key")
+        landmark_cache.save_landmarks(path, traced_landmarks(), {})
+        os.remove(landmark_cache.meta_path(path))
+
+        assert landmark_cache.load_landmarks(path) == (None, None)
+
+
+class TestCacheKey:
+    def test_depends_on_content_and_options(self, tmp_path):
+        video = tmp_path / "input.mp4"
+        video.write_bytes(b"frame data")
+        key = landmark_cache.cache_key(str(video), {"model_complexity": 1})
+
+        assert landmark_cache.cache_key(str(video), {"model_complexity": 1}) == key
+        assert landmark_cache.cache_key(str(video), {"model_complexity": 2}) != key
+        video.write_bytes(b"other data")
+        assert landmark_cache.cache_key(str(video), {"model_complexity": 1}) != key
+
+    def test_precomputed_digest_matches(self, tmp_path):
+        video = tmp_path / "input.mp4"
+        video.write_bytes(b"frame data")
+        digest = landmark_cache.file_sha256(str(video))
+
+        assert landmark_cache.cache_key("unused", {}, digest=digest) == landmark_cache.cache_key(str(video), {})
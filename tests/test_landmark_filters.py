@@ -0,0 +1,130 @@
+"""
+video_process の欠けの補間とセンタリングのテスト
+
+fill_gaps は関節ごとに補間するので、見失ったフレームの一部の関節だけが埋まることがある。
+そのようなフレームでもセンタリングのオフセットが NaN にならないことを確認する。
+"""
+import os
+import sys
+import importlib.util
+
+import numpy as np
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+video_dir = os.path.join(project_root, 'video_process')
+sys.path.insert(0, video_dir)
+
+import landmark_filters
+
+LEFT_WRIST, LEFT_HIP, RIGHT_HIP = 15, 23, 24
+
+
+@pytest.fixture(scope="module")
+def video_main():
+    # audio_process にも main.py があるので、video_process のものを別名で読み込む
+    pytest.importorskip("cv2")
+    pytest.importorskip("mediapipe")
+    spec = importlib.util.spec_from_file_location("video_main", os.path.join(video_dir, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def tracer(video_main, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return video_main.VideoTracer()
+
+
+def standing_pose(frames, x=0.4):
+    landmarks = np.zeros((frames, 33, 4), dtype=np.float32)
+    landmarks[..., 0] = x + np.linspace(-0.1, 0.1, 33)
+    landmarks[..., 1] = np.linspace(0.1, 0.9, 33)
+    landmarks[..., 3] = 0.9
+    return landmarks
+
+
+def partially_bridged_gap():
+    """フレーム 4-6 を見失い、腰だけはその後も見えない (腰の欠けは補間できない)"""
+    landmarks = standing_pose(12)
+    landmarks[4:7] = np.nan
+    landmarks[4:, LEFT_HIP, 3] = 0.1
+    landmarks[4:, RIGHT_HIP, 3] = 0.1
+    return landmarks
+
+
+class TestFillGaps:
+    def test_interpolates_each_joint_between_good_frames(self):
+        landmarks = standing_pose(5)
+        landmarks[:, LEFT_WRIST, 0] = [0.1, 0.2, np.nan, 0.4, 0.5]
+
+        filled = landmark_filters.fill_gaps(landmarks)
+
+        assert filled[2, LEFT_WRIST, 0] == pytest.approx(0.3)
+
+    def test_leaves_gaps_longer_than_max_gap(self):
+        landmarks = standing_pose(10)
+        landmarks[2:8] = np.nan
+
+        filled = landmark_filters.fill_gaps(landmarks, max_gap=3)
+
+        assert np.isnan(filled[2:8]).all()
+
+    def test_gap_only_some_joints_can_bridge(self):
+        filled = landmark_filters.fill_gaps(partially_bridged_gap())
+
+        assert np.isfinite(filled[4:7, LEFT_WRIST, :2]).all()
+        assert np.isnan(filled[4:7, LEFT_HIP, 0]).all()
+
+
+class TestCenteringOffsets:
+    def test_partially_filled_frames_do_not_poison_the_offset(self, tracer):
+        landmarks = landmark_filters.fill_gaps(partially_bridged_gap())
+
+        filled, offsets, has_pose = tracer.centering_offsets(landmarks)
+
+        assert has_pose.all()
+        assert np.isfinite(offsets).all()
+        assert np.isfinite(tracer.smooth_offset_x)
+        # 基準点の求まらないフレームは直前のポーズを使う
+        np.testing.assert_array_equal(filled[4:7], np.broadcast_to(landmarks[3], (3, 33, 4)))
+
+    def test_render_path_keeps_drawing_after_the_gap(self, tracer):
+        landmarks = tracer.postprocess_landmarks(partially_bridged_gap(), fps=30.0)
+
+        filled, offsets, has_pose = tracer.centering_offsets(landmarks)
+
+        assert np.isfinite(offsets).all()
+        assert has_pose[-1]
+
+
+def loop_forward_backward_ema(values, alpha):
+    """ベクトル化する前の実装 (フレームごとのループ)"""
+    out = values.astype(np.float64, copy=True)
+    for idx in range(1, len(out)):
+        out[idx] = alpha * out[idx] + (1 - alpha) * out[idx - 1]
+    for idx in range(len(out) - 2, -1, -1):
+        out[idx] = alpha * out[idx] + (1 - alpha) * out[idx + 1]
+    return out
+
+
+class TestForwardBackwardEma:
+    @pytest.mark.parametrize("alpha", [0.2, 0.5, 0.9])
+    def test_matches_frame_loop(self, alpha):
+        coords = np.random.default_rng(0).random((50, 33, 3)).astype(np.float32)
+
+        smoothed = landmark_filters.forward_backward_ema(coords, alpha=alpha)
+
+        assert smoothed.dtype == np.float32
+        np.testing.assert_allclose(smoothed, loop_forward_backward_ema(coords, alpha), atol=1e-6)
+
+    def test_constant_signal_is_unchanged(self):
+        coords = np.full((10, 33, 3), 0.25, dtype=np.float32)
+
+        np.testing.assert_allclose(landmark_filters.forward_backward_ema(coords), coords, atol=1e-7)
+
+    def test_single_frame(self):
+        coords = np.ones((1, 33, 3), dtype=np.float32)
+
+        np.testing.assert_array_equal(landmark_filters.forward_backward_ema(coords), coords)
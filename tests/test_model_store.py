@@ -0,0 +1,97 @@
+"""
+audio_process/model_store.py のテスト
+
+共有モデルストアにあるモデルがワーカーの models/ より優先され、ストアには書き込まないことと、
+measure がメモリマップ (ファイル由来のページ) と匿名ページの増分を分けて報告することを確認する。
+重みのメモリマップ (map_weights) は torch があるときだけ確認する。
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'audio_process'))
+
+import model_store
+
+SIZE = 64 * model_store.MB
+has_smaps = os.path.exists("/proc/self/smaps_rollup")
+
+
+@pytest.fixture
+def processor(tmp_path):
+    import main
+    processor = main.AudioProcessor(str(tmp_path / "worker"))
+    processor.model_store_dir = str(tmp_path / "store")
+    os.makedirs(processor.model_store_dir)
+    return processor
+
+
+class TestStore:
+    def test_store_copy_is_preferred(self, processor):
+        open(os.path.join(processor.model_store_dir, "zundamon.pth"), "wb").close()
+
+        pth, index = processor.model_paths({"name": "zundamon"})
+
+        assert pth == os.path.join(processor.model_store_dir, "zundamon.pth")
+        # ストアに無いものはワーカーの models/ から
+        assert index == os.path.join(processor.models_dir, "zundamon.index")
+
+    def test_without_store_uses_models_dir(self, processor):
+        processor.model_store_dir = None
+
+        assert processor.model_file("zundamon.pth") == os.path.join(processor.models_dir, "zundamon.pth")
+
+    def test_store_is_never_downloaded_into(self, processor, monkeypatch):
+        import downloads
+        monkeypatch.setattr(downloads, "download", lambda *args, **kwargs: pytest.fail("downloaded into the store"))
+        dest = os.path.join(processor.model_store_dir, "zundamon.pth")
+
+        assert processor.download_file("https://example.invalid/zundamon.pth", dest) == dest
+        assert not os.path.exists(dest)
+
+
+@pytest.mark.skipif(not has_smaps, reason="needs /proc/self/smaps_rollup")
+class TestMeasure:
+    def test_memory_mapped_file_is_reported_as_file_backed(self, tmp_path):
+        path = tmp_path / "weights.bin"
+        with open(path, "wb") as f:
+            f.truncate(SIZE)
+
+        with model_store.measure("mapped") as report:
+            mapped = np.memmap(path, dtype=np.uint8, mode="r")
+            checksum = int(mapped[::4096].sum())
+
+        assert checksum == 0
+        assert report["file_backed_mb"] > 0.8 * SIZE / model_store.MB
+        assert report["anonymous_mb"] < 0.2 * SIZE / model_store.MB
+        del mapped
+
+    def test_copied_weights_are_reported_as_private(self):
+        with model_store.measure("copied") as report:
+            copied = np.ones(SIZE, dtype=np.uint8)
+
+        assert report["anonymous_mb"] > 0.8 * SIZE / model_store.MB
+        assert report["sec"] >= 0
+        del copied
+
+
+class TestMapWeights:
+    def test_matching_tensors_share_the_checkpoint_pages(self, tmp_path):
+        torch = pytest.importorskip("torch")
+        source = torch.nn.Sequential(torch.nn.Linear(64, 64), torch.nn.Linear(64, 8))
+        path = str(tmp_path / "model.pth")
+        state = source.state_dict()
+        state["1.weight"] = state["1.weight"].half()
+        torch.save({"weight": state}, path)
+        module = torch.nn.Sequential(torch.nn.Linear(64, 64), torch.nn.Linear(64, 8))
+
+        mapped = model_store.map_weights(module, path, "weight")
+
+        # dtype の違う 1.weight は変換にコピーが要るので差し替えない
+        assert mapped == (64 * 64 + 64 + 8) * 4
+        torch.testing.assert_close(module[0].weight, source[0].weight)
+        torch.testing.assert_close(module[1].bias, source[1].bias)
+        assert module[1].weight.dtype == torch.float32
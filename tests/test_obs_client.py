@@ -1,8 +1,41 @@
+import json
+import threading
+import time
 import pytest
+from types import SimpleNamespace
 from unittest.mock import MagicMock, patch
-from rct.obs_client import OBSClient
+from rct.obs_client import OBSClient, BatchResult
 from rct.settings import settings
 
+
+def _run_batch(client, failures=None):
+    """send_batch の代わり。failures の (requestType, 何回目) で失敗させ、以降は実行しない"""
+    failures = failures or {}
+    seen = {}
+
+    def send_batch(requests, halt_on_failure=True):
+        results = []
+        for request_type, data in requests:
+            seen[request_type] = seen.get(request_type, 0) + 1
+            if (request_type, seen[request_type]) in failures:
+                results.append(BatchResult(request_type, False, 600, failures[(request_type, seen[request_type])], {}))
+                break
+            response = {}
+            if request_type == "GetStreamStatus":
+                response = {"outputActive": client.client.get_stream_status.return_value.output_active}
+            results.append(BatchResult(request_type, True, 100, None, response))
+        return results
+    return send_batch
+
+
+def _batch_requests(client):
+    return [request for call in client.send_batch.call_args_list for request in call.args[0]]
+
+
+def _media_actions(client):
+    return [data["mediaAction"] for request_type, data in _batch_requests(client) if request_type == "TriggerMediaInputAction"]
+
+
 @pytest.fixture
 def mock_obs_client():
     with patch('obsws_python.ReqClient'):
@@ -14,6 +47,8 @@ def mock_obs_client():
         status = MagicMock()
         status.output_active = False
         client.client.get_stream_status.return_value = status
+        client.client.get_scene_item_id.return_value.scene_item_id = 7
+        client.send_batch = MagicMock(side_effect=_run_batch(client))
         yield client
 
 def test_set_scene(mock_obs_client):
@@ -27,16 +62,16 @@ def test_start_streaming_with_media_restart(mock_obs_client):
             mock_obs_client.start_streaming()
 
         # Check if media restart was triggered (among other actions)
-        mock_obs_client.client.trigger_media_input_action.assert_any_call(
-            'test_video.mp4',
-            "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_RESTART"
-        )
+        assert ("TriggerMediaInputAction", {
+            "inputName": 'test_video.mp4',
+            "mediaAction": "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_RESTART",
+        }) in _batch_requests(mock_obs_client)
         # Check if streaming started
-        mock_obs_client.client.start_stream.assert_called()
+        assert ("StartStream", None) in _batch_requests(mock_obs_client)
 
 
 def test_start_streaming_waits_for_media_buffer_after_restart(mock_obs_client):
-    """media restart 後に MEDIA_BUFFER_WAIT_SEC 秒待つ。
+    """media restart 後に MEDIA_BUFFER_WAIT_SEC 秒待つ (OBS 側の Sleep で、StartStream より前)。
 
     4/30インシデント: 0.012秒で start_stream を呼んだ結果バッファ未蓄積で
     実効0.5fps、YouTubeに stalled stream と判断され15分で切断された。
@@ -44,11 +79,14 @@ def test_start_streaming_waits_for_media_buffer_after_restart(mock_obs_client):
     from rct.obs_client import MEDIA_BUFFER_WAIT_SEC
 
     with patch.object(settings, 'OBS_MEDIA_SOURCE_NAME', 'test_video.mp4'):
-        with patch('rct.obs_client.time.sleep') as mock_sleep:
+        with patch('rct.obs_client.time.sleep'):
             mock_obs_client.start_streaming()
 
-        sleep_durations = [c.args[0] for c in mock_sleep.call_args_list]
-        assert MEDIA_BUFFER_WAIT_SEC in sleep_durations
+        requests = _batch_requests(mock_obs_client)
+        wait = requests.index(("Sleep", {"sleepMillis": MEDIA_BUFFER_WAIT_SEC * 1000}))
+        restart = next(i for i, (t, d) in enumerate(requests) if t == "TriggerMediaInputAction"
+                       and d["mediaAction"] == "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_RESTART")
+        assert restart < wait < requests.index(("StartStream", None))
 
 
 def test_start_streaming_pauses_media_during_warmup(mock_obs_client):
@@ -61,9 +99,7 @@ def test_start_streaming_pauses_media_during_warmup(mock_obs_client):
         with patch('rct.obs_client.time.sleep'):
             mock_obs_client.start_streaming()
 
-        actions = [
-            c.args[1] for c in mock_obs_client.client.trigger_media_input_action.call_args_list
-        ]
+        actions = _media_actions(mock_obs_client)
         assert "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_RESTART" in actions
         assert "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PAUSE" in actions
         assert "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PLAY" in actions
@@ -79,13 +115,13 @@ def test_start_streaming_calls_play_after_start_stream(mock_obs_client):
         with patch('rct.obs_client.time.sleep'):
             mock_obs_client.start_streaming()
 
-        method_names = [c[0] for c in mock_obs_client.client.method_calls]
+        requests = _batch_requests(mock_obs_client)
         # last trigger_media_input_action (PLAY) should come after start_stream
         play_indices = [
-            i for i, c in enumerate(mock_obs_client.client.method_calls)
-            if c[0] == "trigger_media_input_action" and c.args[1] == "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PLAY"
+            i for i, (t, d) in enumerate(requests)
+            if t == "TriggerMediaInputAction" and d["mediaAction"] == "OBS_WEBSOCKET_MEDIA_INPUT_ACTION_PLAY"
         ]
-        start_stream_indices = [i for i, n in enumerate(method_names) if n == "start_stream"]
+        start_stream_indices = [i for i, (t, _) in enumerate(requests) if t == "StartStream"]
         assert play_indices and start_stream_indices
         assert max(play_indices) > min(start_stream_indices)
 
@@ -128,3 +164,328 @@ def test_stop_streaming_treats_501_as_success(mock_obs_client):
     )
     result = mock_obs_client.stop_streaming()
     assert result is True
+
+
+@pytest.fixture
+def cached_obs_client(mock_obs_client):
+    """イベント接続がある (= scene item ID をキャッシュする) 状態"""
+    mock_obs_client.events = MagicMock()
+    yield mock_obs_client
+
+
+def test_set_scene_item_enabled_caches_item_id(cached_obs_client):
+    """2回目以降のトグルは GetSceneItemId を送らず SetSceneItemEnabled の1リクエストだけ。"""
+    cached_obs_client.set_scene_item_enabled("SCENE", "bird", True)
+    cached_obs_client.set_scene_item_enabled("SCENE", "bird", False)
+    cached_obs_client.set_scene_item_enabled("SCENE", "bird", True)
+
+    cached_obs_client.client.get_scene_item_id.assert_called_once_with("SCENE", "bird")
+    assert cached_obs_client.client.set_scene_item_enabled.call_count == 3
+    cached_obs_client.client.set_scene_item_enabled.assert_called_with("SCENE", 7, True)
+    assert cached_obs_client.scene_item_cache_stats() == {"hits": 2, "misses": 1, "size": 1}
+
+
+def test_scene_item_id_not_cached_without_events(mock_obs_client):
+    """イベント接続が無いと無効化できないので、毎回 ID を問い合わせる。"""
+    mock_obs_client.events = None
+    mock_obs_client.set_scene_item_enabled("SCENE", "bird", True)
+    mock_obs_client.set_scene_item_enabled("SCENE", "bird", False)
+    assert mock_obs_client.client.get_scene_item_id.call_count == 2
+    assert mock_obs_client.scene_item_cache_stats()["hits"] == 0
+
+
+def test_scene_item_removed_event_invalidates_cache(cached_obs_client):
+    cached_obs_client.set_scene_item_enabled("SCENE", "bird", True)
+    cached_obs_client.set_scene_item_enabled("SCENE", "video", True)
+
+    cached_obs_client.on_scene_item_removed(SimpleNamespace(scene_name="SCENE", source_name="bird", scene_item_id=7))
+    cached_obs_client.set_scene_item_enabled("SCENE", "bird", False)
+    cached_obs_client.set_scene_item_enabled("SCENE", "video", False)
+
+    lookups = [c.args for c in cached_obs_client.client.get_scene_item_id.call_args_list]
+    assert lookups == [("SCENE", "bird"), ("SCENE", "video"), ("SCENE", "bird")]
+
+
+def test_scene_item_created_event_invalidates_cache(cached_obs_client):
+    cached_obs_client.set_scene_item_enabled("SCENE", "bird", True)
+    cached_obs_client.on_scene_item_created(SimpleNamespace(scene_name="SCENE", source_name="bird", scene_item_id=9))
+    cached_obs_client.set_scene_item_enabled("SCENE", "bird", False)
+    assert cached_obs_client.client.get_scene_item_id.call_count == 2
+
+
+def test_scene_name_changed_event_invalidates_scene(cached_obs_client):
+    cached_obs_client.set_scene_item_enabled("OLD", "bird", True)
+    cached_obs_client.set_scene_item_enabled("OTHER", "bird", True)
+
+    cached_obs_client.on_scene_name_changed(SimpleNamespace(old_scene_name="OLD", scene_name="NEW"))
+    assert cached_obs_client.scene_item_cache_stats()["size"] == 1
+
+    cached_obs_client.set_scene_item_enabled("OLD", "bird", False)
+    cached_obs_client.set_scene_item_enabled("OTHER", "bird", False)
+    assert cached_obs_client.client.get_scene_item_id.call_count == 3
+
+
+def test_stale_cached_item_id_is_refetched_once(cached_obs_client):
+    """イベントを取りこぼして ID が古くなっていたら、引き直して一度だけやり直す。"""
+    from obsws_python.error import OBSSDKRequestError
+
+    cached_obs_client.set_scene_item_enabled("SCENE", "bird", True)
+    cached_obs_client.client.get_scene_item_id.return_value.scene_item_id = 8
+    cached_obs_client.client.set_scene_item_enabled.side_effect = [
+        OBSSDKRequestError("SetSceneItemEnabled", 600, "No scene items were found"),
+        None,
+    ]
+
+    assert cached_obs_client.set_scene_item_enabled("SCENE", "bird", False) is True
+    cached_obs_client.client.set_scene_item_enabled.assert_called_with("SCENE", 8, False)
+    assert cached_obs_client.client.get_scene_item_id.call_count == 2
+
+
+def test_connect_subscribes_to_scene_item_events():
+    with patch('obsws_python.ReqClient'), patch('obsws_python.EventClient') as mock_events:
+        client = OBSClient()
+        assert client.connect() is True
+
+    assert client.events is mock_events.return_value
+    registered = mock_events.return_value.callback.register.call_args.args[0]
+    assert [fn.__name__ for fn in registered] == [
+        "on_scene_item_created",
+        "on_scene_item_removed",
+        "on_scene_name_changed",
+    ]
+
+
+def test_connect_without_events_disables_cache():
+    with patch('obsws_python.ReqClient'), patch('obsws_python.EventClient', side_effect=ConnectionRefusedError):
+        client = OBSClient()
+        assert client.connect() is True
+    assert client.events is None
+
+
+def test_disconnect_closes_events_and_clears_cache(cached_obs_client):
+    events = cached_obs_client.events
+    cached_obs_client.set_scene_item_enabled("SCENE", "bird", True)
+    cached_obs_client.disconnect()
+    events.disconnect.assert_called_once()
+    assert cached_obs_client.events is None
+    assert cached_obs_client.scene_item_cache_stats()["size"] == 0
+
+
+def test_disconnect_closes_request_connection():
+    with patch('obsws_python.ReqClient') as mock_req, patch('obsws_python.EventClient'):
+        client = OBSClient()
+        client.connect()
+        client.disconnect()
+    mock_req.return_value.disconnect.assert_called_once()
+    assert client.client is None
+
+
+def test_reconnect_closes_previous_event_connection():
+    with patch('obsws_python.ReqClient'), patch('obsws_python.EventClient') as mock_events:
+        first, second = MagicMock(), MagicMock()
+        mock_events.side_effect = [first, second]
+        client = OBSClient()
+        client.connect()
+        client.client = None
+        client.connect()
+    first.disconnect.assert_called_once()
+    second.disconnect.assert_not_called()
+    assert client.events is second
+
+
+def test_context_manager_disconnects():
+    with patch('obsws_python.ReqClient') as mock_req, patch('obsws_python.EventClient') as mock_events:
+        with OBSClient() as client:
+            client.connect()
+    mock_events.return_value.disconnect.assert_called_once()
+    mock_req.return_value.disconnect.assert_called_once()
+
+
+class _FakeBatchSocket:
+    """RequestBatch (op 8) に op 9 で応答する websocket。間に別の応答が1つ挟まる"""
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        self.timeouts = []
+        self.sent = []
+
+    def gettimeout(self):
+        return self.timeout
+
+    def settimeout(self, value):
+        self.timeouts.append(value)
+        self.timeout = value
+
+    def send(self, message):
+        self.sent.append(json.loads(message))
+        d = self.sent[-1]["d"]
+        results = [{"requestType": r["requestType"], "requestStatus": {"result": True, "code": 100}} for r in d["requests"]]
+        results[-1] = {
+            "requestType": "GetStreamStatus",
+            "requestStatus": {"result": True, "code": 100},
+            "responseData": {"outputActive": False},
+        }
+        self._responses = [
+            json.dumps({"op": 7, "d": {"requestId": "other"}}),
+            json.dumps({"op": 9, "d": {"requestId": d["requestId"], "results": results}}),
+        ]
+
+    def recv(self):
+        return self._responses.pop(0)
+
+
+def test_send_batch_sends_serial_realtime_batch_and_parses_results():
+    client = OBSClient()
+    client.client = MagicMock()
+    ws = _FakeBatchSocket()
+    client.client.base_client.ws = ws
+
+    results = client.send_batch([("Sleep", {"sleepMillis": 5000}), ("GetStreamStatus", None)])
+
+    batch = ws.sent[0]
+    assert batch["op"] == 8
+    assert batch["d"]["executionType"] == 0
+    assert batch["d"]["haltOnFailure"] is True
+    assert batch["d"]["requests"] == [
+        {"requestType": "Sleep", "requestData": {"sleepMillis": 5000}},
+        {"requestType": "GetStreamStatus"},
+    ]
+    # OBS 側の Sleep の分だけ応答待ちを延ばし、終わったら戻す
+    assert ws.timeouts == [15.0, 10]
+    assert [r.request_type for r in results] == ["Sleep", "GetStreamStatus"]
+    assert all(r.ok for r in results)
+    assert results[1].data == {"outputActive": False}
+
+
+class _ConcurrentSocket:
+    """op 6 には即座に、op 8 には release されてから応答する websocket"""
+
+    def __init__(self):
+        import queue
+        self.replies = queue.Queue()
+        self.sent = []
+        self.release = threading.Event()
+
+    def gettimeout(self):
+        return 10
+
+    def settimeout(self, value):
+        pass
+
+    def send(self, message):
+        d = json.loads(message)
+        self.sent.append(d["op"])
+        if d["op"] == 6:
+            self.replies.put(json.dumps({"op": 7, "d": {"requestId": d["d"]["requestId"], "requestType": "GetVersion"}}))
+        else:
+            reply = json.dumps({"op": 9, "d": {"requestId": d["d"]["requestId"], "results": []}})
+            threading.Thread(target=lambda: (self.release.wait(), self.replies.put(reply)), daemon=True).start()
+
+    def recv(self):
+        return self.replies.get(timeout=2)
+
+
+def test_send_batch_does_not_take_concurrent_request_responses():
+    ws = _ConcurrentSocket()
+
+    def req(req_type, req_data=None):
+        # obsws_python の baseclient.req と同じく、送信直後に受け取った応答を返す
+        ws.send(json.dumps({"op": 6, "d": {"requestType": req_type, "requestId": 1}}))
+        return json.loads(ws.recv())["d"]
+
+    with patch('obsws_python.ReqClient') as mock_req, patch('obsws_python.EventClient'):
+        mock_req.return_value.base_client.ws = ws
+        mock_req.return_value.base_client.req = req
+        mock_req.return_value.get_version = lambda: None
+        client = OBSClient()
+        client.connect()
+
+    batch = threading.Thread(target=client.send_batch, args=([("Sleep", {"sleepMillis": 100})],), daemon=True)
+    batch.start()
+    while not ws.sent:
+        time.sleep(0.01)
+    responses = []
+    other = threading.Thread(target=lambda: responses.append(client.client.base_client.req("GetVersion")), daemon=True)
+    other.start()
+    time.sleep(0.2)
+    sent_while_waiting = list(ws.sent)
+    ws.release.set()
+    batch.join(timeout=2)
+    other.join(timeout=2)
+    # バッチの応答を待つ間は、他のリクエストを送らない
+    assert sent_while_waiting == [8]
+    assert ws.sent == [8, 6]
+    assert responses == [{"requestId": 1, "requestType": "GetVersion"}]
+
+
+def test_media_refresh_is_one_batch_with_obs_side_sleeps(mock_obs_client):
+    """リフレッシュと配信状態の確認は1往復、クライアント側では sleep しない。"""
+    from rct.obs_client import MEDIA_BUFFER_WAIT_SEC
+
+    with patch.object(settings, 'OBS_MEDIA_SOURCE_NAME', 'test_video.mp4'), \
+            patch('rct.obs_client.time.sleep') as mock_sleep:
+        assert mock_obs_client.start_streaming() is True
+
+    refresh, start = [c.args[0] for c in mock_obs_client.send_batch.call_args_list]
+    assert [t for t, _ in refresh] == [
+        "SetSceneItemEnabled", "Sleep", "TriggerMediaInputAction", "TriggerMediaInputAction",
+        "SetSceneItemEnabled", "Sleep", "GetStreamStatus",
+    ]
+    assert refresh[0][1] == {"sceneName": settings.OBS_SCENE_NAME, "sceneItemId": 7, "sceneItemEnabled": False}
+    assert refresh[5][1] == {"sleepMillis": MEDIA_BUFFER_WAIT_SEC * 1000}
+    assert [t for t, _ in start] == ["StartStream", "Sleep", "TriggerMediaInputAction"]
+    mock_sleep.assert_not_called()
+    mock_obs_client.client.get_stream_status.assert_not_called()
+    mock_obs_client.client.start_stream.assert_not_called()
+
+
+def test_media_refresh_step_failure_is_warned_and_stream_still_starts(mock_obs_client):
+    mock_obs_client.send_batch.side_effect = _run_batch(
+        mock_obs_client, {("TriggerMediaInputAction", 1): "No source was found"}
+    )
+    with patch.object(settings, 'OBS_MEDIA_SOURCE_NAME', 'test_video.mp4'), \
+            patch('rct.obs_client.logger') as mock_logger:
+        assert mock_obs_client.start_streaming() is True
+
+    warnings = [c.args[0] for c in mock_logger.warning.call_args_list]
+    assert any(
+        w.startswith("Media refresh failed:") and "TriggerMediaInputAction" in w and "No source was found" in w
+        for w in warnings
+    )
+    # バッチが途中で止まったので配信状態は別に問い合わせる
+    mock_obs_client.client.get_stream_status.assert_called_once()
+    assert ("StartStream", None) in _batch_requests(mock_obs_client)
+
+
+def test_media_refresh_retries_once_with_fresh_item_id(cached_obs_client):
+    """キャッシュした scene item ID が古くて SetSceneItemEnabled が失敗したら、引き直して一度だけやり直す。"""
+    cached_obs_client.set_scene_item_enabled(settings.OBS_SCENE_NAME, "test_video.mp4", True)
+    cached_obs_client.client.get_scene_item_id.return_value.scene_item_id = 8
+    cached_obs_client.send_batch.side_effect = _run_batch(
+        cached_obs_client, {("SetSceneItemEnabled", 1): "No scene items were found"}
+    )
+    with patch.object(settings, 'OBS_MEDIA_SOURCE_NAME', 'test_video.mp4'):
+        assert cached_obs_client.start_streaming() is True
+
+    refreshes = [c.args[0] for c in cached_obs_client.send_batch.call_args_list[:2]]
+    assert refreshes[0][0][1]["sceneItemId"] == 7
+    assert refreshes[1][0][1]["sceneItemId"] == 8
+    assert cached_obs_client.send_batch.call_count == 3
+
+
+def test_start_stream_failure_in_batch_returns_false(mock_obs_client):
+    mock_obs_client.send_batch.side_effect = _run_batch(mock_obs_client, {("StartStream", 1): "Output failed"})
+    with patch.object(settings, 'OBS_MEDIA_SOURCE_NAME', 'test_video.mp4'):
+        assert mock_obs_client.start_streaming() is False
+
+
+def test_play_failure_in_batch_is_only_a_warning(mock_obs_client):
+    mock_obs_client.send_batch.side_effect = _run_batch(
+        mock_obs_client, {("TriggerMediaInputAction", 3): "Media not ready"}
+    )
+    with patch.object(settings, 'OBS_MEDIA_SOURCE_NAME', 'test_video.mp4'), \
+            patch('rct.obs_client.logger') as mock_logger:
+        assert mock_obs_client.start_streaming() is True
+
+    warnings = [c.args[0] for c in mock_logger.warning.call_args_list]
+    assert any(w.startswith("Media play resume failed:") and "Media not ready" in w for w in warnings)
@@ -0,0 +1,214 @@
+"""
+audio_process/onnx_separation.py のテスト
+
+audio-separator の MDXSeparator の代わりに最小限のスタブを使い、
+install() の切り替え条件と、BatchedMDX.demix が元の demix と同じ結果を返すことを確認する。
+"""
+import os
+import sys
+import types
+import weakref
+
+import numpy as np
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'audio_process'))
+
+import onnx_separation
+
+
+class FakeSession:
+    def __init__(self, batch=None):
+        self.batch = batch
+
+    def get_inputs(self):
+        return [types.SimpleNamespace(shape=[self.batch or "batch", 4, 8, 8])]
+
+
+class StubSTFT:
+    """(B, 2, n) <-> (B, 2, 8, n / 8) の並べ替えだけをする STFT の代わり"""
+
+    def __call__(self, x):
+        return x.reshape(x.shape[0], 2, 8, -1)
+
+    def inverse(self, spec):
+        return spec.reshape(spec.shape[0], 2, -1)
+
+
+class StubMDX:
+    """audio-separator 0.17.0 の MDXSeparator.demix / run_model をそのまま写したもの"""
+
+    def __init__(self, segment_size=16, dim_t=16, overlap=0.5, compensate=1.035, enable_denoise=False):
+        self.model_path = "UVR_MDXNET_KARA_2.onnx"
+        self.segment_size = segment_size
+        self.dim_t = dim_t
+        self.dim_f = 8
+        self.n_fft = 32
+        self.hop_length = 8
+        self.overlap = overlap
+        self.compensate = compensate
+        self.enable_denoise = enable_denoise
+        self.invert_using_spec = False
+        self.batch_size = 1
+        self.torch_device = "cpu"
+        self.model_run = None
+
+    def initialize_model_settings(self):
+        self.trim = self.n_fft // 2
+        self.chunk_size = self.hop_length * (self.segment_size - 1)
+        self.gen_size = self.chunk_size - 2 * self.trim
+        self.stft = StubSTFT()
+
+    def run_model(self, mix):
+        import torch
+        spek = self.stft(mix)
+        spek[:, :, :3, :] *= 0
+        if self.enable_denoise:
+            spec_pred = (self.model_run(-spek) * -0.5) + (self.model_run(spek) * 0.5)
+        else:
+            spec_pred = self.model_run(spek)
+        return self.stft.inverse(torch.tensor(spec_pred)).cpu().detach().numpy()
+
+    def demix(self, mix, is_match_mix=False):
+        import torch
+        self.initialize_model_settings()
+        chunk_size, overlap = self.chunk_size, self.overlap
+        gen_size = chunk_size - 2 * self.trim
+        pad = gen_size + self.trim - ((mix.shape[-1]) % gen_size)
+        mixture = np.concatenate((np.zeros((2, self.trim), dtype="float32"), mix, np.zeros((2, pad), dtype="float32")), 1)
+        step = int((1 - overlap) * chunk_size)
+        result = np.zeros((1, 2, mixture.shape[-1]), dtype=np.float32)
+        divider = np.zeros((1, 2, mixture.shape[-1]), dtype=np.float32)
+        for i in range(0, mixture.shape[-1], step):
+            start, end = i, min(i + chunk_size, mixture.shape[-1])
+            window = None
+            if overlap != 0:
+                window = np.tile(np.hanning(end - start)[None, None, :], (1, 2, 1))
+            mix_part_ = mixture[:, start:end]
+            if end != i + chunk_size:
+                mix_part_ = np.concatenate((mix_part_, np.zeros((2, i + chunk_size - end), dtype="float32")), axis=-1)
+            with torch.no_grad():
+                tar_waves = self.run_model(torch.tensor(np.array([mix_part_]), dtype=torch.float32))
+            if window is not None:
+                tar_waves[..., :end - start] *= window
+                divider[..., start:end] += window
+            else:
+                divider[..., start:end] += 1
+            result[..., start:end] += tar_waves[..., :end - start]
+        tar_waves = np.concatenate(np.vstack([result / divider])[:, :, self.trim:-self.trim], axis=-1)[:, :mix.shape[-1]]
+        source = tar_waves[:, 0:None]
+        if not is_match_mix:
+            source *= self.compensate
+        return source
+
+
+def fake_run(spek):
+    """ONNX モデルの代わり。入力によって変わるが線形ではない出力を返す"""
+    x = spek.cpu().numpy() if hasattr(spek, "cpu") else spek
+    return np.tanh(x * 0.7) + 0.01
+
+
+def load_upstream_session(model):
+    """audio-separator の load_model と同じく、セッションを model_run の lambda だけに持たせる"""
+    session = FakeSession()
+    model.model_run = lambda spek: session.run(None, {"input": spek})[0]
+    return weakref.ref(session)
+
+
+@pytest.fixture
+def fake_ort(monkeypatch):
+    # install() の判定だけを見るので、onnxruntime の代わりに FakeSession を返す
+    monkeypatch.setattr(onnx_separation, "ort", types.SimpleNamespace(__version__="test"))
+    if onnx_separation.torch is None:
+        monkeypatch.setattr(onnx_separation, "torch", types.SimpleNamespace())
+    monkeypatch.setattr(onnx_separation, "open_session", lambda *args: FakeSession())
+
+
+class TestInstall:
+    def test_swaps_demix_and_model_run_for_onnxruntime_models(self, fake_ort):
+        model = StubMDX(segment_size=256, dim_t=256)
+        original_demix = model.demix
+        separator = types.SimpleNamespace(model_instance=model)
+
+        engine = onnx_separation.install(separator, intra_op_threads=2, inter_op_threads=1, batch_size=4)
+
+        assert engine is not None
+        assert model.demix == engine.demix
+        assert model.model_run == engine.run
+        assert engine._original_demix == original_demix
+        assert engine.batch_size == 4
+
+    def test_releases_the_upstream_session_before_opening_one(self, fake_ort, monkeypatch):
+        model = StubMDX(segment_size=256, dim_t=256)
+        released = load_upstream_session(model)
+        alive_when_opening = []
+
+        def open_session(*args):
+            alive_when_opening.append(released() is not None)
+            return FakeSession()
+
+        monkeypatch.setattr(onnx_separation, "open_session", open_session)
+        monkeypatch.setattr(onnx_separation, "tune", lambda *args: (open_session(), {"intra_op": 2, "inter_op": 1, "batch_size": 2})[1])
+
+        engine = onnx_separation.install(types.SimpleNamespace(model_instance=model), "cache/tuning.json")
+
+        assert alive_when_opening == [False, False]
+        assert model.model_run == engine.run
+
+    def test_fixed_batch_dimension_overrides_setting(self, fake_ort, monkeypatch):
+        monkeypatch.setattr(onnx_separation, "open_session", lambda *args: FakeSession(batch=1))
+        model = StubMDX(segment_size=256, dim_t=256)
+
+        engine = onnx_separation.install(types.SimpleNamespace(model_instance=model), intra_op_threads=2, inter_op_threads=1, batch_size=4)
+
+        assert engine.batch_size == 1
+
+    def test_leaves_pytorch_inference_models_alone(self, fake_ort):
+        # segment_size != dim_t のとき audio-separator は onnx2torch で PyTorch に変換して推論する
+        model = StubMDX(segment_size=512, dim_t=256)
+        original_demix = model.demix
+
+        engine = onnx_separation.install(types.SimpleNamespace(model_instance=model), intra_op_threads=2, inter_op_threads=1, batch_size=4)
+
+        assert engine is None
+        assert model.demix == original_demix
+
+    def test_leaves_non_mdx_models_alone(self, fake_ort):
+        model = types.SimpleNamespace(model_path="htdemucs.yaml", demix=lambda mix: mix)
+
+        assert onnx_separation.install(types.SimpleNamespace(model_instance=model), intra_op_threads=2, inter_op_threads=1, batch_size=4) is None
+
+    def test_tunes_missing_settings(self, fake_ort, monkeypatch):
+        calls = []
+
+        def fake_tune(model_path, dim_f, dim_t, cache_path):
+            calls.append((model_path, dim_f, dim_t, cache_path))
+            return {"intra_op": 4, "inter_op": 2, "batch_size": 2}
+
+        monkeypatch.setattr(onnx_separation, "tune", fake_tune)
+        model = StubMDX(segment_size=256, dim_t=256)
+
+        engine = onnx_separation.install(types.SimpleNamespace(model_instance=model), "cache/tuning.json", inter_op_threads=1)
+
+        assert calls == [("UVR_MDXNET_KARA_2.onnx", 8, 256, "cache/tuning.json")]
+        assert engine.batch_size == 2
+
+
+class TestBatchedDemix:
+    @pytest.mark.parametrize("batch_size", [1, 3])
+    @pytest.mark.parametrize("enable_denoise", [False, True])
+    def test_matches_original_demix(self, fake_ort, batch_size, enable_denoise):
+        pytest.importorskip("torch")
+        model = StubMDX(compensate=1.035, enable_denoise=enable_denoise)
+        model.model_run = fake_run
+        mix = np.random.default_rng(0).standard_normal((2, 1000)).astype(np.float32) * 0.3
+        expected = model.demix(mix.copy())
+
+        engine = onnx_separation.BatchedMDX(model, 1, 1, batch_size)
+        engine.run = fake_run
+        engine.install()
+        actual = model.demix(mix.copy())
+
+        assert actual.shape == expected.shape == mix.shape
+        np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-6)
@@ -0,0 +1,140 @@
+"""
+video_process のパイプラインモード (run_pipeline / process_video_pipelined) のテスト
+
+ステージ間のキューで順序が保たれ、溜まるフレーム数が queue_size で抑えられること、
+途中のステージの例外で全体が止まることと、パイプラインモードの結果が
+逐次処理と同じランドマークになることを確認する。
+"""
+import os
+import sys
+import time
+import types
+import threading
+import importlib.util
+
+import numpy as np
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+video_dir = os.path.join(project_root, 'video_process')
+sys.path.insert(0, video_dir)
+
+
+@pytest.fixture(scope="module")
+def video_main():
+    # audio_process にも main.py があるので、video_process のものを別名で読み込む
+    pytest.importorskip("cv2")
+    pytest.importorskip("mediapipe")
+    spec = importlib.util.spec_from_file_location("video_main", os.path.join(video_dir, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class ImagePose:
+    """画像から決まるランドマークを返す偽の Pose (Pose のモデルはダウンロードが要るため)。
+    フレームの違いが結果に出るよう、明るい画素の重心を x、平均輝度を y にする"""
+
+    def process(self, image):
+        gray = image.mean(axis=2)
+        if gray.max() < 1:
+            return types.SimpleNamespace(pose_landmarks=None)
+        cols = gray.mean(axis=0)
+        x = float((cols * np.arange(len(cols))).sum() / cols.sum() / len(cols))
+        y = float(gray.mean() / 255)
+        landmark = types.SimpleNamespace(x=x, y=y, z=0.0, visibility=0.9)
+        return types.SimpleNamespace(pose_landmarks=types.SimpleNamespace(landmark=[landmark] * 33))
+
+
+def counter():
+    values = iter(range(1_000_000))
+    return lambda _: next(values)
+
+
+class TestRunPipeline:
+    def test_keeps_frame_order(self, video_main):
+        results = []
+
+        stats = video_main.run_pipeline(
+            [("decode", counter()), ("square", lambda x: x * x), ("encode", results.append)], 50, queue_size=2
+        )
+
+        assert results == [x * x for x in range(50)]
+        assert [s.frames for s in stats] == [50, 50, 50]
+
+    def test_bounded_queues_limit_frames_in_flight(self, video_main):
+        produced, consumed, in_flight = [0], [0], []
+        lock = threading.Lock()
+
+        def decode(_):
+            with lock:
+                produced[0] += 1
+                in_flight.append(produced[0] - consumed[0])
+            return produced[0]
+
+        def encode(item):
+            time.sleep(0.002)
+            with lock:
+                consumed[0] += 1
+
+        video_main.run_pipeline([("decode", decode), ("pass", lambda x: x), ("encode", encode)], 100, queue_size=2)
+
+        # キュー2本分 + 各ステージが処理中・受け渡し待ちの1フレーム
+        assert max(in_flight) <= 2 * 2 + 3
+
+    def test_stage_error_stops_the_pipeline(self, video_main):
+        decoded = []
+
+        def decode(_):
+            decoded.append(len(decoded))
+            return decoded[-1]
+
+        def broken(x):
+            if x == 5:
+                raise RuntimeError("infer failed")
+            return x
+
+        with pytest.raises(RuntimeError, match="infer failed"):
+            video_main.run_pipeline([("decode", decode), ("infer", broken), ("encode", lambda x: None)], 10_000, queue_size=2)
+
+        assert len(decoded) < 100
+
+    def test_first_stage_can_end_early(self, video_main):
+        frames = iter(range(3))
+        results = []
+
+        stats = video_main.run_pipeline(
+            [("decode", lambda _: next(frames, video_main._STOP)), ("encode", results.append)], 10
+        )
+
+        assert results == [0, 1, 2]
+        assert stats[0].frames == 3
+
+
+class TestPipelinedProcessVideo:
+    def test_matches_the_sequential_path(self, video_main, tmp_path, monkeypatch):
+        import benchmark
+        import landmark_cache
+
+        clip = benchmark.generate_clip(str(tmp_path / "clip.mp4"), 320, 240, 12)
+
+        def trace(mode, pipeline):
+            run_dir = tmp_path / mode
+            run_dir.mkdir()
+            monkeypatch.chdir(run_dir)
+            tracer = video_main.VideoTracer()
+            tracer._pose = ImagePose()
+            video_path = tracer.process_video(clip, pipeline=pipeline)
+            (cached,) = [name for name in os.listdir(tracer.landmarks_dir) if name.endswith(".npy")]
+            landmarks, _ = landmark_cache.load_landmarks(os.path.join(tracer.landmarks_dir, cached))
+            return os.path.join(run_dir, video_path), np.array(landmarks)
+
+        sequential_video, sequential = trace("sequential", pipeline=False)
+        pipelined_video, pipelined = trace("pipelined", pipeline=True)
+
+        assert len(sequential) == 12
+        assert len(np.unique(sequential[:, 0, 0])) > 1
+        np.testing.assert_array_equal(pipelined, sequential)
+        assert video_main.VideoTracer.video_info(None, pipelined_video)[3] == 12
+        assert os.path.getsize(pipelined_video) > 0
+        assert os.path.getsize(sequential_video) > 0
@@ -0,0 +1,103 @@
+"""
+video_process/pose_input.py のテスト
+
+縮小・切り抜きした画像での正規化座標が元フレームの座標に正しく戻ることと、
+切り抜き範囲が人物が端に寄ったとき・見失ったときだけ更新されることを確認する。
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'video_process'))
+
+import pose_input
+
+WIDTH, HEIGHT = 640, 480
+
+
+def person(x0, y0, x1, y1):
+    """元フレームの正規化座標で (x0, y0)-(x1, y1) の箱に収まるランドマーク"""
+    landmarks = np.zeros((33, 4), dtype=np.float32)
+    landmarks[:, 0] = np.linspace(x0, x1, 33)
+    landmarks[:, 1] = np.linspace(y0, y1, 33)
+    landmarks[:, 3] = 0.9
+    return landmarks
+
+
+def frame():
+    return np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+
+
+def locate(image):
+    """画像中の明るい画素の正規化座標 (偽の Pose)"""
+    ys, xs = np.nonzero(image[..., 0])
+    height, width = image.shape[:2]
+    return (xs.mean() + 0.5) / width, (ys.mean() + 0.5) / height
+
+
+class TestInputReducer:
+    def test_without_options_passes_the_frame_through(self):
+        reducer = pose_input.InputReducer()
+        image = frame()
+
+        assert reducer.prepare(image).shape == image.shape
+        landmarks = person(0.2, 0.2, 0.4, 0.8)
+        np.testing.assert_array_equal(reducer.restore(landmarks), landmarks)
+
+    def test_downscales_the_long_side(self):
+        reducer = pose_input.InputReducer(inference_size=320)
+
+        assert reducer.prepare(frame()).shape == (240, 320, 3)
+        assert pose_input.InputReducer(inference_size=1280).prepare(frame()).shape == (HEIGHT, WIDTH, 3)
+
+    def test_crop_coordinates_map_back_to_the_frame(self):
+        reducer = pose_input.InputReducer(inference_size=64, roi=True)
+        reducer.prepare(frame())
+        reducer.update(person(0.4, 0.3, 0.6, 0.7))
+        assert reducer.box is not None
+
+        image = frame()
+        image[300:304, 350:354] = 255
+        x, y = locate(reducer.prepare(image))
+        detected = np.array([[x, y, 0.0, 0.9]] * 33, dtype=np.float32)
+        restored = reducer.restore(detected)
+
+        # 縮小で数画素ずれてもよい
+        assert restored[0, 0] * WIDTH == pytest.approx(352, abs=4)
+        assert restored[0, 1] * HEIGHT == pytest.approx(302, abs=4)
+
+    def test_box_moves_only_when_the_person_reaches_the_edge(self):
+        reducer = pose_input.InputReducer(roi=True)
+        reducer.prepare(frame())
+        reducer.update(person(0.4, 0.3, 0.6, 0.7))
+        box = reducer.box
+
+        reducer.update(person(0.41, 0.3, 0.61, 0.7))
+        assert reducer.box == box
+
+        reducer.update(person(0.6, 0.3, 0.8, 0.7))
+        assert reducer.box != box
+        assert reducer.box[2] > box[2]
+
+    def test_lost_person_resets_to_the_full_frame(self):
+        reducer = pose_input.InputReducer(roi=True)
+        reducer.prepare(frame())
+        reducer.update(person(0.4, 0.3, 0.6, 0.7))
+
+        reducer.update(None)
+
+        assert reducer.box is None
+        assert reducer.prepare(frame()).shape == (HEIGHT, WIDTH, 3)
+
+    def test_tiny_box_is_treated_as_a_false_detection(self):
+        reducer = pose_input.InputReducer(roi=True)
+        reducer.prepare(frame())
+
+        reducer.update(person(0.5, 0.5, 0.51, 0.51))
+
+        assert reducer.box is None
@@ -0,0 +1,120 @@
+"""
+audio_process/rvc_accel.py のテスト
+
+A/B 比較に使う SNR とスペクトル距離が差の大きさに応じて変わることと、変換済みモデルの
+置き場所・モードの検証を確認する。int8 の量子化とその保存・読み込みは torch があるときだけ確認する。
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'audio_process'))
+
+import rvc_accel
+
+SR = 16000
+
+
+def voice(seconds=1.0):
+    t = np.arange(int(seconds * SR)) / SR
+    return (0.5 * np.sin(2 * np.pi * 220 * t) + 0.2 * np.sin(2 * np.pi * 660 * t)).astype(np.float32)
+
+
+class TestMetrics:
+    def test_identical_output(self):
+        x = voice()
+
+        assert rvc_accel.snr_db(x, x.copy()) == float("inf")
+        assert rvc_accel.log_spectral_distance(x, x.copy(), SR) == pytest.approx(0.0)
+
+    def test_more_noise_scores_worse(self):
+        x = voice()
+        noise = np.random.default_rng(0).standard_normal(len(x)).astype(np.float32)
+        slight, heavy = x + 0.001 * noise, x + 0.05 * noise
+
+        assert rvc_accel.snr_db(x, slight) > rvc_accel.snr_db(x, heavy) > 0
+        assert 0 < rvc_accel.log_spectral_distance(x, slight, SR) < rvc_accel.log_spectral_distance(x, heavy, SR)
+
+    def test_lengths_are_trimmed_to_the_shorter(self):
+        x = voice()
+
+        assert rvc_accel.snr_db(x, x[:-100]) == float("inf")
+
+
+class TestAccelerate:
+    def test_artifact_path(self):
+        assert rvc_accel.artifact_path("/models/zundamon.pth", "int8") == "/models/zundamon.int8.pt"
+        assert rvc_accel.artifact_path("/models/zundamon.pth", "int8", "/cache") == "/cache/zundamon.int8.pt"
+
+    @pytest.mark.parametrize("mode", [None, "eager"])
+    def test_eager_returns_the_module_unchanged(self, mode):
+        module = object()
+
+        assert rvc_accel.accelerate(module, "missing.pth", mode) is module
+
+    def test_unknown_mode_is_rejected(self):
+        with pytest.raises(ValueError, match="Unknown RVC acceleration mode"):
+            rvc_accel.accelerate(object(), "missing.pth", "fp16")
+
+
+class TestInt8:
+    @pytest.fixture
+    def torch(self):
+        return pytest.importorskip("torch")
+
+    def model(self, torch):
+        class Attention(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.q_proj = torch.nn.Linear(16, 16)
+                self.k_proj = torch.nn.Linear(16, 16)
+                self.v_proj = torch.nn.Linear(16, 16)
+
+        class Layer(torch.nn.Module):
+            def __init__(self):
+                super().__init__()
+                self.self_attn = Attention()
+                self.fc1 = torch.nn.Linear(16, 64)
+                self.fc2 = torch.nn.Linear(64, 16)
+                self.conv = torch.nn.Conv1d(16, 16, 3)
+
+            def forward(self, x):
+                return self.fc2(torch.relu(self.fc1(x)))
+
+        torch.manual_seed(0)
+        return Layer().eval()
+
+    def test_attention_projections_are_not_quantized(self, torch):
+        module = self.model(torch)
+
+        names = rvc_accel._quantizable_linears(module)
+
+        assert names == {"fc1", "fc2"}
+        assert 0 < rvc_accel.quantized_share(module, names) < 1
+
+    def test_converted_model_is_cached_and_rebuilt_when_stale(self, torch, tmp_path):
+        source = tmp_path / "voice.pth"
+        source.write_bytes(b"weights")
+        x = torch.randn(4, 16)
+        expected = self.model(torch)(x)
+
+        converted = rvc_accel.accelerate(self.model(torch), str(source), "int8")
+        path = rvc_accel.artifact_path(str(source), "int8")
+        assert os.path.exists(path)
+        torch.testing.assert_close(converted(x), expected, atol=0.05, rtol=0.05)
+
+        mtime = os.path.getmtime(path)
+        cached = rvc_accel.accelerate(self.model(torch), str(source), "int8")
+        assert os.path.getmtime(path) == mtime
+        torch.testing.assert_close(cached(x), converted(x))
+
+        # 元のモデルが変わったら作り直す
+        stamp = rvc_accel._source_stamp(str(source))
+        source.write_bytes(b"new weights")
+        assert rvc_accel._load_artifact(path, rvc_accel._source_stamp(str(source))) is None
+        rvc_accel.accelerate(self.model(torch), str(source), "int8")
+        assert rvc_accel._load_artifact(path, rvc_accel._source_stamp(str(source))) is not None
+        assert rvc_accel._load_artifact(path, stamp) is None
@@ -0,0 +1,91 @@
+"""
+audio_process/rvc_chunks.py のテスト
+
+Pipeline と同じくピークが 0.99 を超えると全体を縮める偽のエンジンで、
+チャンク変換の結果が一括変換と同じ音量になり、つなぎ目で段差ができないことを確認する。
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'audio_process'))
+
+import rvc_chunks
+import rvc_engine
+
+SR = rvc_engine.SAMPLE_RATE
+
+
+class FakeEngine:
+    """入力を 2 倍のレートにして 3 倍の音量にする。正規化は Pipeline と同じ手順"""
+
+    tgt_sr = SR * 2
+
+    def convert(self, audio, key="audio", normalize=True):
+        out = np.repeat(audio, 2).astype(np.float32) * 3
+        if not normalize:
+            return out
+        peak = np.abs(out).max() / rvc_engine.PEAK_LIMIT
+        if peak > 1:
+            out = out / peak
+        return out
+
+
+def vocals(seconds=6):
+    """後半だけ大きい声。チャンクごとに正規化すると前半と後半で倍率が変わる"""
+    t = np.arange(seconds * SR) / SR
+    level = np.where(t < seconds / 2, 0.1, 0.5)
+    return (np.sin(2 * np.pi * 220 * t) * level).astype(np.float32)
+
+
+@pytest.fixture
+def fake_engine(monkeypatch):
+    audio = vocals()
+    monkeypatch.setattr(rvc_engine, "load_vocals", lambda path: audio)
+    monkeypatch.setattr(rvc_engine, "get_engine", lambda **options: (FakeEngine(), 0.0))
+    return audio
+
+
+class TestConvertFile:
+    def test_matches_whole_file_conversion(self, fake_engine, tmp_path):
+        output = str(tmp_path / "converted.wav")
+
+        rvc_chunks.convert_file("vocals.wav", output, {}, chunk_sec=1.0, overlap_sec=0.2, search_sec=0.1)
+
+        converted, sr = sf.read(output, dtype="float32")
+        expected = FakeEngine().convert(fake_engine)
+        assert sr == FakeEngine.tgt_sr
+        assert len(converted) == len(expected)
+        np.testing.assert_allclose(converted, expected, atol=2 / 32768)
+
+    def test_no_level_jump_at_seams(self, fake_engine, tmp_path):
+        output = str(tmp_path / "converted.wav")
+
+        rvc_chunks.convert_file("vocals.wav", output, {}, chunk_sec=1.0, overlap_sec=0.2, search_sec=0.1)
+
+        converted, sr = sf.read(output, dtype="float32")
+        # 20ms ごとのピークは、音量の変わる 3 秒の前後で一定
+        frames = converted[:len(converted) // 800 * 800].reshape(-1, 800)
+        peaks = np.abs(frames).max(axis=1)
+        change = int(3 * sr / 800)
+        for part in (peaks[1:change - 1], peaks[change + 1:-1]):
+            assert part.max() - part.min() < 0.01
+
+    def test_leaves_no_temporary_file(self, fake_engine, tmp_path):
+        rvc_chunks.convert_file("vocals.wav", str(tmp_path / "converted.wav"), {}, chunk_sec=1.0, overlap_sec=0.2)
+
+        assert os.listdir(tmp_path) == ["converted.wav"]
+
+
+class TestOverlapAdd:
+    def test_crossfade_of_identical_signals_is_seamless(self):
+        signal = np.sin(np.arange(3000) / 10).astype(np.float32)
+        pieces = [(signal[:1200], 200), (signal[1000:2200], 200), (signal[2000:], 0)]
+
+        joined = np.concatenate(list(rvc_chunks.overlap_add(pieces)))
+
+        np.testing.assert_allclose(joined, signal, atol=1e-6)
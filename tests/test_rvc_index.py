@@ -0,0 +1,124 @@
+"""
+audio_process/rvc_index.py のテスト
+
+小さな IVF の index で、tune が recall の条件を満たす index を隣に保存し、load がそれを
+元の index と同じ特徴 (big_npy) で使うこと、元の index が変わったら使わないこと、
+CachedFaiss が read_index を1回だけ行うことを確認する。
+"""
+import os
+import sys
+import types
+
+import numpy as np
+import pytest
+
+faiss = pytest.importorskip("faiss")
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'audio_process'))
+
+import rvc_index
+
+DIM = 32
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    """rvc_python の学習で作られるものと同じ IVF,Flat の index"""
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal((20, DIM)).astype(np.float32) * 4
+    vectors = centers[rng.integers(0, 20, 3000)] + rng.standard_normal((3000, DIM)).astype(np.float32)
+    index = faiss.index_factory(DIM, "IVF16,Flat")
+    index.train(vectors)
+    index.add(vectors)
+    path = str(tmp_path / "voice.index")
+    faiss.write_index(index, path)
+    return path
+
+
+@pytest.fixture
+def quick(monkeypatch):
+    monkeypatch.setattr(rvc_index, "BENCH_SEC", 4)
+    monkeypatch.setattr(rvc_index, "BENCH_REPEATS", 1)
+
+
+def original_vectors(path):
+    index = faiss.read_index(path)
+    faiss.extract_index_ivf(index).make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def test_tuned_paths():
+    assert rvc_index.tuned_paths("/models/zundamon.index") == ("/models/zundamon.tuned.index", "/models/zundamon.tuned.json")
+
+
+class TestTune:
+    def test_saves_the_fastest_index_above_min_recall(self, index_path, quick):
+        meta = rvc_index.tune(index_path, min_recall=0.9)
+
+        assert rvc_index.tuned_index(index_path) == rvc_index.tuned_paths(index_path)[0]
+        assert meta["after"]["recall"] >= 0.9
+        accepted = [row for row in meta["results"] if row["recall"] >= 0.9]
+        assert meta["after"]["ms_per_audio_sec"] == min(row["ms_per_audio_sec"] for row in accepted)
+        # 最初の行は rvc_python が読み込んだままの元の index
+        assert meta["before"] == meta["results"][0]
+        assert meta["before"]["kind"] == "original"
+
+    def test_changed_source_invalidates_the_tuned_index(self, index_path, quick):
+        rvc_index.tune(index_path)
+
+        with open(index_path, "ab") as f:
+            f.write(b"\0")
+
+        assert rvc_index.tuned_index(index_path) is None
+
+    def test_without_tuning_there_is_no_tuned_index(self, index_path):
+        assert rvc_index.tuned_index(index_path) is None
+
+
+class TestLoad:
+    def test_tuned_index_keeps_the_original_features(self, index_path, quick):
+        meta = rvc_index.tune(index_path)
+
+        loaded = rvc_index.load(index_path)
+
+        assert loaded.ntotal == 3000
+        np.testing.assert_array_equal(loaded.reconstruct_n(0, loaded.ntotal), original_vectors(index_path))
+        if "nprobe" in meta["params"]:
+            assert faiss.extract_index_ivf(loaded.index).nprobe == meta["params"]["nprobe"]
+        _, ix = loaded.search(original_vectors(index_path)[:10], rvc_index.K)
+        assert ix.shape == (10, rvc_index.K)
+
+    def test_untuned_ivf_index_is_reconstructed(self, index_path):
+        loaded = rvc_index.load(index_path)
+
+        np.testing.assert_array_equal(loaded.reconstruct_n(100, 5), original_vectors(index_path)[100:105])
+
+
+class TestCachedFaiss:
+    def test_read_index_once_until_the_file_changes(self, index_path, monkeypatch):
+        reads = []
+        read_index = faiss.read_index
+        monkeypatch.setattr(faiss, "read_index", lambda path, *args: reads.append(path) or read_index(path, *args))
+        cached = rvc_index.CachedFaiss(faiss)
+
+        first = cached.read_index(index_path, 0)
+        assert cached.read_index(index_path, 0) is first
+        assert len(reads) == 1
+
+        faiss.write_index(faiss.read_index(index_path), index_path)
+        os.utime(index_path, ns=(0, 0))
+        assert cached.read_index(index_path, 0) is not first
+        # 他の属性は faiss のもの
+        assert cached.IndexFlatL2 is faiss.IndexFlatL2
+
+    def test_install_replaces_the_pipeline_faiss_once(self, monkeypatch):
+        module = types.SimpleNamespace(faiss=faiss)
+        monkeypatch.setitem(sys.modules, "fake_pipeline", module)
+
+        rvc_index.install("fake_pipeline")
+        installed = module.faiss
+        rvc_index.install("fake_pipeline")
+
+        assert isinstance(installed, rvc_index.CachedFaiss)
+        assert module.faiss is installed
@@ -0,0 +1,112 @@
+"""
+audio_process/rvc_stream.py のテスト
+
+入力をそのまま返す偽のエンジンで、StreamConverter の出力の長さと、
+変換が実時間に追いつかないときに遅れが target_latency_sec で抑えられることを確認する。
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'audio_process'))
+
+import rvc_stream
+
+SR = rvc_stream.SAMPLE_RATE
+OPTIONS = dict(block_sec=0.1, context_sec=0.1, lookahead_sec=0.02, crossfade_sec=0.01)
+
+
+class FakeEngine:
+    tgt_sr = SR
+
+    def __init__(self, process_sec=0.0):
+        self.process_sec = process_sec
+
+    def convert(self, audio, key="audio"):
+        time.sleep(self.process_sec)
+        return audio.copy()
+
+
+class ListSink:
+    def __init__(self):
+        self.blocks = []
+
+    def write(self, block, sr):
+        self.blocks.append(block)
+
+    def close(self):
+        pass
+
+    @property
+    def audio(self):
+        return np.concatenate(self.blocks)
+
+
+def realtime_source(audio):
+    """FRAME_LEN ずつ再生速度で返す (file_source と同じ)"""
+    start = time.perf_counter()
+    for pos in range(0, len(audio), rvc_stream.FRAME_LEN):
+        delay = start + (pos + rvc_stream.FRAME_LEN) / SR - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield audio[pos:pos + rvc_stream.FRAME_LEN]
+
+
+def tone(seconds):
+    return (np.sin(2 * np.pi * 220 * np.arange(int(seconds * SR)) / SR) * 0.5).astype(np.float32)
+
+
+class TestStreamConverter:
+    def test_fast_engine_passes_every_block_within_the_target(self):
+        audio = tone(1.0)
+        sink = ListSink()
+
+        stats = rvc_stream.StreamConverter(FakeEngine(), target_latency_sec=0.3, **OPTIONS).run(realtime_source(audio), sink)
+
+        np.testing.assert_allclose(sink.audio, audio, atol=1e-6)
+        assert stats["blocks"] == 10
+        assert stats["dropped_blocks"] == 0
+        assert stats["latency_ms"]["max"] < 300 + 50
+
+    def test_slow_engine_drops_blocks_to_bound_latency(self):
+        audio = tone(1.5)
+        sink = ListSink()
+        engine = FakeEngine(process_sec=0.25)
+
+        stats = rvc_stream.StreamConverter(engine, target_latency_sec=0.3, **OPTIONS).run(realtime_source(audio), sink)
+
+        assert stats["dropped_blocks"] > 0
+        assert stats["blocks"] + stats["dropped_blocks"] == 15
+        # 遅れは目標 + 1 ブロックの変換時間まで
+        assert stats["latency_ms"]["max"] < 300 + 250 + 50
+        # 落としたブロックは無音で埋め、出力の長さは入力と変わらない
+        assert len(sink.audio) == len(audio)
+        assert any(np.abs(block).max() == 0 for block in sink.blocks)
+
+    def test_without_target_latency_grows(self):
+        audio = tone(1.0)
+
+        stats = rvc_stream.StreamConverter(FakeEngine(process_sec=0.25), target_latency_sec=None, **OPTIONS).run(
+            realtime_source(audio), ListSink()
+        )
+
+        assert stats["dropped_blocks"] == 0
+        assert stats["latency_ms"]["max"] > 1000
+
+    def test_pipe_source_keeps_odd_bytes_for_the_next_read(self):
+        import io
+        pcm = (np.arange(-5, 5, dtype="<i2") * 1000).tobytes()
+
+        class Chunked(io.RawIOBase):
+            def __init__(self, data):
+                self.parts = [data[:3], data[3:]]
+
+            def read(self, n=-1):
+                return self.parts.pop(0) if self.parts else b""
+
+        samples = np.concatenate(list(rvc_stream.pipe_source(Chunked(pcm))))
+
+        np.testing.assert_array_equal(samples, np.arange(-5, 5) * 1000 / 32768)
@@ -0,0 +1,88 @@
+"""
+video_process/skeleton_renderer.py のテスト
+
+numpy でまとめて座標変換し polylines で描く棒人間が、従来の
+mp.solutions.drawing_utils.draw_landmarks と同じ画素になることを確認する。
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+cv2 = pytest.importorskip("cv2")
+mp = pytest.importorskip("mediapipe")
+from mediapipe.framework.formats import landmark_pb2
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'video_process'))
+
+import skeleton_renderer
+
+WIDTH, HEIGHT = 320, 240
+
+
+def random_poses(frames, seed=0):
+    """画面の端をはみ出す点や visibility の低い点も含むポーズ"""
+    rng = np.random.default_rng(seed)
+    landmarks = np.empty((frames, 33, 4), dtype=np.float32)
+    landmarks[..., :2] = rng.uniform(-0.1, 1.1, (frames, 33, 2))
+    landmarks[..., 2] = rng.uniform(-0.5, 0.5, (frames, 33))
+    landmarks[..., 3] = rng.uniform(0, 1, (frames, 33))
+    return landmarks
+
+
+def draw_with_mediapipe(pose, offset_x, style):
+    landmark_list = landmark_pb2.NormalizedLandmarkList()
+    for x, y, z, visibility in pose.tolist():
+        landmark_list.landmark.add(x=x + offset_x, y=y, z=z, visibility=visibility)
+    image = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    mp.solutions.drawing_utils.draw_landmarks(
+        image,
+        landmark_list,
+        mp.solutions.pose.POSE_CONNECTIONS,
+        landmark_drawing_spec=mp.solutions.drawing_utils.DrawingSpec(
+            color=style.joint_color, thickness=style.joint_thickness, circle_radius=style.joint_radius
+        ),
+        connection_drawing_spec=mp.solutions.drawing_utils.DrawingSpec(
+            color=style.bone_color, thickness=style.bone_thickness
+        ),
+    )
+    return image
+
+
+def draw_with_renderer(landmarks, offsets, style):
+    points, visible = skeleton_renderer.project(landmarks, offsets, WIDTH, HEIGHT)
+    images = []
+    for idx in range(len(landmarks)):
+        image = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+        images.append(skeleton_renderer.draw_skeleton(image, points[idx], visible[idx], style))
+    return images
+
+
+def test_connections_match_mediapipe():
+    assert {tuple(c) for c in skeleton_renderer.POSE_CONNECTIONS.tolist()} == set(mp.solutions.pose.POSE_CONNECTIONS)
+
+
+@pytest.mark.parametrize("style", [
+    skeleton_renderer.SkeletonStyle(),
+    skeleton_renderer.SkeletonStyle(joint_color=(0, 0, 255), joint_thickness=2, joint_radius=3,
+                                    bone_color=(255, 0, 0), bone_thickness=4),
+])
+def test_matches_mediapipe_drawing_utils(style):
+    landmarks = random_poses(20)
+    offsets = np.linspace(-0.2, 0.2, len(landmarks))
+
+    images = draw_with_renderer(landmarks, offsets, style)
+
+    for idx, image in enumerate(images):
+        np.testing.assert_array_equal(image, draw_with_mediapipe(landmarks[idx], offsets[idx], style))
+
+
+def test_undetected_points_are_not_drawn():
+    landmarks = random_poses(1)
+    landmarks[0, :] = np.nan
+
+    (image,) = draw_with_renderer(landmarks, np.zeros(1), skeleton_renderer.SkeletonStyle())
+
+    assert not image.any()
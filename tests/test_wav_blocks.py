@@ -0,0 +1,139 @@
+"""
+audio_process/wav_blocks.py のテスト
+
+ブロック単位の正規化・ミックスが、置き換える前の pydub の処理
+(set_sample_width と inst.overlay(vocal - 6)) と同じサンプル値になることと、
+リサンプルをブロックに分けても結果が変わらないことを確認する。
+"""
+import os
+import sys
+import warnings
+
+import numpy as np
+import pytest
+import soundfile as sf
+from scipy.signal import resample_poly
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'audio_process'))
+
+import wav_blocks
+
+with warnings.catch_warnings():
+    # WAV の読み書きだけなら ffmpeg は要らない
+    warnings.simplefilter("ignore", RuntimeWarning)
+    pydub = pytest.importorskip("pydub")
+
+SR = 44100
+
+
+def tone(seconds, freq, level, channels=1, rate=SR):
+    t = np.arange(int(seconds * rate)) / rate
+    x = np.sin(2 * np.pi * freq * t) * level
+    return np.repeat(x[:, None], channels, axis=1)
+
+
+def write(path, samples, rate=SR, subtype="PCM_16"):
+    sf.write(str(path), samples, rate, subtype=subtype)
+    return str(path)
+
+
+def read_int16(path):
+    data, rate = sf.read(path, dtype="int16", always_2d=True)
+    return data, rate
+
+
+def pydub_samples(segment):
+    return np.array(segment.get_array_of_samples(), dtype=np.int16).reshape(-1, segment.channels)
+
+
+class TestNormalize:
+    def test_16bit_at_target_rate_is_copied(self, tmp_path):
+        source = write(tmp_path / "in.wav", tone(1.0, 440, 0.5, channels=2))
+
+        wav_blocks.normalize_wav(source, str(tmp_path / "out.wav"))
+
+        out, rate = read_int16(str(tmp_path / "out.wav"))
+        expected, _ = read_int16(source)
+        assert rate == SR
+        np.testing.assert_array_equal(out, expected)
+
+    def test_24bit_matches_pydub_sample_width(self, tmp_path):
+        source = write(tmp_path / "in.wav", tone(1.0, 440, 0.5, channels=2), subtype="PCM_24")
+
+        wav_blocks.normalize_wav(source, str(tmp_path / "out.wav"))
+
+        out, _ = read_int16(str(tmp_path / "out.wav"))
+        expected = pydub_samples(pydub.AudioSegment.from_wav(source).set_sample_width(2))
+        np.testing.assert_array_equal(out, expected)
+
+    def test_resampled_blocks_match_one_shot_resampling(self, tmp_path):
+        samples = tone(2.0, 440, 0.5, rate=48000) + tone(2.0, 3000, 0.2, rate=48000)
+        source = wav_blocks.WavSource(write(tmp_path / "in.wav", samples, rate=48000))
+        resampled = wav_blocks.Resampled(source, SR)
+        try:
+            whole = resample_poly(source.read(0, source.frames), resampled.up, resampled.down, axis=0,
+                                  window=resampled.window)
+            blocks = np.concatenate([resampled.read(start, min(start + 1000, resampled.frames))
+                                     for start in range(0, resampled.frames, 1000)])
+        finally:
+            source.close()
+
+        assert len(blocks) == len(whole) == resampled.frames
+        np.testing.assert_allclose(blocks, whole, atol=1e-2)
+
+
+class TestMix:
+    def pydub_mix(self, vocals, inst):
+        vocal = pydub.AudioSegment.from_wav(vocals) - 6
+        return pydub_samples(pydub.AudioSegment.from_wav(inst).overlay(vocal))
+
+    def test_matches_pydub_overlay(self, tmp_path):
+        vocals = write(tmp_path / "vocals.wav", tone(1.5, 220, 0.3))
+        inst = write(tmp_path / "inst.wav", tone(2.0, 110, 0.3, channels=2))
+        output = str(tmp_path / "mix.wav")
+
+        wav_blocks.mix_wavs(vocals, inst, output)
+
+        out, rate = read_int16(output)
+        assert rate == SR
+        np.testing.assert_array_equal(out, self.pydub_mix(vocals, inst))
+
+    def test_clipping_is_limited_only_around_the_peak(self, tmp_path):
+        inst_samples = tone(2.0, 110, 0.3, channels=2)
+        # 1.0 秒から 50ms だけ、和がフルスケールを超える
+        loud = slice(SR, SR + int(0.05 * SR))
+        inst_samples[loud] = tone(0.05, 220, 1.0, channels=2)
+        vocals = write(tmp_path / "vocals.wav", tone(2.0, 220, 0.6))
+        inst = write(tmp_path / "inst.wav", inst_samples)
+        output = str(tmp_path / "mix.wav")
+
+        wav_blocks.mix_wavs(vocals, inst, output)
+
+        out, _ = read_int16(output)
+        expected = self.pydub_mix(vocals, inst)
+        margin = 4 * int(SR * wav_blocks.LIMITER_LOOKAHEAD_SEC)
+        outside = np.ones(len(out), dtype=bool)
+        outside[loud.start - margin:loud.stop + margin] = False
+        np.testing.assert_array_equal(out[outside], expected[outside])
+        # pydub は波形の頭を平らに飽和させるが、こちらは波形の形を保ったまま縮める
+        middle = slice(loud.start + margin, loud.stop - margin)
+        clipped = lambda x: int((np.abs(x[middle].astype(np.int32)) >= 32767).sum())
+        assert clipped(expected) > 20 * max(1, clipped(out))
+        shape = tone(0.05, 220, 1.0)[margin:-margin, 0]
+        assert np.corrcoef(out[middle, 0], shape)[0, 1] > 0.999
+
+
+class TestLimiterGain:
+    def test_gain_keeps_every_sample_in_range(self):
+        samples = np.zeros((1000, 2), dtype=np.float32)
+        samples[500] = 60000
+        samples[510] = -40000
+
+        gain = wav_blocks.limiter_gain(samples, lookahead=20)
+
+        assert (np.abs(samples * gain) <= wav_blocks.INT16_MAX).all()
+        assert (gain[:450] == 1).all()
+        assert (gain[560:] == 1).all()
+        # 急に下げず、先読みの間に滑らかに下げる
+        assert np.abs(np.diff(gain[:, 0])).max() < 0.1
@@ -0,0 +1,147 @@
+"""
+audio_process/worker.py のテスト
+
+偽の AudioProcessor で、モデルの読み込みが起動時の1回だけになり、スプールのジョブが
+古い順に done / failed に移って処理時間が記録されること、落ちたワーカーの running の
+ジョブがやり直されること、同じスプールに2つ目のワーカーが立たないことを確認する。
+"""
+import json
+import os
+import sys
+
+import pytest
+
+project_root = os.path.dirname(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(project_root, 'audio_process'))
+
+import worker
+import rvc_engine
+
+
+class FakeProcessor:
+    def __init__(self, output_dir, fail_inputs=()):
+        self.output_dir = str(output_dir)
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.fail_inputs = set(fail_inputs)
+        self.metrics = {"load_sec": {}, "phase_sec": {}}
+        self.preloads = 0
+        self.jobs = []
+
+    def preload(self, rvc_model_infos):
+        self.preloads += 1
+        self.metrics["load_sec"]["rvc"] = 2.0
+
+    def run_full_process(self, input_file, rvc_model_info, final_dest):
+        # ジョブごとに metrics を作り直す (読み込み済みなので load_sec は空)
+        self.metrics = {"load_sec": {}, "phase_sec": {"rvc": 0.5}}
+        self.jobs.append(os.path.basename(input_file))
+        if input_file in self.fail_inputs:
+            raise RuntimeError("separation failed")
+        with open(final_dest, "w") as f:
+            f.write(input_file)
+
+
+@pytest.fixture
+def spool(tmp_path):
+    return str(tmp_path / "spool")
+
+
+def read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+class TestAudioWorker:
+    def test_loads_models_once_and_processes_jobs_in_order(self, spool, tmp_path):
+        processor = FakeProcessor(tmp_path / "output")
+        for name in ("a", "b", "c"):
+            worker.submit_job(spool, str(tmp_path / f"{name}.wav"), job_id=f"job-{name}")
+        audio_worker = worker.AudioWorker(processor, spool)
+        try:
+            audio_worker.start()
+            assert audio_worker.run_once() == 3
+        finally:
+            audio_worker.close()
+
+        assert processor.preloads == 1
+        assert processor.jobs == ["a.wav", "b.wav", "c.wav"]
+        done = read_json(os.path.join(spool, "done", "job-a.json"))
+        assert done["status"] == "done"
+        assert done["load_sec"] == 0
+        assert done["process_sec"] >= 0
+        assert os.path.exists(done["output"])
+        assert os.listdir(os.path.join(spool, "running")) == []
+        assert os.listdir(os.path.join(spool, "incoming")) == []
+
+    def test_failed_job_records_the_error_and_the_next_job_runs(self, spool, tmp_path):
+        bad = str(tmp_path / "a.wav")
+        processor = FakeProcessor(tmp_path / "output", fail_inputs={bad})
+        worker.submit_job(spool, bad, job_id="job-a")
+        worker.submit_job(spool, str(tmp_path / "b.wav"), job_id="job-b")
+        audio_worker = worker.AudioWorker(processor, spool)
+        try:
+            audio_worker.start()
+            audio_worker.run_once()
+        finally:
+            audio_worker.close()
+
+        failed = read_json(os.path.join(spool, "failed", "job-a.json"))
+        assert failed["output"] is None
+        assert "separation failed" in failed["error"]
+        assert read_json(os.path.join(spool, "done", "job-b.json"))["status"] == "done"
+
+    def test_jobs_left_running_are_retried(self, spool, tmp_path):
+        worker.submit_job(spool, str(tmp_path / "a.wav"), job_id="job-a")
+        dirs = worker.spool_dirs(spool)
+        os.replace(os.path.join(dirs["incoming"], "job-a.json"), os.path.join(dirs["running"], "job-a.json"))
+        processor = FakeProcessor(tmp_path / "output")
+        audio_worker = worker.AudioWorker(processor, spool)
+        try:
+            audio_worker.start()
+            audio_worker.run_once()
+        finally:
+            audio_worker.close()
+
+        assert processor.jobs == ["a.wav"]
+
+    def test_second_worker_on_the_same_spool_is_refused(self, spool, tmp_path):
+        first = worker.AudioWorker(FakeProcessor(tmp_path / "output"), spool)
+        second = worker.AudioWorker(FakeProcessor(tmp_path / "output2"), spool)
+        try:
+            first.start()
+            with pytest.raises(RuntimeError, match="Another audio worker"):
+                second.start()
+        finally:
+            first.close()
+            second.close()
+
+    def test_submitted_job_is_only_visible_when_complete(self, spool, tmp_path):
+        job_id = worker.submit_job(spool, str(tmp_path / "a.wav"))
+
+        assert os.listdir(os.path.join(spool, "incoming")) == [f"{job_id}.json"]
+
+
+class TestEngineReuse:
+    def test_get_engine_loads_each_model_once(self, monkeypatch, tmp_path):
+        loads = []
+
+        class FakeEngine:
+            load_sec = 3.0
+
+            def __init__(self, model_pth, index_file, accel):
+                loads.append(model_pth)
+
+            def set_params(self, **params):
+                self.params = params
+
+        monkeypatch.setattr(rvc_engine, "RVCEngine", FakeEngine)
+        monkeypatch.setattr(rvc_engine, "_engines", {})
+        model = str(tmp_path / "voice.pth")
+
+        first, first_load = rvc_engine.get_engine(model, "voice.index", f0_up_key=0)
+        second, second_load = rvc_engine.get_engine(model, "voice.index", f0_up_key=12)
+
+        assert first is second
+        assert (first_load, second_load) == (3.0, 0.0)
+        assert second.params == {"f0_up_key": 12}
+        assert len(loads) == 1
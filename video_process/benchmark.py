@@ -0,0 +1,314 @@
+"""
+棒人間動画パイプラインのベンチマーク
+
+合成した動画クリップ (背景の上を動く棒人間) を解像度・長さ別に作り、
+デコード / 推論 / 描画 / エンコードの各ステージ単体と end-to-end のスループットを測る。
+結果は JSON に書き出し、--baseline で渡した過去の結果と比べて遅くなったステージを報告する。
+
+    python benchmark.py --resolutions 360p,720p --frames 300
+    python benchmark.py --baseline bench_baseline.json --tolerance 0.1
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+import ffmpeg_io
+import memstats
+
+RESOLUTIONS = {
+    "360p": (640, 360),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+}
+STAGES = ["decode", "infer", "render", "encode", "e2e"]
+CLIP_FPS = 30
+
+
+def synthetic_pose(t):
+    """時刻 t (秒) の棒人間の関節位置 (正規化座標)。ジャンプしながら腕を振る"""
+    sway = 0.1 * np.sin(t * 0.8)
+    arm = np.sin(t * 4.0)
+    hop = 0.03 * abs(np.sin(t * 4.0))
+    cx, hip_y = 0.5 + sway, 0.58 - hop
+    return {
+        "head": (cx, hip_y - 0.36),
+        "neck": (cx, hip_y - 0.28),
+        "hip": (cx, hip_y),
+        "hand_l": (cx - 0.12 - 0.06 * arm, hip_y - 0.28 + 0.22 * arm),
+        "hand_r": (cx + 0.12 + 0.06 * arm, hip_y - 0.28 + 0.22 * arm),
+        "foot_l": (cx - 0.08 - 0.04 * arm, hip_y + 0.3 + hop),
+        "foot_r": (cx + 0.08 + 0.04 * arm, hip_y + 0.3 + hop),
+    }
+
+
+def generate_clip(path, width, height, frames, fps=CLIP_FPS):
+    """合成クリップを書き出す。同じ条件のファイルがあれば作り直さない"""
+    if os.path.exists(path):
+        return path
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+    # 圧縮が効きすぎないよう、グラデーションにノイズを乗せた背景にする
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(40, 160, width, dtype=np.float32)[None, :, None]
+    background = np.clip(gradient + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+    limb = max(2, width // 100)
+
+    tmp_path = path + ".tmp.mp4"
+    out = cv2.VideoWriter(tmp_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for idx in range(frames):
+        frame = background.copy()
+        joints = {k: (int(x * width), int(y * height)) for k, (x, y) in synthetic_pose(idx / fps).items()}
+        for a, b in [("neck", "hip"), ("neck", "hand_l"), ("neck", "hand_r"), ("hip", "foot_l"), ("hip", "foot_r")]:
+            cv2.line(frame, joints[a], joints[b], (230, 200, 180), limb)
+        cv2.circle(frame, joints["head"], height // 18, (200, 180, 160), -1)
+        out.write(frame)
+    out.release()
+    os.replace(tmp_path, path)
+    return path
+
+
+def latency_stats(samples_sec, total_sec, frames):
+    samples_ms = np.asarray(samples_sec) * 1000
+    stats = {
+        "frames": frames,
+        "seconds": total_sec,
+        "fps": frames / total_sec if total_sec > 0 else 0.0,
+    }
+    if len(samples_ms):
+        stats.update({
+            "p50_ms": float(np.percentile(samples_ms, 50)),
+            "p95_ms": float(np.percentile(samples_ms, 95)),
+            "p99_ms": float(np.percentile(samples_ms, 99)),
+        })
+    return stats
+
+
+def bench_decode(clip, options):
+    import main
+    reader = main.open_reader(clip, options["reader"])
+    samples = []
+    t_start = time.perf_counter()
+    try:
+        while True:
+            t0 = time.perf_counter()
+            frame = reader.read()
+            if frame is None:
+                break
+            samples.append(time.perf_counter() - t0)
+    finally:
+        reader.release()
+    return latency_stats(samples, time.perf_counter() - t_start, len(samples))
+
+
+def bench_infer(clip, options):
+    import main
+    reader = main.open_reader(clip, options["reader"])
+    samples = []
+    try:
+        with main.mp.solutions.pose.Pose(**main.POSE_OPTIONS) as pose:
+            while True:
+                frame = reader.read()
+                if frame is None:
+                    break
+                t0 = time.perf_counter()
+                pose.process(frame)
+                samples.append(time.perf_counter() - t0)
+    finally:
+        reader.release()
+    return latency_stats(samples, sum(samples), len(samples))
+
+
+def synthetic_landmarks(frames, fps=CLIP_FPS):
+    """描画ベンチ用の (frames, 33, 4) ランドマーク"""
+    rng = np.random.default_rng(0)
+    base = np.concatenate([
+        rng.uniform(0.35, 0.65, (33, 2)),
+        rng.uniform(-0.1, 0.1, (33, 1)),
+        rng.uniform(0.6, 1.0, (33, 1)),
+    ], axis=1).astype(np.float32)
+    t = np.arange(frames, dtype=np.float32)[:, None] / fps
+    landmarks = np.repeat(base[None], frames, axis=0)
+    landmarks[..., 0] += 0.1 * np.sin(t * 0.8)
+    landmarks[..., 1] += 0.05 * np.sin(t * 4.0 + np.arange(33))
+    return landmarks
+
+
+def bench_render(clip, options):
+    import main
+    import skeleton_renderer
+    width, height, frames = options["width"], options["height"], options["frames"]
+    tracer = main.VideoTracer()
+    bg_image = tracer.background_image(width, height)
+    ring = ffmpeg_io.FrameRing(bg_image.shape, 2)
+
+    t_start = time.perf_counter()
+    landmarks = tracer.postprocess_landmarks(synthetic_landmarks(frames), CLIP_FPS)
+    filled, offsets, has_pose = tracer.centering_offsets(landmarks)
+    points, visible = skeleton_renderer.project(filled, offsets, width, height)
+    samples = []
+    for idx in range(frames):
+        t0 = time.perf_counter()
+        frame = tracer.composite_background(bg_image, ring.next())
+        if has_pose[idx]:
+            skeleton_renderer.draw_skeleton(frame, points[idx], visible[idx], tracer.style)
+        samples.append(time.perf_counter() - t0)
+    return latency_stats(samples, time.perf_counter() - t_start, frames)
+
+
+def bench_encode(clip, options):
+    import main
+    width, height, frames = options["width"], options["height"], options["frames"]
+    # 入力クリップの先頭数フレームを使い回してエンコードだけを測る
+    reader = main.open_reader(clip, "cv2")
+    source = []
+    for _ in range(8):
+        frame = reader.read()
+        if frame is None:
+            break
+        source.append(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+    reader.release()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        writer = ffmpeg_io.FFmpegWriter(os.path.join(tmp_dir, "encode.mp4"), width, height, CLIP_FPS)
+        samples = []
+        t_start = time.perf_counter()
+        for idx in range(frames):
+            t0 = time.perf_counter()
+            writer.write(source[idx % len(source)])
+            samples.append(time.perf_counter() - t0)
+        writer.release()
+        total = time.perf_counter() - t_start
+    return latency_stats(samples, total, frames)
+
+
+def bench_e2e(clip, options):
+    import main
+    tracer = main.VideoTracer()
+    tracer.frame_source = options["reader"]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        t0 = time.perf_counter()
+        tracer.process_video(
+            clip, workers=options["workers"], pipeline=options["pipeline"],
+            use_cache=False, output_path=os.path.join(tmp_dir, "e2e.mp4")
+        )
+        total = time.perf_counter() - t0
+    return latency_stats([], total, options["frames"])
+
+
+BENCHES = {
+    "decode": bench_decode,
+    "infer": bench_infer,
+    "render": bench_render,
+    "encode": bench_encode,
+    "e2e": bench_e2e,
+}
+
+
+def _run_in_child(stage, clip, options):
+    result = BENCHES[stage](clip, options)
+    result["peak_rss_mb"] = memstats.peak_rss_bytes() / (1024 * 1024)
+    return result
+
+
+def run_case(stage, clip, options):
+    """ピーク RSS を他のケースと混ぜないよう、1ケースずつ新しいプロセスで測る"""
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx) as executor:
+        return executor.submit(_run_in_child, stage, clip, options).result()
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """baseline より fps が tolerance を超えて落ちたケースを返す"""
+    base = {(r["case"], r["stage"]): r for r in baseline.get("results", [])}
+    regressions = []
+    print(f"\n{'case':<12} {'stage':<8} {'base fps':>9} {'fps':>9} {'change':>8}")
+    for r in results:
+        b = base.get((r["case"], r["stage"]))
+        if not b or not b.get("fps"):
+            continue
+        change = r["fps"] / b["fps"] - 1
+        mark = "  REGRESSION" if change < -tolerance else ""
+        print(f"{r['case']:<12} {r['stage']:<8} {b['fps']:>9.1f} {r['fps']:>9.1f} {change:>+7.1%}{mark}")
+        if change < -tolerance:
+            regressions.append({"case": r["case"], "stage": r["stage"], "change": change})
+    return regressions
+
+
+def _parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Stickman video pipeline benchmark")
+    parser.add_argument("--resolutions", default="360p,720p", help=f"Comma separated: {','.join(RESOLUTIONS)}")
+    parser.add_argument("--frames", default="150", help="Comma separated clip lengths in frames")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma separated: {','.join(STAGES)}")
+    parser.add_argument("--reader", default="cv2", choices=["cv2", "ffmpeg"], help="Frame source for decode/infer/e2e")
+    parser.add_argument("--workers", type=int, default=1, help="TRACE_WORKERS for the e2e stage")
+    parser.add_argument("--pipeline", action="store_true", help="Use pipeline mode for the e2e stage")
+    parser.add_argument("--clips-dir", default=os.path.join("output", "bench_clips"), help="Where synthetic clips are cached")
+    parser.add_argument("--output", default=os.path.join("output", "benchmark.json"), help="Result JSON path")
+    parser.add_argument("--baseline", default=None, help="Previous result JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed fps drop vs baseline (0.1 = 10%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = _parse_args(argv)
+    stages = [s for s in args.stages.split(",") if s]
+    unknown = [s for s in stages if s not in BENCHES]
+    if unknown:
+        print(f"Error: unknown stages: {unknown}")
+        return 2
+
+    results = []
+    for res_name in args.resolutions.split(","):
+        width, height = RESOLUTIONS[res_name]
+        for frames in [int(f) for f in args.frames.split(",")]:
+            case = f"{res_name}_{frames}f"
+            clip = generate_clip(os.path.join(args.clips_dir, f"{case}.mp4"), width, height, frames)
+            options = {
+                "width": width, "height": height, "frames": frames,
+                "reader": args.reader, "workers": args.workers, "pipeline": args.pipeline,
+            }
+            for stage in stages:
+                result = {"case": case, "stage": stage, **run_case(stage, clip, options)}
+                results.append(result)
+                latency = f"p50 {result['p50_ms']:.2f}ms p95 {result['p95_ms']:.2f}ms" if "p50_ms" in result else ""
+                print(f"{case:<12} {stage:<8} {result['fps']:>8.1f} fps  {latency}  peak RSS {result['peak_rss_mb']:.0f} MB")
+
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "host": platform.node(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "python": platform.python_version(),
+            "reader": args.reader,
+            "workers": args.workers,
+            "pipeline": args.pipeline,
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import os
+import subprocess
+
+import numpy as np
+
+
+class FFmpegWriter:
+    """描画済みの BGR フレームを rawvideo として ffmpeg の stdin に流し込む。
+
+    cv2.VideoWriter と同じ write() / release() を持つ。audio_path を渡すと
+    x264 エンコードと音声の mux を1回の ffmpeg で行うので、中間ファイルも
+    再エンコードも発生しない。
+    """
+
+    def __init__(self, output_path, width, height, fps, audio_path=None):
+        self.output_path = output_path
+        self.frame_bytes = width * height * 3
+        cmd = [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "rawvideo",
+            "-pix_fmt", "bgr24",
+            "-s", f"{width}x{height}",
+            "-r", str(fps),
+            "-i", "-",
+        ]
+        if audio_path:
+            cmd += ["-i", audio_path]
+        cmd += ["-c:v", "libx264", "-pix_fmt", "yuv420p"]
+        if audio_path:
+            cmd += [
+                "-c:a", "aac",
+                "-strict", "experimental",
+                "-map", "0:v:0",
+                "-map", "1:a:0",
+                "-shortest",
+            ]
+        cmd.append(output_path)
+        self.cmd = cmd
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, bufsize=self.frame_bytes)
+
+    def write(self, frame):
+        if frame.nbytes != self.frame_bytes:
+            raise ValueError(f"Frame size mismatch: expected {self.frame_bytes} bytes, got {frame.nbytes}")
+        try:
+            # tobytes() でコピーせず、フレームのバッファをそのまま渡す
+            self.proc.stdin.write(memoryview(frame).cast("B"))
+        except BrokenPipeError:
+            self.proc.wait()
+            raise subprocess.CalledProcessError(self.proc.returncode, self.cmd)
+
+    def release(self):
+        if self.proc.stdin and not self.proc.stdin.closed:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        returncode = self.proc.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, self.cmd)
+
+    def abort(self):
+        """途中で失敗したとき用。ffmpeg を止め、書きかけの出力を消す"""
+        if self.proc.poll() is None:
+            self.proc.kill()
+        if self.proc.stdin:
+            try:
+                self.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+        self.proc.wait()
+        if os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+
+class FrameRing:
+    """使い回す画像バッファのリング。
+
+    next() は確保済みのバッファを順番に返すだけなので、定常状態ではフレームごとの
+    メモリ確保が発生しない。同時に使われているフレーム数より多く用意すること。
+    """
+
+    def __init__(self, shape, size, dtype=np.uint8):
+        self.buffers = [np.empty(shape, dtype=dtype) for _ in range(size)]
+        self.pos = 0
+
+    def next(self):
+        buf = self.buffers[self.pos]
+        self.pos = (self.pos + 1) % len(self.buffers)
+        return buf
+
+    @property
+    def nbytes(self):
+        return sum(buf.nbytes for buf in self.buffers)
+
+
+class FFmpegReader:
+    """ffmpeg で RGB24 にデコードしたフレームを、リングバッファに readinto で直接読み込む。
+
+    read() は RGB の ndarray (リングの1要素) を返し、終端では None を返す。
+    返したバッファはリングが一周すると上書きされる。
+    """
+
+    def __init__(self, input_path, width, height, start_time=0.0, ring_size=2):
+        self.ring = FrameRing((height, width, 3), ring_size)
+        self.frame_bytes = width * height * 3
+        cmd = ["ffmpeg", "-loglevel", "error"]
+        if start_time > 0:
+            cmd += ["-ss", f"{start_time:.6f}"]
+        cmd += [
+            "-i", input_path,
+            "-an", "-sn",
+            "-f", "rawvideo",
+            "-pix_fmt", "rgb24",
+            "-fps_mode", "passthrough",
+            "-",
+        ]
+        self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, bufsize=0)
+
+    def read(self):
+        buf = self.ring.next()
+        view = memoryview(buf).cast("B")
+        filled = 0
+        while filled < self.frame_bytes:
+            n = self.proc.stdout.readinto(view[filled:])
+            if not n:
+                return None
+            filled += n
+        return buf
+
+    def release(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.proc.stdout.close()
+        self.proc.wait()
@@ -0,0 +1,64 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# キャッシュ形式を変えたらここを上げて古いキャッシュを無効にする
+CACHE_VERSION = 1
+
+
+def file_sha256(path, block_size=1 << 20):
+    """入力動画の内容ハッシュ (パスや更新日時ではなく中身で判定する)"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_key(input_path, pose_options, digest=None):
+    """入力動画のハッシュ + Pose の設定からキャッシュキーを作る (digest は計算済みの file_sha256)"""
+    h = hashlib.sha256()
+    h.update((digest or file_sha256(input_path)).encode())
+    h.update(json.dumps(pose_options, sort_keys=True).encode())
+    h.update(f"v{CACHE_VERSION}".encode())
+    return h.hexdigest()[:16]
+
+
+def cache_path(cache_dir, key):
+    return os.path.join(cache_dir, f"{key}.npy")
+
+
+def meta_path(landmarks_path):
+    return os.path.splitext(landmarks_path)[0] + ".json"
+
+
+def save_landmarks(landmarks_path, landmarks, meta):
+    """(frames, 33, 4) のランドマークを float16 の .npy に保存する。
+
+    一時ファイルに書いてから置換するので、途中で落ちても壊れたキャッシュは残らない。
+    描画に必要な解像度・fps などは同名の .json に保存する。
+    """
+    os.makedirs(os.path.dirname(landmarks_path) or ".", exist_ok=True)
+    tmp_path = landmarks_path + ".tmp.npy"
+    out = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.float16, shape=landmarks.shape)
+    out[:] = landmarks
+    out.flush()
+    del out
+
+    tmp_meta = meta_path(landmarks_path) + ".tmp"
+    with open(tmp_meta, "w") as f:
+        json.dump(meta, f, indent=2)
+
+    os.replace(tmp_meta, meta_path(landmarks_path))
+    os.replace(tmp_path, landmarks_path)
+
+
+def load_landmarks(landmarks_path):
+    """保存済みランドマークをメモリマップで開き、(landmarks, meta) を返す。無ければ (None, None)"""
+    if not (os.path.exists(landmarks_path) and os.path.exists(meta_path(landmarks_path))):
+        return None, None
+    with open(meta_path(landmarks_path)) as f:
+        meta = json.load(f)
+    return np.load(landmarks_path, mmap_mode="r"), meta
@@ -0,0 +1,163 @@
+import numpy as np
+from scipy.signal import lfilter
+
+
+def _neighbor_indices(known):
+    """各フレームについて、直前・直後の known フレームの番号を返す (無ければ -1 / frames)"""
+    frames = len(known)
+    idx = np.arange(frames)
+    prev = np.maximum.accumulate(np.where(known, idx, -1))
+    nxt = np.minimum.accumulate(np.where(known, idx, frames)[::-1])[::-1]
+    return prev, nxt
+
+
+def interpolate_keyframes(landmarks, inferred):
+    """推論を飛ばしたフレームを、前後のキーフレームから線形補間で埋める。
+
+    landmarks: (frames, 33, 4)。inferred: 推論したフレームの bool マスク。
+    推論したのに検出できなかったフレームは NaN のまま残し、前後どちらかに
+    検出済みのキーフレームが無いフレームも埋めない (従来通り直前のポーズで描画される)。
+    """
+    known = inferred & ~np.isnan(landmarks[:, 0, 0])
+    prev, nxt = _neighbor_indices(known)
+    fill = ~inferred & (prev >= 0) & (nxt < len(landmarks))
+    if not fill.any():
+        return landmarks
+
+    p, n = prev[fill], nxt[fill]
+    w = ((np.flatnonzero(fill) - p) / (n - p)).astype(np.float32)[:, None, None]
+    out = landmarks.copy()
+    out[fill] = (1 - w) * landmarks[p] + w * landmarks[n]
+    return out
+
+
+def landmark_error(landmarks, reference, width, height, visibility=0.5):
+    """reference (全フレーム推論) に対するピクセル誤差の統計を返す。
+
+    両方で検出され、reference 側で見えている点だけを比較する。
+    """
+    scale = np.array([width, height], dtype=np.float32)
+    dist = np.linalg.norm((landmarks[..., :2] - reference[..., :2]) * scale, axis=-1)
+    mask = (reference[..., 3] >= visibility) & ~np.isnan(dist)
+    if not mask.any():
+        return {"mean_px": float("nan"), "p95_px": float("nan"), "max_px": float("nan"), "points": 0}
+    errors = dist[mask]
+    return {
+        "mean_px": float(errors.mean()),
+        "p95_px": float(np.percentile(errors, 95)),
+        "max_px": float(errors.max()),
+        "points": int(mask.sum()),
+    }
+
+
+def fill_gaps(landmarks, visibility=0.5, max_gap=None):
+    """見失ったフレームや visibility の低い点を、関節ごとに前後の信頼できるフレームから線形補間する。
+
+    max_gap フレームより長い欠けと、前後どちらかに信頼できるフレームが無い欠けはそのまま残す。
+    """
+    frames = len(landmarks)
+    with np.errstate(invalid="ignore"):
+        good = ~np.isnan(landmarks[..., 0]) & (landmarks[..., 3] >= visibility) # (frames, 33)
+    idx = np.arange(frames)[:, None]
+    prev = np.maximum.accumulate(np.where(good, idx, -1), axis=0)
+    nxt = np.minimum.accumulate(np.where(good, idx, frames)[::-1], axis=0)[::-1]
+    fill = ~good & (prev >= 0) & (nxt < frames)
+    if max_gap is not None:
+        fill &= (nxt - prev - 1) <= max_gap
+    if not fill.any():
+        return landmarks
+
+    f, j = np.nonzero(fill)
+    p, n = prev[f, j], nxt[f, j]
+    w = ((f - p) / (n - p)).astype(np.float32)[:, None]
+    out = landmarks.copy()
+    out[f, j] = (1 - w) * landmarks[p, j] + w * landmarks[n, j]
+    return out
+
+
+def _hold_fill(values, missing):
+    """missing の位置を時間方向に直前 (先頭側は直後) の値で埋める。フィルタに NaN を通さないため"""
+    frames = len(values)
+    idx = np.arange(frames).reshape((-1,) + (1,) * (missing.ndim - 1))
+    prev = np.maximum.accumulate(np.where(~missing, idx, -1), axis=0)
+    nxt = np.minimum.accumulate(np.where(~missing, idx, frames)[::-1], axis=0)[::-1]
+    src = np.where(prev >= 0, prev, np.minimum(nxt, frames - 1))
+    return np.take_along_axis(values, src, axis=0)
+
+
+def savgol_coeffs(window, polyorder):
+    """Savitzky–Golay の平滑化係数 (窓の中心の値を推定する)"""
+    half = window // 2
+    x = np.arange(-half, half + 1)
+    vander = np.vander(x, polyorder + 1, increasing=True)
+    return np.linalg.pinv(vander)[0]
+
+
+def savgol(values, window=9, polyorder=2):
+    """時間方向 (axis 0) の Savitzky–Golay フィルタ。端は奇関数反転で延長する"""
+    window = min(window, len(values) - (1 - len(values) % 2))
+    if window <= polyorder or window < 3:
+        return values
+    half = window // 2
+    padded = np.pad(values, [(half, half)] + [(0, 0)] * (values.ndim - 1), mode="reflect", reflect_type="odd")
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=0)
+    return (windows @ savgol_coeffs(window, polyorder)).astype(values.dtype)
+
+
+def _ema(values, alpha):
+    """時間方向 (axis 0) の EMA。y[0] = x[0] から始める (zi で lfilter の初期状態を合わせる)"""
+    zi = (1 - alpha) * values[:1]
+    out, _ = lfilter([alpha], [1, alpha - 1], values, axis=0, zi=zi)
+    return out
+
+
+def forward_backward_ema(values, alpha=0.5):
+    """前向き・後ろ向きに EMA をかけて位相遅れを打ち消す"""
+    if len(values) == 0:
+        return values.astype(np.float32)
+    forward = _ema(values.astype(np.float64), alpha)
+    return _ema(forward[::-1], alpha)[::-1].astype(np.float32)
+
+
+def one_euro(values, fps, min_cutoff=1.0, beta=0.5, d_cutoff=1.0):
+    """One-Euro フィルタ (速く動くときほど遅れを減らす)。全関節をまとめて1パスで処理する
+
+    係数が直前の出力から求めた速度で毎フレーム変わる (時変の) フィルタなので、
+    lfilter のような線形フィルタにはまとめられず、フレーム方向はループのまま。
+    """
+
+    def alpha(cutoff):
+        tau = 1.0 / (2 * np.pi * cutoff)
+        return 1.0 / (1.0 + tau * fps)
+
+    out = values.astype(np.float32, copy=True)
+    dx = np.zeros_like(out[0])
+    a_d = alpha(d_cutoff)
+    for idx in range(1, len(out)):
+        dx = a_d * (values[idx] - out[idx - 1]) * fps + (1 - a_d) * dx
+        a = alpha(min_cutoff + beta * np.abs(dx))
+        out[idx] = a * values[idx] + (1 - a) * out[idx - 1]
+    return out
+
+
+def smooth_landmarks(landmarks, method="savgol", fps=30.0, **params):
+    """(frames, 33, 4) の x/y/z を時間方向に位相遅れなしで平滑化する。
+
+    method: "savgol" / "forward_backward" (EMA) / "one_euro" (前向き・後ろ向きの2回)。
+    NaN (補間できなかった欠け) はフィルタ前に一時的に埋め、結果では NaN に戻す。
+    """
+    missing = np.isnan(landmarks[..., :3])
+    coords = _hold_fill(landmarks[..., :3], missing) if missing.any() else landmarks[..., :3]
+
+    if method == "savgol":
+        smoothed = savgol(coords, **params)
+    elif method == "forward_backward":
+        smoothed = forward_backward_ema(coords, **params)
+    elif method == "one_euro":
+        smoothed = one_euro(one_euro(coords, fps, **params)[::-1], fps, **params)[::-1]
+    else:
+        raise ValueError(f"Unknown smoothing method: {method}")
+
+    out = landmarks.copy()
+    out[..., :3] = np.where(missing, np.nan, smoothed)
+    return out
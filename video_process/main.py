@@ -2,22 +2,285 @@ import cv2
 import mediapipe as mp
 import numpy as np
 import os
+import sys
 import subprocess
 import shutil
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 
+# build_cache / stage_graph は audio_process と共通 (リポジトリ直下の pipeline_common)。
+# Docker イメージでは main.py と同じ /app にコピーされるので、この追加は使われない
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "pipeline_common"))
+
+import build_cache
+import ffmpeg_io
+import landmark_cache
+import landmark_filters
+import memstats
+import pose_input
+import skeleton_renderer
+import stage_graph
+
+# Pose の設定 (並列ワーカーでも同じ設定で推論するため共通化)
+POSE_OPTIONS = dict(
+    static_image_mode=False,
+    model_complexity=2,
+    enable_segmentation=True,
+    min_detection_confidence=0.5, # 検出自体は少し緩めて見失いにくくする
+    # ブレは描画前のオフライン平滑化 (landmark_filters) で抑えるので、追跡の閾値は既定値に戻す。
+    # 厳しくすると追跡を捨てて検出からやり直すフレームが増え、その分遅くなる
+    min_tracking_confidence=0.5,
+    smooth_landmarks=True
+)
+NUM_LANDMARKS = 33
+# チャンク境界で追跡を温めるために、開始位置より前から推論しておくフレーム数
+CHUNK_WARMUP_FRAMES = 30
+# パイプラインモードでステージ間に溜めておけるフレーム数の上限
+PIPELINE_QUEUE_SIZE = 8
+# キーフレームモードで動きを測るときの縮小サイズ
+MOTION_THUMB_SIZE = (64, 36)
+_STOP = object()
+
+
+def landmarks_to_array(pose_landmarks):
+    """MediaPipe のランドマークを (33, 4) の x/y/z/visibility 配列に変換する"""
+    return np.array(
+        [[lm.x, lm.y, lm.z, lm.visibility] for lm in pose_landmarks.landmark],
+        dtype=np.float32
+    )
+
+
+class OpenCVReader:
+    """cv2.VideoCapture で読み、RGB に変換して返すフレームソース (フレームごとに新しい配列を確保する)"""
+
+    def __init__(self, input_path, start_frame=0):
+        self.cap = cv2.VideoCapture(input_path)
+        if start_frame > 0:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        # BGR to RGB
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def release(self):
+        self.cap.release()
+
+
+def open_reader(input_path, source="cv2", start_frame=0, ring_size=2):
+    """RGB フレームを返すリーダーを開く。
+
+    source="ffmpeg" は ffmpeg の rgb24 出力を確保済みのリングバッファに読み込むので、
+    定常状態でフレームごとのメモリ確保が起きない (ring_size は同時に使うフレーム数より多くする)。
+    """
+    if source == "cv2":
+        return OpenCVReader(input_path, start_frame)
+    if source == "ffmpeg":
+        cap = cv2.VideoCapture(input_path)
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        cap.release()
+        start_time = start_frame / fps if fps else 0.0
+        return ffmpeg_io.FFmpegReader(input_path, width, height, start_time=start_time, ring_size=ring_size)
+    raise ValueError(f"Unknown frame source: {source}")
+
+
+def motion_thumbnail(image_rgb):
+    """フレーム間の動きを安く測るための縮小グレースケール画像"""
+    small = cv2.resize(image_rgb, MOTION_THUMB_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_RGB2GRAY).astype(np.int16)
+
+
+def detect_landmarks(pose, image_rgb, reducer=None):
+    """1フレームを推論して (33, 4) 配列 (見失ったら None) を返す。
+
+    reducer を渡すと縮小・切り抜きした画像で推論し、結果を元フレームの座標に戻す。
+    """
+    if reducer is None:
+        results = pose.process(image_rgb)
+        return landmarks_to_array(results.pose_landmarks) if results.pose_landmarks else None
+
+    results = pose.process(reducer.prepare(image_rgb))
+    landmarks = reducer.restore(landmarks_to_array(results.pose_landmarks)) if results.pose_landmarks else None
+    reducer.update(landmarks)
+    return landmarks
+
+
+def trace_frames(reader, pose, start, end, first=None, progress=False, memory=None,
+                 keyframe_interval=1, motion_threshold=None, inference_size=None, roi_crop=False):
+    """reader の first フレーム目から end まで推論し、[start, end) の (n, 33, 4) 配列と
+    実際に推論したフレームのマスクを返す。
+
+    first..start の区間はトラッキングを安定させるための助走で、結果は捨てる。
+    検出できなかったフレームは NaN のまま残す。
+
+    keyframe_interval > 1 の場合は N フレームごと (と区間の最初と最後) にだけ推論し、
+    間のフレームは前後のキーフレームから補間する。motion_threshold を指定すると、
+    直前のキーフレームとの画素差 (0-255 の平均絶対差) がそれを超えたフレームでも推論する。
+
+    inference_size / roi_crop は pose_input.InputReducer の設定 (推論入力の縮小・切り抜き)。
+    """
+    first = start if first is None else first
+    landmarks = np.full((end - start, NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+    inferred = np.zeros(end - start, dtype=bool)
+    last_key = None
+    last_thumb = None
+    reducer = pose_input.InputReducer(inference_size, roi_crop) if inference_size or roi_crop else None
+    for idx in tqdm(range(first, end), disable=not progress):
+        image_rgb = reader.read()
+        if image_rgb is None:
+            break
+
+        if keyframe_interval > 1 and start < idx < end - 1 and idx - last_key < keyframe_interval:
+            if motion_threshold is None:
+                continue
+            thumb = motion_thumbnail(image_rgb)
+            if np.abs(thumb - last_thumb).mean() <= motion_threshold:
+                continue
+
+        detected = detect_landmarks(pose, image_rgb, reducer)
+        if idx >= start:
+            inferred[idx - start] = True
+            if detected is not None:
+                landmarks[idx - start] = detected
+        last_key = idx
+        if keyframe_interval > 1 and motion_threshold is not None:
+            last_thumb = motion_thumbnail(image_rgb)
+        if memory:
+            memory.sample(idx - first)
+
+    if keyframe_interval > 1:
+        landmarks = landmark_filters.interpolate_keyframes(landmarks, inferred)
+    return landmarks, inferred
+
+
+def trace_chunk(input_path, start, end, warmup=CHUNK_WARMUP_FRAMES, frame_source="cv2", **trace_options):
+    """ワーカープロセス用: 専用の Pose で [start, end) を推論する"""
+    first = max(0, start - warmup)
+    reader = open_reader(input_path, frame_source, start_frame=first)
+    try:
+        with mp.solutions.pose.Pose(**POSE_OPTIONS) as pose:
+            landmarks, inferred = trace_frames(reader, pose, start, end, first=first, **trace_options)
+    finally:
+        reader.release()
+    return start, landmarks, inferred
+
+
+class StageStats:
+    """パイプライン各ステージの処理フレーム数と稼働時間"""
+
+    def __init__(self, name):
+        self.name = name
+        self.frames = 0
+        self.busy_sec = 0.0
+        self.wall_sec = 0.0
+
+    @property
+    def fps(self):
+        """そのステージ単体で出せるスループット"""
+        return self.frames / self.busy_sec if self.busy_sec > 0 else 0.0
+
+    @property
+    def utilization(self):
+        return self.busy_sec / self.wall_sec if self.wall_sec > 0 else 0.0
+
+
+def run_pipeline(stages, total_frames, queue_size=PIPELINE_QUEUE_SIZE):
+    """stages = [(name, func), ...] を1ステージ1スレッドで直列につないで流す。
+
+    先頭ステージは total_frames 回呼ばれ (引数は None)、_STOP を返すと打ち切る。
+    各ステージの戻り値が次のステージの入力になる。いずれかのステージで例外が
+    出たら全体を止めて再送出する。
+    """
+    stats = [StageStats(name) for name, _ in stages]
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages[1:]]
+    abort = threading.Event()
+    errors = []
+
+    def put(q, item):
+        while not abort.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def get(q):
+        while not abort.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    def worker(i, func):
+        in_q = queues[i - 1] if i > 0 else None
+        out_q = queues[i] if i < len(queues) else None
+        stat = stats[i]
+        started = time.perf_counter()
+        try:
+            while not abort.is_set():
+                if in_q is None:
+                    if stat.frames >= total_frames:
+                        break
+                    item = None
+                else:
+                    item = get(in_q)
+                    if item is _STOP:
+                        break
+                t0 = time.perf_counter()
+                result = func(item)
+                stat.busy_sec += time.perf_counter() - t0
+                if result is _STOP:
+                    break
+                stat.frames += 1
+                if out_q is not None:
+                    put(out_q, result)
+        except Exception as e:
+            errors.append(e)
+            abort.set()
+        finally:
+            if out_q is not None:
+                put(out_q, _STOP)
+            stat.wall_sec = time.perf_counter() - started
+
+    threads = [
+        threading.Thread(target=worker, args=(i, func), name=f"pipeline-{name}", daemon=True)
+        for i, (name, func) in enumerate(stages)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    if errors:
+        raise errors[0]
+    return stats
+
+
+def print_stage_stats(stats):
+    """ステージ別のスループットを表示し、律速ステージを示す"""
+    print(f"{'stage':<8} {'frames':>7} {'busy[s]':>8} {'fps':>8} {'util':>6}")
+    for s in stats:
+        print(f"{s.name:<8} {s.frames:>7} {s.busy_sec:>8.2f} {s.fps:>8.1f} {s.utilization:>6.0%}")
+    active = [s for s in stats if s.frames > 0]
+    if active:
+        bottleneck = min(active, key=lambda s: s.fps)
+        print(f"Bottleneck stage: {bottleneck.name} ({bottleneck.fps:.1f} fps)")
+
+
 class VideoTracer:
     def __init__(self):
         self.mp_pose = mp.solutions.pose
-        self.mp_drawing = mp.solutions.drawing_utils
-        self.pose = self.mp_pose.Pose(
-            static_image_mode=False,
-            model_complexity=2,
-            enable_segmentation=True,
-            min_detection_confidence=0.5, # 検出自体は少し緩めて見失いにくくする
-            min_tracking_confidence=0.8, # 追跡の確からしさは厳しくしてブレを抑える
-            smooth_landmarks=True
-        )
+        self.style = skeleton_renderer.SkeletonStyle() # 棒人間の色・太さ
+        self._pose = None # 推論が必要になるまで Pose は作らない (キャッシュからの再描画では不要)
         self.smooth_offset_x = 0.5
         self.smoothing_factor = 0.1
         self.last_pose_landmarks = None # 見失った時のための直前のポーズ
@@ -32,96 +295,461 @@ class VideoTracer:
                 print("Background image loaded successfully.")
         else:
             print(f"Warning: Background image {self.bg_path} not found.")
+        self.landmarks_dir = os.path.join(self.output_dir, "landmarks")
+        # 入力動画の内容ハッシュ。BuildCache を使うときは、同じハッシュをメモ付きで共有するものに差し替える
+        self.file_hash = landmark_cache.file_sha256
+        self.frame_source = "cv2" # "ffmpeg" にするとリングバッファ経由の rgb24 リーダーを使う
+        self.memory_report = False # True でフレーム処理中のメモリ推移を表示する
+        # キーフレームモード: N フレームごと (または動きが閾値を超えたとき) だけ推論し、間は補間する
+        self.keyframe_interval = 1
+        self.motion_threshold = None
+        # 推論入力の縮小 (長辺 px) と、前フレームの人物周辺への切り抜き。出力解像度は変わらない
+        self.inference_size = None
+        self.roi_crop = False
+        # 描画前にシーケンス全体へかける平滑化 ("savgol" / "forward_backward" / "one_euro" / None)
+        self.smoothing = "savgol"
+        # visibility の低い点・見失ったフレームを補間で埋める最大の長さ (秒)。これより長い欠けは従来通り
+        self.max_gap_sec = 1.0
+
+    @property
+    def pose(self):
+        if self._pose is None:
+            self._pose = self.mp_pose.Pose(**POSE_OPTIONS)
+        return self._pose
+
+    def keyframe_options(self):
+        return {"keyframe_interval": self.keyframe_interval, "motion_threshold": self.motion_threshold}
+
+    def input_options(self):
+        return {"inference_size": self.inference_size, "roi_crop": self.roi_crop}
+
+    def trace_options(self, workers=1):
+        """ランドマークの中身を左右する設定 (キャッシュキーに使う)"""
+        options = dict(POSE_OPTIONS)
+        if self.keyframe_interval > 1:
+            options.update(self.keyframe_options())
+        if self.inference_size or self.roi_crop:
+            options.update(self.input_options())
+        if workers > 1:
+            # チャンクごとに追跡をやり直すので、直列で推論した結果とは一致しない
+            options.update({"workers": workers, "chunk_warmup": CHUNK_WARMUP_FRAMES})
+        return options
+
+    def landmark_key(self, input_path, workers=1):
+        """ランドマークキャッシュのキー"""
+        return landmark_cache.cache_key(input_path, self.trace_options(workers), digest=self.file_hash(input_path))
+
+    def render_options(self):
+        """完成動画の見た目を左右する描画側の設定 (成果物キャッシュのキーに使う)"""
+        return {
+            "style": vars(self.style),
+            "smoothing": self.smoothing,
+            "max_gap_sec": self.max_gap_sec,
+            "smoothing_factor": self.smoothing_factor,
+        }
+
+    def trace_landmarks(self, input_path, total_frames, workers=1):
+        """全フレームのランドマークを (frames, 33, 4) 配列で返す。
+
+        workers > 1 の場合は動画を時間範囲で分割し、チャンクごとに別プロセス・別 Pose で
+        推論してからフレーム順に結合する。
+        """
+        if workers <= 1:
+            reader = open_reader(input_path, self.frame_source)
+            memory = memstats.MemoryReport(f"trace ({self.frame_source})").start() if self.memory_report else None
+            try:
+                landmarks, inferred = trace_frames(
+                    reader, self.pose, 0, total_frames, progress=True, memory=memory,
+                    **self.keyframe_options(), **self.input_options()
+                )
+            finally:
+                reader.release()
+                if memory:
+                    memory.stop()
+                    memory.print_summary()
+            self.report_keyframes(inferred)
+            return landmarks
+
+        landmarks = np.full((total_frames, NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+        inferred = np.zeros(total_frames, dtype=bool)
+        bounds = np.linspace(0, total_frames, workers + 1).astype(int)
+        chunks = [(int(s), int(e)) for s, e in zip(bounds[:-1], bounds[1:]) if e > s]
+        print(f"Tracing {total_frames} frames in {len(chunks)} chunks with {workers} workers...")
+
+        # MediaPipe は内部でスレッドを持つので fork ではなく spawn で起動する
+        ctx = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as executor:
+            futures = [
+                executor.submit(
+                    trace_chunk, input_path, s, e, frame_source=self.frame_source,
+                    **self.keyframe_options(), **self.input_options()
+                )
+                for s, e in chunks
+            ]
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                start, chunk, chunk_inferred = future.result()
+                landmarks[start:start + len(chunk)] = chunk
+                inferred[start:start + len(chunk)] = chunk_inferred
+        self.report_keyframes(inferred)
+        return landmarks
+
+    def report_keyframes(self, inferred):
+        if self.keyframe_interval > 1 and inferred.any():
+            print(
+                f"Keyframe mode: inferred {int(inferred.sum())}/{len(inferred)} frames "
+                f"({len(inferred) / inferred.sum():.2f}x fewer inferences)"
+            )
+
+    def evaluate_keyframes(self, input_path, intervals=(2, 3, 4, 6, 8), motion_threshold=None, max_frames=None):
+        """キーフレームモードの速度と精度を、全フレーム推論を基準に測って表示する。
+
+        N ごとに別の Pose で推論し直すので、評価したい区間を max_frames で絞ると速い。
+        inference_size / roi_crop が設定されていれば比較対象の推論にだけ適用するので、
+        intervals=(1,) で入力縮小だけの効果も測れる。戻り値は N ごとの結果 dict のリスト。
+        """
+        width, height, _, total_frames = self.video_info(input_path)
+        if max_frames:
+            total_frames = min(total_frames, max_frames)
 
-    def process_video(self, input_path):
+        def run(interval, reference=False):
+            reader = open_reader(input_path, self.frame_source)
+            input_options = {} if reference else self.input_options()
+            try:
+                with self.mp_pose.Pose(**POSE_OPTIONS) as pose:
+                    t0 = time.perf_counter()
+                    landmarks, inferred = trace_frames(
+                        reader, pose, 0, total_frames,
+                        keyframe_interval=interval, motion_threshold=motion_threshold if interval > 1 else None,
+                        **input_options
+                    )
+                    elapsed = time.perf_counter() - t0
+            finally:
+                reader.release()
+            return landmarks, inferred, elapsed
+
+        print(f"Evaluating keyframe intervals {list(intervals)} on {total_frames} frames...")
+        reference, _, ref_sec = run(1, reference=True)
+        results = []
+        for interval in intervals:
+            landmarks, inferred, elapsed = run(interval)
+            error = landmark_filters.landmark_error(landmarks, reference, width, height)
+            results.append({
+                "interval": interval,
+                "motion_threshold": motion_threshold,
+                "inferred_frames": int(inferred.sum()),
+                "seconds": elapsed,
+                "speedup": ref_sec / elapsed if elapsed > 0 else float("nan"),
+                **error
+            })
+
+        print(f"reference: {total_frames} frames in {ref_sec:.1f}s")
+        print(f"{'N':>3} {'inferred':>9} {'sec':>7} {'speedup':>8} {'mean px':>8} {'p95 px':>8} {'max px':>8}")
+        for r in results:
+            print(
+                f"{r['interval']:>3} {r['inferred_frames']:>9} {r['seconds']:>7.1f} {r['speedup']:>7.2f}x "
+                f"{r['mean_px']:>8.2f} {r['p95_px']:>8.2f} {r['max_px']:>8.2f}"
+            )
+        return results
+
+    def update_offset(self, landmarks, first_frame):
+        """腰を基準にした水平センタリングのオフセットを EMA で更新して返す"""
+        # ターゲットのオフセット
+        target_offset_x = 0.5 - float(skeleton_renderer.anchor_x(landmarks))
+
+        if first_frame:
+            self.smooth_offset_x = target_offset_x
+        else:
+            self.smooth_offset_x = (self.smooth_offset_x * (1 - self.smoothing_factor)) + (target_offset_x * self.smoothing_factor)
+        return self.smooth_offset_x
+
+    def centering_offsets(self, landmarks):
+        """シーケンス全体の (frames, 33, 4) から、見失ったフレームを直前のポーズで埋めた配列と
+        各フレームのセンタリングオフセット、描画するポーズがあるかどうかを返す"""
+        frames = len(landmarks)
+        # 基準点はまとめて計算し、EMA だけフレーム順に回す。fill_gaps は関節ごとに埋めるので、
+        # 見失ったフレームの一部の関節だけが埋まることがある。基準点が NaN になるフレームは
+        # 見失ったものとして扱い、EMA に NaN を入れない
+        with np.errstate(invalid="ignore"):
+            targets = 0.5 - skeleton_renderer.anchor_x(landmarks)
+        detected = np.isfinite(targets)
+        # もし今のフレームで見失っても、直前のポーズが残っていればそれを使う（ジャンプ対策）
+        last_detected = np.maximum.accumulate(np.where(detected, np.arange(frames), -1))
+        has_pose = last_detected >= 0
+        filled = landmarks[np.maximum(last_detected, 0)]
+        targets = targets[np.maximum(last_detected, 0)]
+        offsets = np.zeros(frames, dtype=np.float32)
+        for idx in np.flatnonzero(has_pose):
+            if idx == 0:
+                self.smooth_offset_x = targets[idx]
+            else:
+                self.smooth_offset_x = (self.smooth_offset_x * (1 - self.smoothing_factor)) + (targets[idx] * self.smoothing_factor)
+            offsets[idx] = self.smooth_offset_x
+        return filled, offsets, has_pose
+
+    def render_skeleton(self, bg_image, landmarks, offset_x, frame=None):
+        # 背景をコピー (frame を渡すとそこに書き込み、新しい配列を確保しない)
+        skeleton_frame = self.composite_background(bg_image, frame)
+        height, width = skeleton_frame.shape[:2]
+
+        # ランドマークを水平方向に移動させて描画
+        points, visible = skeleton_renderer.project(landmarks, offset_x, width, height)
+        return skeleton_renderer.draw_skeleton(skeleton_frame, points, visible, self.style)
+
+    def video_info(self, input_path):
+        """(width, height, fps, total_frames) を返す"""
         cap = cv2.VideoCapture(input_path)
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fps = cap.get(cv2.CAP_PROP_FPS)
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        return width, height, fps, total_frames
+
+    def background_image(self, width, height):
+        # 背景のリサイズ
+        if self.background is not None:
+            return cv2.resize(self.background, (width, height))
+        return np.zeros((height, width, 3), dtype=np.uint8)
+
+    def composite_background(self, bg_image, frame=None):
+        if frame is None:
+            return bg_image.copy()
+        np.copyto(frame, bg_image)
+        return frame
+
+    def render_frame(self, bg_image, idx, landmarks, frame=None):
+        """1フレーム分のランドマークから棒人間フレームを作る (センタリング込み)"""
+        # もし今のフレームで見失っても、直前のポーズが残っていればそれを使う（ジャンプ対策）
+        if landmarks is None or np.isnan(landmarks[0, 0]):
+            landmarks = self.last_pose_landmarks
+
+        if landmarks is None:
+            return self.composite_background(bg_image, frame)
+
+        offset_x = self.update_offset(landmarks, idx == 0)
+        # 次のフレームのために記録
+        self.last_pose_landmarks = landmarks
+        return self.render_skeleton(bg_image, landmarks, offset_x, frame=frame)
+
+    def process_video(self, input_path, workers=1, pipeline=False, use_cache=True, output_path=None, audio_path=None):
+        """棒人間動画を書き出してそのパスを返す。
+
+        output_path を指定すると ffmpeg に直接流し込み、audio_path の音声も同時に mux する
+        (中間の temp_skeleton.mp4 を作らない)。
+        """
+        width, height, fps, total_frames = self.video_info(input_path)
+        if pipeline and self.keyframe_interval <= 1:
+            # パイプラインモードの推論は直列
+            workers = 1
+
+        # 同じ動画・同じ Pose 設定で推論済みなら、保存したランドマークから描画だけ行う
+        landmarks_path = None
+        if use_cache:
+            key = self.landmark_key(input_path, workers)
+            landmarks_path = landmark_cache.cache_path(self.landmarks_dir, key)
+            if os.path.exists(landmarks_path):
+                print(f"Landmark cache hit: {landmarks_path} (skipping pose inference)")
+                return self.render_landmarks(landmarks_path, output_path=output_path, audio_path=audio_path)
+
+        meta = self.landmark_meta(input_path, width, height, fps, workers)
+
+        if pipeline and self.keyframe_interval > 1:
+            # キーフレーム間の補間には後続フレームの結果が要るので、逐次処理のパイプラインでは扱えない
+            print("Keyframe mode needs look-ahead; using the batch path instead of pipeline mode.")
+        elif pipeline:
+            return self.process_video_pipelined(
+                input_path, landmarks_path=landmarks_path, meta=meta,
+                output_path=output_path, audio_path=audio_path
+            )
+
+        print(f"Processing {total_frames} frames with centering and custom background...")
+        landmarks = self.trace_landmarks(input_path, total_frames, workers=workers)
+        if landmarks_path:
+            landmark_cache.save_landmarks(landmarks_path, landmarks, meta)
+            print(f"Landmarks saved to {landmarks_path}")
+
+        return self.render_video(landmarks, width, height, fps, output_path=output_path, audio_path=audio_path)
+
+    def landmark_meta(self, input_path, width, height, fps, workers=1):
+        return {
+            "source": os.path.basename(input_path),
+            "width": width,
+            "height": height,
+            "fps": fps,
+            "pose_options": self.trace_options(workers)
+        }
+
+    def trace_to_cache(self, input_path, workers=1):
+        """推論だけを行ってランドマークキャッシュに保存し、そのパスを返す (保存済みなら推論しない)。
+
+        描画と切り離せるので、音声の完成を待つ間に推論を済ませておける。
+        """
+        width, height, fps, total_frames = self.video_info(input_path)
+        key = self.landmark_key(input_path, workers)
+        landmarks_path = landmark_cache.cache_path(self.landmarks_dir, key)
+        if os.path.exists(landmarks_path):
+            print(f"Landmark cache hit: {landmarks_path} (skipping pose inference)")
+            return landmarks_path
+
+        print(f"Tracing {total_frames} frames...")
+        landmarks = self.trace_landmarks(input_path, total_frames, workers=workers)
+        landmark_cache.save_landmarks(landmarks_path, landmarks, self.landmark_meta(input_path, width, height, fps, workers))
+        print(f"Landmarks saved to {landmarks_path}")
+        return landmarks_path
+
+    def render_landmarks(self, landmarks_path, output_path=None, audio_path=None):
+        """保存済みのランドマークだけから棒人間動画を作る (MediaPipe は使わない)。
+
+        背景や線の太さ・色だけを変えたときの再描画用。
+        """
+        landmarks, meta = landmark_cache.load_landmarks(landmarks_path)
+        if landmarks is None:
+            raise FileNotFoundError(f"Landmark cache not found: {landmarks_path}")
+        print(f"Rendering {len(landmarks)} frames from {landmarks_path}...")
+        return self.render_video(
+            landmarks, meta["width"], meta["height"], meta["fps"],
+            output_path=output_path, audio_path=audio_path
+        )
+
+    def open_writer(self, width, height, fps, output_path=None, audio_path=None):
+        """(writer, 書き出し先パス) を返す。output_path が無ければ従来通り mp4v の中間ファイル"""
+        if output_path:
+            return ffmpeg_io.FFmpegWriter(output_path, width, height, fps, audio_path=audio_path), output_path
 
         # 中間ファイルのパス
         temp_video = os.path.join(self.output_dir, "temp_skeleton.mp4")
-
         # 棒人間描画用のVideoWriter
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        out = cv2.VideoWriter(temp_video, fourcc, fps, (width, height))
+        return cv2.VideoWriter(temp_video, fourcc, fps, (width, height)), temp_video
 
-        # 背景のリサイズ
-        if self.background is not None:
-            bg_image = cv2.resize(self.background, (width, height))
+    def close_writer(self, out, video_path, completed):
+        """完了していれば書き出しを確定し、途中で失敗していれば ffmpeg を止めて書きかけを消す"""
+        if completed:
+            out.release()
+        elif isinstance(out, ffmpeg_io.FFmpegWriter):
+            out.abort()
         else:
-            bg_image = np.zeros((height, width, 3), dtype=np.uint8)
+            out.release()
+            if os.path.exists(video_path):
+                os.remove(video_path)
 
-        print(f"Processing {total_frames} frames with centering and custom background...")
+    def postprocess_landmarks(self, landmarks, fps):
+        """推論後のシーケンス全体に、欠けの補間と位相遅れのない平滑化をかける。
 
-        for _ in tqdm(range(total_frames)):
-            ret, frame = cap.read()
-            if not ret:
-                break
+        キャッシュには生のランドマークを保存し、描画のたびにここを通すので、
+        平滑化の設定を変えても推論はやり直さずに済む。
+        """
+        if not self.smoothing:
+            return landmarks
+        landmarks = landmark_filters.fill_gaps(landmarks, max_gap=int(round(self.max_gap_sec * fps)))
+        return landmark_filters.smooth_landmarks(landmarks, self.smoothing, fps=fps)
 
-            # BGR to RGB
-            image_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            results = self.pose.process(image_rgb)
+    def render_video(self, landmarks, width, height, fps, output_path=None, audio_path=None):
+        """(frames, 33, 4) のランドマーク配列から動画を書き出す"""
+        bg_image = self.background_image(width, height)
+        out, video_path = self.open_writer(width, height, fps, output_path=output_path, audio_path=audio_path)
+        memory = None
+        completed = False
+        try:
+            # センタリングの EMA はチャンク結合後に先頭から順に計算するので、
+            # 並列時もチャンク境界で途切れない
+            landmarks = self.postprocess_landmarks(np.asarray(landmarks, dtype=np.float32), fps)
+            filled, offsets, has_pose = self.centering_offsets(landmarks)
+            points, visible = skeleton_renderer.project(filled, offsets, width, height)
+            if has_pose.any():
+                self.last_pose_landmarks = filled[-1]
 
-            # 背景をコピー
-            skeleton_frame = bg_image.copy()
+            # 書き出しは同期的なので、背景の合成先は2枚のバッファを使い回せば足りる
+            ring = ffmpeg_io.FrameRing(bg_image.shape, 2)
+            memory = memstats.MemoryReport("render").start() if self.memory_report else None
+            for idx in tqdm(range(len(landmarks))):
+                skeleton_frame = self.composite_background(bg_image, ring.next())
+                if has_pose[idx]:
+                    skeleton_renderer.draw_skeleton(skeleton_frame, points[idx], visible[idx], self.style)
+                out.write(skeleton_frame)
+                if memory:
+                    memory.sample(idx)
+            completed = True
+        finally:
+            self.close_writer(out, video_path, completed)
+            if memory:
+                memory.stop()
 
-            current_landmarks = results.pose_landmarks
+        if memory:
+            memory.print_summary()
+        return video_path
 
-            # もし今のフレームで見失っても、直前のポーズが残っていればそれを使う（ジャンプ対策）
-            if not current_landmarks and self.last_pose_landmarks:
-                current_landmarks = self.last_pose_landmarks
-                # 少し透過させるなどして「推測」であることを出しても良いが、
-                # ここでは安定性を優先してそのまま描画に回す
+    def process_video_pipelined(self, input_path, queue_size=PIPELINE_QUEUE_SIZE, landmarks_path=None, meta=None,
+                                output_path=None, audio_path=None):
+        """デコード → 推論 → 描画 → エンコードを別スレッドで流す。
 
-            if current_landmarks:
-                # --- センタリングの計算 (腰を基準にして安定させる) ---
-                # ランドマーク 23: left_hip, 24: right_hip
-                # 腰の中央を水平方向の基準点にする
-                hip_l = current_landmarks.landmark[23]
-                hip_r = current_landmarks.landmark[24]
+        ステージ間は上限付きキューでつなぐので、どこかが詰まってもメモリは
+        queue_size フレーム分 × ステージ数で頭打ちになる。
+        landmarks_path を渡すと推論結果をランドマークキャッシュとして保存する。
+        フレームを逐次描画するので、シーケンス全体にかける平滑化 (smoothing) は効かない。
+        """
+        width, height, fps, total_frames = self.video_info(input_path)
+        bg_image = self.background_image(width, height)
 
-                # 腰が見えていれば腰で、見えていなければ全体の平均で計算
-                if hip_l.visibility > 0.5 and hip_r.visibility > 0.5:
-                    anchor_x = (hip_l.x + hip_r.x) / 2
-                else:
-                    x_coords = [lm.x for lm in current_landmarks.landmark]
-                    anchor_x = sum(x_coords) / len(x_coords)
+        # キューに溜まる分 + 各ステージが処理中・受け渡し待ちの分だけリングを用意する
+        ring_size = queue_size + 3
+        reader = open_reader(input_path, self.frame_source, ring_size=ring_size)
+        out, video_path = self.open_writer(width, height, fps, output_path=output_path, audio_path=audio_path)
+        output_ring = ffmpeg_io.FrameRing(bg_image.shape, ring_size)
+        memory = memstats.MemoryReport(f"pipeline ({self.frame_source})").start() if self.memory_report else None
 
-                # ターゲットのオフセット
-                target_offset_x = 0.5 - anchor_x
+        def decode(_):
+            image_rgb = reader.read()
+            return _STOP if image_rgb is None else image_rgb
 
-                if _ == 0:
-                    self.smooth_offset_x = target_offset_x
-                else:
-                    self.smooth_offset_x = (self.smooth_offset_x * (1 - self.smoothing_factor)) + (target_offset_x * self.smoothing_factor)
-
-                # ランドマークを水平方向に移動させて描画
-                for lm in current_landmarks.landmark:
-                    lm.x += self.smooth_offset_x
-
-                # 棒人間を描画（より太く、見やすく）
-                self.mp_drawing.draw_landmarks(
-                    skeleton_frame,
-                    current_landmarks,
-                    self.mp_pose.POSE_CONNECTIONS,
-                    landmark_drawing_spec=self.mp_drawing.DrawingSpec(
-                        color=(50, 255, 50), thickness=5, circle_radius=5
-                    ),
-                    connection_drawing_spec=self.mp_drawing.DrawingSpec(
-                        color=(255, 255, 255), thickness=10
-                    )
-                )
+        traced = np.full((total_frames, NUM_LANDMARKS, 4), np.nan, dtype=np.float32)
+        infer_index = iter(range(total_frames))
+
+        reducer = pose_input.InputReducer(self.inference_size, self.roi_crop) if self.inference_size or self.roi_crop else None
 
-                # 次のフレームのために記録
-                self.last_pose_landmarks = current_landmarks
+        def infer(image_rgb):
+            idx = next(infer_index)
+            detected = detect_landmarks(self.pose, image_rgb, reducer)
+            if detected is not None:
+                traced[idx] = detected
+                return traced[idx]
+            return None
 
+        self.last_pose_landmarks = None
+        frame_index = iter(range(total_frames))
+
+        def render(landmarks):
+            return self.render_frame(bg_image, next(frame_index), landmarks, frame=output_ring.next())
+
+        encode_index = iter(range(total_frames))
+
+        def encode(skeleton_frame):
             out.write(skeleton_frame)
+            if memory:
+                memory.sample(next(encode_index))
 
-        cap.release()
-        out.release()
-        return temp_video
+        print(f"Processing {total_frames} frames in pipeline mode (queue size {queue_size})...")
+        completed = False
+        try:
+            stats = run_pipeline(
+                [("decode", decode), ("infer", infer), ("render", render), ("encode", encode)],
+                total_frames,
+                queue_size=queue_size
+            )
+            completed = True
+        finally:
+            reader.release()
+            self.close_writer(out, video_path, completed)
+            if memory:
+                memory.stop()
+
+        print_stage_stats(stats)
+        if memory:
+            memory.print_summary()
+        if landmarks_path:
+            landmark_cache.save_landmarks(landmarks_path, traced[:stats[1].frames], meta or {})
+            print(f"Landmarks saved to {landmarks_path}")
+        return video_path
 
     def combine_with_audio(self, video_path, audio_path, final_output):
         print("Combining video with converted audio...")
@@ -139,29 +767,166 @@ class VideoTracer:
         ]
         subprocess.run(cmd, check=True)
 
+def _modified_since(path, newer_than):
+    try:
+        mtime = os.path.getmtime(path)
+    except FileNotFoundError:
+        return False
+    return newer_than is None or mtime >= newer_than
+
+
+def wait_for_file(path, timeout_sec, newer_than=None, poll_sec=1.0):
+    """path ができるまで最大 timeout_sec 待つ。できたら True。
+
+    newer_than (time.time() の値) を指定すると、それ以降に書かれたものができるまで待つ
+    (前回の実行で残ったファイルをすぐに使わないため)。
+    """
+    deadline = time.monotonic() + timeout_sec
+    while not _modified_since(path, newer_than):
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(poll_sec)
+    return True
+
+
 def main():
+    started_at = time.time()
     tracer = VideoTracer()
+    # 保存済みランドマーク (.npy) を指定すると推論せずに描画だけやり直す
+    landmarks_path = os.environ.get("LANDMARKS_PATH")
+    # 推論を並列化するワーカー数 (既定の 1 は従来通りの直列処理)。チャンクごとに追跡をやり直すので
+    # 結果は直列と少し変わり、ランドマーク・成果物のキャッシュも別になる
+    workers = int(os.environ.get("TRACE_WORKERS", "1"))
+    # 1 にするとデコード/推論/描画/エンコードをスレッドで並行させるパイプラインモード
+    pipeline = os.environ.get("TRACE_PIPELINE", "0") == "1"
+    # ffmpeg にするとリングバッファに直接デコードするリーダーを使う
+    tracer.frame_source = os.environ.get("TRACE_READER", "cv2")
+    tracer.memory_report = os.environ.get("TRACE_MEMORY_REPORT", "0") == "1"
+    # N フレームごとにだけ推論し、間は補間する (TRACE_MOTION_THRESHOLD で動きの大きいフレームは追加で推論)
+    tracer.keyframe_interval = int(os.environ.get("TRACE_KEYFRAME_INTERVAL", "1"))
+    if os.environ.get("TRACE_MOTION_THRESHOLD"):
+        tracer.motion_threshold = float(os.environ["TRACE_MOTION_THRESHOLD"])
+    # 推論入力の長辺 (px) と、人物周辺への切り抜き
+    if os.environ.get("TRACE_INFERENCE_SIZE"):
+        tracer.inference_size = int(os.environ["TRACE_INFERENCE_SIZE"])
+    tracer.roi_crop = os.environ.get("TRACE_ROI_CROP", "0") == "1"
+    # 描画前の平滑化 (none で無効)
+    smoothing = os.environ.get("TRACE_SMOOTHING", tracer.smoothing)
+    tracer.smoothing = None if smoothing == "none" else smoothing
 
     input_video = "/app/input/radio_calisthenics_video.mp4"
     converted_audio = "/app/input/radio-calisthenics_converted.wav"
     output_final = "/app/root_out/radio-calisthenics_stickman.mp4"
 
-    if not os.path.exists(input_video):
+    # 0 にすると従来通り mp4v の中間ファイルを作ってから音声と合成する
+    direct = os.environ.get("TRACE_DIRECT", "1") == "1"
+
+    if not landmarks_path and not os.path.exists(input_video):
         print(f"Error: Input video not found at {input_video}")
         return
 
-    # 1. トレース動画の作成（背景あり、センタリング）
-    temp_video = tracer.process_video(input_video)
+    # キーフレーム間隔ごとの速度と誤差だけを測って終了する (値は評価するフレーム数、0 なら全体)
+    if os.environ.get("TRACE_KEYFRAME_EVAL"):
+        tracer.evaluate_keyframes(
+            input_video,
+            motion_threshold=tracer.motion_threshold,
+            max_frames=int(os.environ["TRACE_KEYFRAME_EVAL"]) or None
+        )
+        return
+
+    # 音声の完成を待つ秒数。0 なら従来通り、起動時に無ければ音声なしで書き出す。
+    # 待つ場合も推論は音声と関係ないので先に始め、音声が要るのは最後の描画・mux だけ
+    audio_wait_sec = float(os.environ.get("AUDIO_WAIT_SEC", "0"))
+    # 待つ場合は、この時刻 (既定はこのプロセスの起動時刻) 以降に書かれた音声だけを使う。
+    # 音声の処理を先に始める場合は、その開始時刻 (epoch 秒) を AUDIO_NOT_BEFORE に渡す
+    audio_not_before = float(os.environ.get("AUDIO_NOT_BEFORE", started_at))
+
+    # 入力動画・音声・設定が前回と同じなら完成動画をキャッシュから出す (BUILD_CACHE=0 で無効)。
+    # BUILD_DRY_RUN=1 なら何も実行せず、作り直しになるかどうかだけを表示する
+    cache = None
+    if os.environ.get("BUILD_CACHE", "1") != "0":
+        # BUILD_CACHE_MAX_GB / BUILD_CACHE_MAX_AGE_DAYS を超えた古い成果物は実行のたびに消す
+        cache = build_cache.BuildCache(
+            os.environ.get("BUILD_CACHE_DIR", os.path.join(tracer.output_dir, "cache")),
+            dry_run=os.environ.get("BUILD_DRY_RUN", "0") == "1",
+            **build_cache.limits_from_env()
+        )
+        # 入力動画のハッシュはランドマークのキャッシュキーと成果物のキーで共有し、1回だけ計算する
+        tracer.file_hash = cache.file_hash
+    dry_run = cache is not None and cache.dry_run
 
-    # 2. 音声合成 (一旦一時ファイルに書き出してから移動することで、上書き中の真っ黒画面を防ぐ)
+    # 一旦一時ファイルに書き出してから移動することで、上書き中の真っ黒画面を防ぐ
     output_temp = output_final + ".tmp.mp4"
+
+    def trace():
+        if landmarks_path:
+            return landmarks_path
+        if pipeline:
+            # パイプラインモードは推論と描画を同時に流すので、描画ステージでまとめて行う
+            return None
+        if dry_run:
+            key = tracer.landmark_key(input_video, workers)
+            hit = os.path.exists(landmark_cache.cache_path(tracer.landmarks_dir, key))
+            print(f"Landmarks: {'cached' if hit else 'pose inference needed'}")
+            return None
+        return tracer.trace_to_cache(input_video, workers=workers)
+
+    def audio():
+        newer_than = audio_not_before if audio_wait_sec > 0 else None
+        if not dry_run and not wait_for_file(converted_audio, audio_wait_sec, newer_than=newer_than):
+            if os.path.exists(converted_audio):
+                print(f"Warning: {converted_audio} was not updated by this run. Outputting video only.")
+            else:
+                print(f"Warning: Audio file not found. Outputting video only.")
+            return None
+        return converted_audio if os.path.exists(converted_audio) else None
+
+    def stickman(traced_path, audio_path):
+        def build():
+            # 1. トレース動画の作成（背景あり、センタリング）
+            # direct モードでは描画したフレームをそのまま ffmpeg に流し、音声合成まで1パスで行う
+            render_kwargs = {"output_path": output_temp, "audio_path": audio_path} if direct else {}
+            if traced_path:
+                video_path = tracer.render_landmarks(traced_path, **render_kwargs)
+            else:
+                video_path = tracer.process_video(input_video, workers=workers, pipeline=pipeline, **render_kwargs)
+
+            # 2. 音声合成
+            if not direct:
+                if audio_path:
+                    tracer.combine_with_audio(video_path, audio_path, output_temp)
+                    print("Combining with audio successful.")
+                else:
+                    shutil.copy(video_path, output_temp)
+            return {"video": output_temp}
+
+        if cache is None:
+            return build()
+        # ランドマークの中身は入力動画と trace_options で決まる (landmark_cache のキーと同じ)
+        inputs = [path for path in (landmarks_path or input_video, audio_path, tracer.bg_path) if path]
+        params = dict(tracer.render_options(), direct=direct, pipeline=pipeline)
+        if not landmarks_path:
+            params["trace"] = tracer.trace_options(1 if pipeline and tracer.keyframe_interval <= 1 else workers)
+        result = cache.run("stickman", inputs, params, build)
+        if result.status == "hit":
+            print(f"Build cache hit: {result.paths['video']} (skipping render)")
+            shutil.copyfile(result.paths["video"], output_temp)
+        return result
+
+    graph = stage_graph.StageGraph()
+    graph.add("trace", trace)
+    graph.add("audio", audio)
+    graph.add("stickman", stickman, deps=["trace", "audio"])
     try:
-        if os.path.exists(converted_audio):
-            tracer.combine_with_audio(temp_video, converted_audio, output_temp)
-            print("Combining with audio successful.")
-        else:
-            print(f"Warning: Audio file not found. Outputting video only.")
-            shutil.copy(temp_video, output_temp)
+        try:
+            graph.run()
+        finally:
+            graph.report()
+            if cache is not None:
+                cache.report()
+                cache.prune()
+        if dry_run:
+            return
 
         # アトミックに置換
         if os.path.exists(output_temp):
@@ -0,0 +1,75 @@
+import os
+import resource
+import tracemalloc
+
+
+def rss_bytes():
+    """現在の常駐メモリ (RSS)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+
+def peak_rss_bytes():
+    """プロセス開始からの最大 RSS (Linux の ru_maxrss は KB 単位)"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class MemoryReport:
+    """フレーム処理中のメモリ使用量を一定間隔で記録し、定常状態で増え続けていないかを報告する。
+
+    Python/NumPy の確保量は tracemalloc で、プロセス全体は RSS で見る。
+    最初の warmup フレームはバッファ確保やモデル読み込みを含むので比較から外す。
+    """
+
+    def __init__(self, name, every=100, warmup=30):
+        self.name = name
+        self.every = every
+        self.warmup = warmup
+        self.samples = [] # (frame, traced_bytes, rss_bytes)
+        self._started_tracing = False
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return self
+
+    def sample(self, frame):
+        if frame >= self.warmup and (frame - self.warmup) % self.every == 0:
+            traced, _ = tracemalloc.get_traced_memory()
+            self.samples.append((frame, traced, rss_bytes()))
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def summary(self):
+        if len(self.samples) < 2:
+            return None
+        (f0, traced0, rss0), (f1, traced1, rss1) = self.samples[0], self.samples[-1]
+        per_1k = 1000 / max(f1 - f0, 1)
+        return {
+            "frames": f1 - f0,
+            "traced_growth_bytes": traced1 - traced0,
+            "traced_growth_per_1k_frames": (traced1 - traced0) * per_1k,
+            "rss_growth_bytes": rss1 - rss0,
+            "peak_rss_bytes": peak_rss_bytes(),
+        }
+
+    def print_summary(self):
+        summary = self.summary()
+        if summary is None:
+            print(f"[memory] {self.name}: not enough samples")
+            return
+        mb = 1024 * 1024
+        print(
+            f"[memory] {self.name}: over {summary['frames']} frames "
+            f"traced {summary['traced_growth_bytes'] / mb:+.2f} MB "
+            f"({summary['traced_growth_per_1k_frames'] / mb:+.2f} MB/1k frames), "
+            f"RSS {summary['rss_growth_bytes'] / mb:+.2f} MB, "
+            f"peak RSS {summary['peak_rss_bytes'] / mb:.1f} MB"
+        )
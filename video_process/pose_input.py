@@ -0,0 +1,75 @@
+import cv2
+import numpy as np
+
+
+class InputReducer:
+    """Pose に渡す画像を小さくして推論コストを下げ、結果を元フレームの座標に戻す。
+
+    inference_size: 推論に使う画像の長辺 (px)。None なら縮小しない。
+    roi: True なら前フレームのランドマークを囲む箱 (padding 分広げる) で切り抜いてから推論する。
+    切り抜き範囲は人物が箱の端に寄ったとき・見失ったときだけ更新する。毎フレーム動かすと
+    MediaPipe 内部のトラッキング領域がずれて検出からやり直しになるため。
+    """
+
+    def __init__(self, inference_size=None, roi=False, roi_padding=0.25):
+        self.inference_size = inference_size
+        self.roi = roi
+        self.roi_padding = roi_padding
+        self.frame_size = None # (width, height)
+        self.box = None # (x0, y0, x1, y1) px。None なら全体
+
+    def prepare(self, image_rgb):
+        height, width = image_rgb.shape[:2]
+        self.frame_size = (width, height)
+        x0, y0, x1, y1 = self.box or (0, 0, width, height)
+        image = image_rgb[y0:y1, x0:x1]
+
+        if self.inference_size:
+            scale = self.inference_size / max(x1 - x0, y1 - y0)
+            if scale < 1:
+                size = (max(1, round((x1 - x0) * scale)), max(1, round((y1 - y0) * scale)))
+                image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        return np.ascontiguousarray(image)
+
+    def restore(self, landmarks):
+        """切り抜き画像の正規化座標 (33, 4) を元フレームの正規化座標に戻す (縮小は正規化座標に影響しない)"""
+        if self.box is None:
+            return landmarks
+        width, height = self.frame_size
+        x0, y0, x1, y1 = self.box
+        restored = landmarks.copy()
+        restored[:, 0] = (landmarks[:, 0] * (x1 - x0) + x0) / width
+        restored[:, 1] = (landmarks[:, 1] * (y1 - y0) + y0) / height
+        restored[:, 2] = landmarks[:, 2] * (x1 - x0) / width
+        return restored
+
+    def update(self, landmarks):
+        """元フレーム座標のランドマーク (見失ったら None) から次フレームの切り抜き範囲を決める"""
+        if not self.roi:
+            return
+        if landmarks is None:
+            self.box = None
+            return
+
+        width, height = self.frame_size
+        visible = landmarks[:, 3] > 0.5
+        points = landmarks[visible] if visible.sum() >= 4 else landmarks
+        bx0, by0 = points[:, 0].min() * width, points[:, 1].min() * height
+        bx1, by1 = points[:, 0].max() * width, points[:, 1].max() * height
+
+        if self.box is not None:
+            # まだ余裕を持って箱の内側にいるなら動かさない
+            x0, y0, x1, y1 = self.box
+            margin = self.roi_padding / 2 * max(bx1 - bx0, by1 - by0)
+            if bx0 - margin >= x0 and by0 - margin >= y0 and bx1 + margin <= x1 and by1 + margin <= y1:
+                return
+
+        pad = self.roi_padding * max(bx1 - bx0, by1 - by0)
+        box = (
+            int(max(0, np.floor(bx0 - pad))),
+            int(max(0, np.floor(by0 - pad))),
+            int(min(width, np.ceil(bx1 + pad))),
+            int(min(height, np.ceil(by1 + pad))),
+        )
+        # 小さすぎる箱は誤検出の可能性が高いので全体に戻す
+        self.box = box if box[2] - box[0] >= 32 and box[3] - box[1] >= 32 else None
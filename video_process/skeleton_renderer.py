@@ -0,0 +1,73 @@
+import cv2
+import numpy as np
+
+# mp.solutions.pose.POSE_CONNECTIONS と同じ接続 (描画だけなら MediaPipe を読み込まずに済む)
+POSE_CONNECTIONS = np.array([
+    (0, 1), (0, 4), (1, 2), (2, 3), (3, 7), (4, 5), (5, 6), (6, 8), (9, 10),
+    (11, 12), (11, 13), (11, 23), (12, 14), (12, 24), (13, 15), (14, 16),
+    (15, 17), (15, 19), (15, 21), (16, 18), (16, 20), (16, 22), (17, 19),
+    (18, 20), (23, 24), (23, 25), (24, 26), (25, 27), (26, 28), (27, 29),
+    (27, 31), (28, 30), (28, 32), (29, 31), (30, 32)
+], dtype=np.int32)
+
+# mp_drawing.draw_landmarks と同じ閾値・縁取り色
+VISIBILITY_THRESHOLD = 0.5
+BORDER_COLOR = (224, 224, 224)
+
+
+class SkeletonStyle:
+    """棒人間の見た目 (色は BGR)"""
+
+    def __init__(self, joint_color=(50, 255, 50), joint_thickness=5, joint_radius=5,
+                 bone_color=(255, 255, 255), bone_thickness=10):
+        self.joint_color = joint_color
+        self.joint_thickness = joint_thickness
+        self.joint_radius = joint_radius
+        self.bone_color = bone_color
+        self.bone_thickness = bone_thickness
+
+
+def anchor_x(landmarks):
+    """センタリングの基準 x 座標 (..., 33, 4) → (...)
+
+    腰 (23: left_hip, 24: right_hip) が見えていれば腰の中央、見えていなければ全体の平均。
+    """
+    hip_l = landmarks[..., 23, :]
+    hip_r = landmarks[..., 24, :]
+    hips_visible = (hip_l[..., 3] > 0.5) & (hip_r[..., 3] > 0.5)
+    return np.where(hips_visible, (hip_l[..., 0] + hip_r[..., 0]) / 2, landmarks[..., 0].mean(axis=-1))
+
+
+def project(landmarks, offsets_x, width, height):
+    """正規化座標 (frames, 33, 4) にセンタリングのオフセットを一括で足し、ピクセル座標に変換する。
+
+    戻り値は (frames, 33, 2) の int32 座標と、描画対象かどうかの (frames, 33) マスク。
+    画面外・visibility の低い点・NaN (未検出) は描画しない。
+    """
+    # draw_landmarks と同じく、float32 に丸めた座標を倍精度でピクセルに変換する
+    x = (landmarks[..., 0] + np.asarray(offsets_x, dtype=np.float64)[..., None]).astype(np.float32).astype(np.float64)
+    y = landmarks[..., 1].astype(np.float64)
+    with np.errstate(invalid="ignore"):
+        visible = (
+            (landmarks[..., 3] >= VISIBILITY_THRESHOLD)
+            & (x >= 0) & (x <= 1) & (y >= 0) & (y <= 1)
+        )
+    points = np.empty(landmarks.shape[:-1] + (2,), dtype=np.int32)
+    points[..., 0] = np.minimum(np.floor(np.nan_to_num(x) * width), width - 1)
+    points[..., 1] = np.minimum(np.floor(np.nan_to_num(y) * height), height - 1)
+    return points, visible
+
+
+def draw_skeleton(image, points, visible, style):
+    """1フレーム分の (33, 2) 座標を image に描く。骨はまとめて1回の polylines で描画する"""
+    drawable = visible[POSE_CONNECTIONS[:, 0]] & visible[POSE_CONNECTIONS[:, 1]]
+    if drawable.any():
+        segments = np.ascontiguousarray(points[POSE_CONNECTIONS[drawable]])
+        cv2.polylines(image, list(segments), False, style.bone_color, style.bone_thickness)
+
+    # 関節は骨の上に描く (白い縁取り → 塗り)
+    border_radius = max(style.joint_radius + 1, int(style.joint_radius * 1.2))
+    for x, y in points[visible].tolist():
+        cv2.circle(image, (x, y), border_radius, BORDER_COLOR, style.joint_thickness)
+        cv2.circle(image, (x, y), style.joint_radius, style.joint_color, style.joint_thickness)
+    return image